@@ -1,9 +1,20 @@
 # services/report_generator_service.py
 
+from typing import List
+from pydantic import BaseModel, Field
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
-import json # JSON 파싱을 위해 추가
+
+# 감정 정보를 담는 모델
+class Emotion(BaseModel):
+    emotion: str = Field(description="감정의 명칭 (한국어)")
+    score: float = Field(description="감정의 강도 (0.0에서 1.0 사이)")
+
+# 리포트 전체 구조를 담는 모델 (LLM 출력이 이 스키마로 제한됨)
+class Report(BaseModel):
+    emotions: List[Emotion] = Field(description="주요 감정 목록")
+    keywords: List[str] = Field(description="꿈의 핵심 키워드 목록 (한국어)")
+    analysis_summary: str = Field(description="꿈의 감정적 분위기와 주제에 대한 2-3 문장 요약 (한국어)")
 
 class ReportGeneratorService:
     """
@@ -16,6 +27,8 @@ class ReportGeneratorService:
         :param api_key: OpenAI API 키
         """
         self.llm = ChatOpenAI(model="gpt-4o", api_key=api_key, temperature=0.3)
+        # Report 모델의 JSON 스키마로 출력을 제한 (코드 블록 제거나 JSON 파싱이 필요 없음)
+        self.structured_llm = self.llm.with_structured_output(Report, method="json_schema", strict=True)
 
     def generate_report(self, dream_text: str) -> dict:
         """
@@ -23,54 +36,24 @@ class ReportGeneratorService:
         :param dream_text: 분석할 꿈의 텍스트
         :return: 감정, 키워드, 분석 요약을 포함하는 딕셔너리
         """
-        # 시스템 프롬프트: LLM에게 리포트 생성 지시 및 JSON 형식 예시 제공
-        # 중요: 예시 JSON 내의 모든 중괄호는 {{ }}로 이스케이프해야 합니다!
-        # ===> 여기에 'Output in Korean.' 지시와 한국어 예시를 추가합니다. <===
+        # 시스템 프롬프트: LLM에게 리포트 생성 지시 (출력 형식은 스키마로 강제되므로 JSON 예시 불필요)
         system_prompt = """
         You are an AI dream analyst. Analyze the user's dream text to identify core emotions and key elements.
         Provide:
         1. A list of dominant emotions with a score (0-1, 0 being low, 1 being high). Output emotion names in Korean.
         2. A list of key keywords (nouns, verbs, adjectives relevant to the dream's core). Output keywords in Korean.
         3. A brief (2-3 sentences) overall analysis summary of the dream's emotional tone and potential themes. Output analysis summary in Korean.
-        Respond strictly in JSON format. Do not include any other text or markdown outside the JSON block.
-        
-        Example JSON (Output in Korean):
-        {{
-          "emotions": [
-            {{"emotion": "두려움", "score": 0.8}},
-            {{"emotion": "불안", "score": 0.6}},
-            {{"emotion": "무기력", "score": 0.9}}
-          ],
-          "keywords": ["어두운 숲", "추격", "길 잃음", "압도감"],
-          "analysis_summary": "꿈은 압도적인 환경 속에서 추격당하고 길을 잃는 것과 같은 강한 두려움과 불안감을 나타냅니다. 이는 무기력함과 좌절감을 반영하며, 현실에서의 어려움을 상징할 수 있습니다."
-        }}
         """
         # 사용자 프롬프트 템플릿
         user_prompt_template = PromptTemplate.from_template(
             "User's dream description (Korean): {dream_text}"
         )
         # 시스템 프롬프트와 사용자 프롬프트를 결합하여 최종 PromptTemplate 생성
-        chain = PromptTemplate.from_template(system_prompt + "\n" + user_prompt_template.template) | self.llm | StrOutputParser()
+        chain = PromptTemplate.from_template(system_prompt + "\n" + user_prompt_template.template) | self.structured_llm
 
         try:
-            raw_response = chain.invoke({"dream_text": dream_text}) # dream_text 변수 전달
-            
-            # LLM 응답에서 JSON 부분만 안전하게 추출
-            if raw_response.strip().startswith("```json") and raw_response.strip().endswith("```"):
-                json_str = raw_response.strip()[7:-3].strip()
-            else:
-                json_str = raw_response.strip()
-
-            # JSON 문자열을 파이썬 딕셔너리로 로드
-            report = json.loads(json_str)
-            return report
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON from LLM response: {e}\nRaw response: {raw_response}")
-            return {
-                "emotions": [{"emotion": "파싱_오류", "score": 1.0}], # 오류 시에도 한글로
-                "keywords": ["JSON_오류"], # 오류 시에도 한글로
-                "analysis_summary": f"리포트 JSON 형식 오류: {e}. 원본 응답: {raw_response[:min(len(raw_response), 200)]}..."
-            }
+            report = chain.invoke({"dream_text": dream_text}) # dream_text 변수 전달, Report 객체 반환
+            return report.model_dump()
         except Exception as e:
             print(f"Error generating report: {e}")
             return {
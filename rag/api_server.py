@@ -0,0 +1,221 @@
+"""
+꿈 분석 파이프라인(전사, 안전성 검사, 리포트, 이미지 프롬프트, 재구성, 이미지 생성)을 JSON API로 제공하는 ASGI 서버입니다.
+Streamlit 앱(PIPELINE_API_URL 설정 시)과 모바일 클라이언트가 같은 백엔드를 사용하므로,
+UI와 연산 계층을 따로 확장할 수 있습니다.
+
+실행 (rag 폴더에서):
+    python api_server.py                                 # API_HOST:API_PORT, API_WORKERS개 워커
+    uvicorn api_server:app --workers 4 --port 8000
+
+인증: 모든 /v1/* 요청에 "Authorization: Bearer <토큰>" 헤더가 필요합니다. (토큰은 API_AUTH_TOKENS에 설정)
+
+요청 헤더 (선택 사항):
+    X-Session-Id: 사용량/trace에 붙일 세션 ID
+    X-Request-Id: 로그와 trace에 붙일 요청 ID
+    X-Request-Budget: 이 요청에 허용하는 시간(초), DREAM_REQUEST_BUDGET_SECONDS를 넘을 수 없음
+    X-Request-Priority: interactive(기본값) / batch / speculative, OpenAI 호출 스케줄링 우선순위
+"""
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+
+from core.rate_limiter import Priority, RateLimitWait, request_priority
+from core import config
+from core.deadline import DeadlineExceeded, PipelineCancelled, RequestContext, activate as activate_request
+from core.resilience import CircuitOpenError
+from core.tracing import start_metrics_server, tracer
+from core.structured_logging import get_logger
+from services.pipeline_services import build_services
+
+logger = get_logger("api_server")
+
+
+class TextRequest(BaseModel):
+    text: str
+
+
+class DreamRequest(BaseModel):
+    dream_text: str
+
+
+class DreamReportRequest(BaseModel):
+    dream_text: str
+    report: Dict[str, Any]
+
+
+class PromptRequest(BaseModel):
+    prompt: str
+
+
+class PromptResponse(BaseModel):
+    prompt: str
+
+
+class ReconstructionResponse(BaseModel):
+    prompt: str
+    transformation_summary: str
+    keyword_mappings: List[Dict[str, str]]
+
+
+class ImageResponse(BaseModel):
+    url: str
+
+
+class TranscriptResponse(BaseModel):
+    text: str
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not config.API_KEY:
+        raise RuntimeError("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다.")
+    if not config.API_AUTH_TOKENS:
+        # 인증 없이 OpenAI 비용이 드는 엔드포인트를 열어 두지 않도록 토큰이 없으면 시작하지 않음
+        raise RuntimeError("API_AUTH_TOKENS 환경 변수가 설정되지 않았습니다.")
+    # 서비스 호출은 동기 코드이므로 워커마다 정해진 수의 스레드에서 실행
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=config.API_THREADS, thread_name_prefix="api"))
+    app.state.services = build_services(config.API_KEY) # 워커 프로세스마다 한 번 생성
+    start_metrics_server() # 여러 워커 중 먼저 포트를 잡은 워커만 지표 서버를 시작
+    logger.info("파이프라인 API 워커 준비 완료", extra={"threads": config.API_THREADS})
+    yield
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def require_api_token(credentials: HTTPAuthorizationCredentials = Depends(_bearer)) -> None:
+    """Authorization: Bearer 토큰이 API_AUTH_TOKENS 중 하나와 일치하지 않으면 401로 거부합니다."""
+    token = credentials.credentials if credentials is not None else ""
+    # 토큰마다 비교 시간이 같도록 모든 토큰과 비교
+    matched = False
+    for expected in config.API_AUTH_TOKENS:
+        matched |= secrets.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+    if not matched:
+        raise HTTPException(status_code=401, detail="유효한 API 토큰이 필요합니다.", headers={"WWW-Authenticate": "Bearer"})
+
+
+app = FastAPI(title="보여dream 파이프라인 API", lifespan=lifespan)
+# 모든 파이프라인 엔드포인트는 이 라우터에 등록하여 인증을 빠뜨리지 않음 (/healthz만 인증 없이 제공)
+v1 = APIRouter(prefix="/v1", dependencies=[Depends(require_api_token)])
+
+
+async def _run(request: Request, stage: str, fn, *args):
+    """
+    서비스 호출을 스레드에서 실행합니다. 요청 헤더의 세션 ID/요청 ID/예산/우선순위로 요청 컨텍스트를 만들고,
+    클라이언트 연결이 끊기면 요청을 취소해 남은 API 호출을 보내지 않습니다.
+    """
+    budget = config.DREAM_REQUEST_BUDGET_SECONDS
+    try:
+        budget = min(budget, float(request.headers.get("x-request-budget", budget)))
+    except ValueError:
+        pass
+    context = RequestContext(budget, request_id=request.headers.get("x-request-id"))
+    session_id = request.headers.get("x-session-id")
+    priority = Priority.__members__.get(request.headers.get("x-request-priority", "").upper(), Priority.INTERACTIVE)
+
+    def call():
+        with tracer.bind_session(session_id), activate_request(context), request_priority(priority), tracer.span(f"api.{stage}"):
+            return fn(*args)
+
+    task = asyncio.ensure_future(asyncio.to_thread(call)) # to_thread가 현재 contextvars를 복사해 전달
+    while not task.done():
+        await asyncio.wait({task}, timeout=0.5)
+        if not task.done() and await request.is_disconnected():
+            context.cancel("클라이언트 연결 끊김")
+    try:
+        return task.result()
+    except (PipelineCancelled, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except (CircuitOpenError, RateLimitWait) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("%s 처리 중 오류: %s", stage, e, exc_info=True)
+        raise HTTPException(status_code=502, detail=f"{type(e).__name__}: {e}")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    요청 본문을 max_bytes까지만 읽습니다. Content-Length가 크면 읽지 않고, 헤더가 없거나 틀려도
+    스트림을 읽는 도중 한도를 넘으면 바로 413으로 거부합니다.
+    """
+    too_large = HTTPException(status_code=413, detail=f"오디오 데이터는 {max_bytes} 바이트를 넘을 수 없습니다.")
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Length 헤더가 올바르지 않습니다.")
+    if declared > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+@v1.post("/transcribe", response_model=TranscriptResponse)
+async def transcribe(request: Request, file_name: str = "audio.wav"):
+    """요청 본문의 오디오 바이트를 텍스트로 변환합니다. (multipart가 아닌 원본 바이트, 최대 API_MAX_UPLOAD_BYTES)"""
+    audio_bytes = await _read_body(request, config.API_MAX_UPLOAD_BYTES)
+    if not audio_bytes:
+        raise HTTPException(status_code=400, detail="오디오 데이터가 비어 있습니다.")
+    services = request.app.state.services
+    return {"text": await _run(request, "transcribe", services["stt"].transcribe_from_bytes, audio_bytes, file_name)}
+
+
+@v1.post("/moderate")
+async def moderate(body: TextRequest, request: Request):
+    """:return: ModerationService.check_text_safety 결과 ({"flagged", "text", "details"})"""
+    return await _run(request, "moderate", request.app.state.services["moderation"].check_text_safety, body.text)
+
+
+@v1.post("/report")
+async def report(body: DreamRequest, request: Request):
+    """:return: 리포트 딕셔너리 (RAG 리포트가 늦으면 일반 리포트, "source" 키 포함)"""
+    return await _run(request, "report", request.app.state.services["report"].generate_report_with_fallback, body.dream_text)
+
+
+@v1.post("/analysis")
+async def analysis(body: DreamRequest, request: Request):
+    """:return: 리포트와 두 이미지 프롬프트를 한 번에 생성한 결과 (FusedAnalysisService.analyze)"""
+    return await _run(request, "analysis", request.app.state.services["fused"].analyze, body.dream_text)
+
+
+@v1.post("/nightmare-prompt", response_model=PromptResponse)
+async def nightmare_prompt(body: DreamReportRequest, request: Request):
+    analyzer = request.app.state.services["analyzer"]
+    return {"prompt": await _run(request, "nightmare_prompt", analyzer.create_nightmare_prompt, body.dream_text, body.report)}
+
+
+@v1.post("/reconstruct", response_model=ReconstructionResponse)
+async def reconstruct(body: DreamReportRequest, request: Request):
+    analyzer = request.app.state.services["analyzer"]
+    prompt, transformation_summary, keyword_mappings = await _run(
+        request, "reconstruct", analyzer.create_reconstructed_prompt_and_analysis, body.dream_text, body.report
+    )
+    return {"prompt": prompt, "transformation_summary": transformation_summary, "keyword_mappings": keyword_mappings}
+
+
+@v1.post("/image", response_model=ImageResponse)
+async def image(body: PromptRequest, request: Request):
+    """:return: 생성된 이미지 URL (실패 시 서비스와 같이 안내 문자열)"""
+    return {"url": await _run(request, "image", request.app.state.services["image"].generate_image_from_prompt, body.prompt)}
+
+
+app.include_router(v1)
+
+
+if __name__ == "__main__":
+    uvicorn.run("api_server:app", host=config.API_HOST, port=config.API_PORT, workers=config.API_WORKERS)
@@ -1,17 +1,30 @@
 import streamlit as st  # Streamlit 라이브러리 임포트 (웹 앱 구축용)
+import streamlit.components.v1 as components  # 브라우저 쿠키 기록용 HTML 컴포넌트
 import os  # 운영체제와 상호작용하는 기능 (파일 경로 등) 제공
 from PIL import Image  # Pillow 라이브러리 임포트 (이미지 처리용)
 import base64  # Base64 인코딩/디코딩 모듈
 import tempfile  # 임시 파일 생성을 위한 모듈
 import re  # 정규표현식 모듈
+import hashlib  # 중복 제출 판정용 입력 해시
+import time  # 중복 제출 판정용 완료 시각
+from concurrent.futures import wait  # 백그라운드 단계 완료 대기
 
-# 개발한 서비스 모듈들 임포트
-from services import stt_service, dream_analyzer_service, image_generator_service, moderation_service, report_generator_service
+# 개발한 서비스 모듈들 임포트 (RAG 검색기와 서비스 구성은 API 서버, 일괄 처리 CLI와 공용)
+from services import pipeline_services
 from st_audiorec import st_audiorec  # Streamlit 오디오 녹음 위젯
 
-# RAG(Retrieval-Augmented Generation) 기능을 위한 임포트
-from langchain_openai import OpenAIEmbeddings  # OpenAI 임베딩 모델
-from langchain_community.vectorstores import FAISS  # FAISS 벡터 스토어
+from core.rate_limiter import scheduler  # OpenAI 호출 공용 속도 제한 스케줄러
+from core import config  # 환경 설정값
+from core.model_router import model_router  # 단계별 모델 라우터
+from core.deadline import PipelineCancelled, RequestContext  # 요청 지연 시간 예산 및 취소
+from core import pipeline_stages  # 스크립트 스레드 밖에서 파이프라인 단계 실행
+from core.streamlit_signals import current_session_id  # 현재 Streamlit 세션 ID
+from core.tracing import start_metrics_server, tracer  # 단계별 지연 시간 span 및 지표 서버
+from core.structured_logging import get_logger  # 큐 기반 구조화 로깅
+from core.pipeline_client import PipelineClient  # 파이프라인 API 서버 클라이언트 (PIPELINE_API_URL 설정 시)
+from core.session_store import session_store, snapshot as snapshot_state  # 재개 토큰별 세션 결과 저장소
+
+logger = get_logger("app")
 
 # ===============================================
 
@@ -25,27 +38,57 @@ st.set_page_config(
 # --- 2. API 키 로드 및 서비스 초기화 ---
 openai_api_key = os.getenv("OPENAI_API_KEY", "")  # 환경 변수에서 OpenAI API 키 가져오기
 
-if not openai_api_key:
+if not openai_api_key and not config.PIPELINE_API_URL:  # API 서버를 사용하는 경우 키는 서버에만 필요
     st.error("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다. 시스템 환경 변수를 확인하거나 '.env' 파일을 설정해주세요.")
     st.stop()  # API 키가 없으면 앱 실행 중지
 
-# RAG 시스템 초기화
-try:
-    embeddings = OpenAIEmbeddings(api_key=openai_api_key)  # OpenAI 임베딩 객체 생성
-    # 로컬에 저장된 FAISS 벡터 스토어 로드
-    vector_store = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    retriever = vector_store.as_retriever()  # 벡터 스토어를 검색기(retriever)로 사용
-except Exception as e:
-    st.error(f"RAG 시스템(faiss_index) 초기화 중 오류: {e}")
-    st.info("프로젝트 루트 폴더에서 'python core/indexing_service.py'를 먼저 실행하여 'faiss_index' 폴더를 생성했는지 확인해주세요.")
-    st.stop()  # RAG 초기화 실패 시 앱 실행 중지
-
-# 서비스 초기화 (초기화 시 retriever 객체 전달)
-_stt_service = stt_service.STTService(api_key=openai_api_key)  # 음성-텍스트 변환 서비스
-_dream_analyzer_service = dream_analyzer_service.DreamAnalyzerService(api_key=openai_api_key)  # 꿈 분석 서비스
-_image_generator_service = image_generator_service.ImageGeneratorService(api_key=openai_api_key)  # 이미지 생성 서비스
-_moderation_service = moderation_service.ModerationService(api_key=openai_api_key)  # 콘텐츠 검열 서비스
-_report_generator_service = report_generator_service.ReportGeneratorService(api_key=openai_api_key, retriever=retriever)  # 리포트 생성 서비스 (RAG 포함)
+# RAG 시스템 및 서비스는 프로세스당 한 번만 생성하여 모든 세션과 재실행(rerun)에서 재사용
+# (서비스 초기화 시 프롬프트와 체인을 미리 구성하므로 매번 다시 만들 필요가 없음)
+@st.cache_resource(show_spinner=False)
+def load_retriever(api_key):
+    # 로컬에 저장된 FAISS 벡터 스토어로 검색기 생성 (중복 제거, 토큰 예산, 상징 조회 테이블 적용)
+    return pipeline_services.build_retriever(api_key, "faiss_index")
+
+@st.cache_resource(show_spinner=False)
+def load_services(api_key):
+    # 서비스 초기화 (초기화 시 retriever 객체 전달)
+    services = pipeline_services.build_services(api_key, retriever=load_retriever(api_key))
+    return tuple(services[name] for name in ("stt", "analyzer", "image", "moderation", "report", "fused"))
+
+# 파이프라인 API 서버를 사용하는 경우 앱은 화면만 담당하고, 모든 서비스 호출은 서버로 보냄
+# (클라이언트가 서비스와 같은 메서드를 제공하므로 아래 코드는 두 경우 모두 그대로 사용)
+@st.cache_resource(show_spinner=False)
+def load_pipeline_client(base_url):
+    client = PipelineClient(base_url)
+    return (client,) * 6
+
+# 단계별 지연 시간 지표(/metrics)를 제공하는 로컬 서버는 프로세스당 한 번만 시작
+@st.cache_resource(show_spinner=False)
+def load_metrics_server():
+    return start_metrics_server()
+
+load_metrics_server()
+
+if config.PIPELINE_API_URL:
+    (_stt_service, _dream_analyzer_service, _image_generator_service, _moderation_service, _report_generator_service,
+     _fused_analysis_service) = load_pipeline_client(config.PIPELINE_API_URL)
+else:
+    # RAG 시스템 초기화
+    try:
+        load_retriever(openai_api_key)
+    except Exception as e:
+        st.error(f"RAG 시스템(faiss_index) 초기화 중 오류: {e}")
+        st.info("프로젝트 루트 폴더에서 'python core/indexing_service.py'를 먼저 실행하여 'faiss_index' 폴더를 생성했는지 확인해주세요.")
+        st.stop()  # RAG 초기화 실패 시 앱 실행 중지
+
+    # 서비스 초기화 (프롬프트/체인 구성, OpenAI 클라이언트 생성)
+    try:
+        (_stt_service, _dream_analyzer_service, _image_generator_service, _moderation_service, _report_generator_service,
+         _fused_analysis_service) = load_services(openai_api_key)
+    except Exception as e:
+        logger.error("서비스 초기화 중 오류: %s", e, exc_info=True)
+        st.error(f"서비스 초기화 중 오류가 발생했습니다: {e}")
+        st.stop()  # 서비스 초기화 실패 시 앱 실행 중지
 
 # --- 3. 로고 이미지 로딩 및 표시 ---
 # 이미지를 Base64로 인코딩하여 웹에 표시할 수 있도록 하는 함수
@@ -69,7 +112,8 @@ logo_base64 = get_base64_image(logo_path)  # 로고 이미지를 Base64로 인
 # --- UI 중앙 정렬을 위한 컬럼 설정 ---
 col_left, col_center, col_right = st.columns([1, 4, 1])  # 좌, 중앙, 우 3개 컬럼 생성 (비율 1:4:1)
 
-with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
+# 스크립트 재실행(rerun) 한 번 전체를 세션 ID가 붙은 span으로 측정
+with col_center, tracer.bind_session(current_session_id()), tracer.span("streamlit.rerun"):  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
     # --- 로고 및 타이틀 표시 ---
     if logo_base64:
         # Base64 인코딩된 이미지를 HTML 마크다운으로 표시 (중앙 정렬)
@@ -122,22 +166,154 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
         if key not in st.session_state:
             st.session_state[key] = value
 
+    # --- 5-1. 새로고침/재연결 시 저장된 결과 복원 ---
+    # 파이프라인 결과만 저장 (업로드 위젯 파일 ID 등 화면 상태는 제외)
+    persisted_keys = [key for key in session_defaults if key != "derisked_text"]
+    if "session_token" not in st.session_state:  # 새 웹소켓 세션 (첫 접속, 새로고침, 재연결)
+        # 브라우저 비밀값: 쿠키에 있으면 그대로 사용하고, 없으면 서버에서 새로 발급해 아래에서 쿠키에 기록
+        owner = st.context.cookies.get(config.SESSION_COOKIE_NAME)
+        st.session_state.owner_cookie_set = bool(owner)
+        st.session_state.session_owner = owner or session_store.new_owner_secret()
+        # URL의 재개 토큰은 같은 브라우저(쿠키)에서 저장한 결과만 복원하고, 복원하면 새 토큰으로 옮김 (탭마다 다른 토큰)
+        # 복원할 결과가 없으면 URL의 토큰은 쓰지 않고 항상 새로 발급 (링크로 전달된 토큰을 받아 쓰는 세션 고정 방지)
+        claimed = session_store.claim(st.query_params.get(config.SESSION_QUERY_PARAM), st.session_state.session_owner)
+        if claimed is not None:
+            token, restored = claimed
+            for key, value in restored.items():
+                if key in persisted_keys:
+                    st.session_state[key] = value
+        else:
+            token, restored = session_store.new_token(), None
+        st.session_state.session_token = token
+        st.session_state.saved_snapshot = snapshot_state(st.session_state, persisted_keys) if restored is not None else None
+    if st.query_params.get(config.SESSION_QUERY_PARAM) != st.session_state.session_token:
+        st.query_params[config.SESSION_QUERY_PARAM] = st.session_state.session_token  # 새로고침해도 같은 토큰으로 복원되도록 URL에 기록
+    if not st.session_state.owner_cookie_set:
+        # Streamlit은 쿠키를 읽기만 할 수 있으므로 브라우저에서 쿠키를 기록 (같은 출처의 iframe에서 상위 문서에 기록)
+        components.html(
+            "<script>window.parent.document.cookie = "
+            f"'{config.SESSION_COOKIE_NAME}={st.session_state.session_owner}; Max-Age={int(config.SESSION_TTL_SECONDS)}; Path=/; SameSite=Strict'"
+            " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+            height=0,
+        )
+
     # --- 6. 세션 상태 초기화 함수 ---
     def initialize_session_state():
         # 모든 세션 상태 변수를 기본값으로 재설정
         for key, value in session_defaults.items():
             st.session_state[key] = value
 
+    # 꿈 요청 하나의 지연 시간 예산과 취소 상태를 담는 컨텍스트 (새 오디오가 들어오면 취소하고 새로 만듦)
+    if "pipeline_context" not in st.session_state:
+        st.session_state.pipeline_context = RequestContext(config.DREAM_REQUEST_BUDGET_SECONDS)
+
+    # 입력 위젯(녹음/업로드)별로 마지막으로 본 오디오의 해시를 비교해 새 입력인지 확인
+    # (세션 상태 초기화 대상이 아니므로 session_defaults에 넣지 않음)
+    def is_new_input(source, data):
+        seen = st.session_state.setdefault("input_digests", {})
+        digest = hashlib.sha256(data).hexdigest()
+        if seen.get(source) == digest:
+            return False
+        seen[source] = digest
+        return True
+
+    # 같은 입력으로 방금 끝난 동작인지 확인 (버튼 두 번 클릭 시 두 번째 클릭은 무시)
+    def recently_completed(action, payload):
+        completed = st.session_state.get("last_completed", {}).get(action)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return completed is not None and completed[0] == digest and time.time() - completed[1] < config.DOUBLE_SUBMIT_SECONDS
+
+    def mark_completed(action, payload):
+        st.session_state.setdefault("last_completed", {})[action] = (hashlib.sha256(payload.encode("utf-8")).hexdigest(), time.time())
+
+    # 파이프라인 단계(전사, 분석, 이미지 생성)는 스크립트 스레드 밖에서 실행하고 진행 중인 단계는 세션별로 pending_stages에 보관
+    # 단계가 실행되는 동안 새 오디오가 들어오면 스크립트가 바로 재실행되어 이전 요청을 취소하고 (남은 API 호출은 보내지 않음),
+    # 다른 위젯 조작으로 재실행된 경우에는 다음 실행에서 같은 단계를 이어서 기다림
+    # (세션 상태 초기화 대상이 아니므로 session_defaults에 넣지 않음)
+    def start_stage(stage, fn):
+        st.session_state.setdefault("pending_stages", {})[stage] = pipeline_stages.submit(
+            st.session_state.pipeline_context, fn, config.DREAM_REQUEST_BUDGET_SECONDS)
+
+    def has_stage(stage):
+        return stage in st.session_state.get("pending_stages", {})
+
+    def wait_stage(stage):
+        future = st.session_state.pending_stages[stage]
+        while not wait([future], timeout=config.PIPELINE_STAGE_POLL_SECONDS).done:
+            # 세션 상태 접근은 Streamlit이 재실행 요청을 처리하는 지점 (새 입력이 있으면 여기서 이번 실행을 멈추고 재실행)
+            st.session_state.get("pending_stages")
+        del st.session_state.pending_stages[stage]
+        return future.result()
+
+    def process_audio(audio_bytes, file_name):
+        """오디오를 임시 파일로 저장해 텍스트로 변환하고 안전성 검사 결과와 함께 반환 (백그라운드 단계)"""
+        temp_audio_dir = "user_data/audio"  # 임시 오디오 파일 저장 디렉토리
+        os.makedirs(temp_audio_dir, exist_ok=True)  # 디렉토리가 없으면 생성
+
+        audio_path = None  # 임시 오디오 파일 경로
+        try:
+            # 파일 확장자 추출 또는 기본값 설정
+            suffix = os.path.splitext(file_name)[1] if file_name else ".wav"
+            # 임시 파일 생성 및 오디오 바이트 데이터 쓰기
+            with tempfile.NamedTemporaryFile(delete=False, dir=temp_audio_dir, suffix=suffix) as temp_file:
+                temp_file.write(audio_bytes)
+                audio_path = temp_file.name  # 임시 파일 경로 저장
+
+            # 임시 파일이 제대로 생성되지 않은 경우 오류 처리
+            if not audio_path or not os.path.exists(audio_path):
+                raise RuntimeError("임시 오디오 파일 생성에 실패했습니다.")
+
+            transcribed_text = _stt_service.transcribe_audio(audio_path)  # STT 서비스로 음성 텍스트 변환
+            return transcribed_text, _moderation_service.check_text_safety(transcribed_text)  # 변환된 텍스트 안전성 검사
+        finally:
+            # 임시 오디오 파일 삭제
+            if audio_path and os.path.exists(audio_path):
+                try:
+                    os.remove(audio_path)
+                    logger.debug("임시 오디오 파일 삭제", extra={"audio_path": audio_path})
+                except Exception as e:
+                    logger.warning("임시 오디오 파일 삭제 실패: %s", e, extra={"audio_path": audio_path})
+
+    def analyze_dream(dream_text):
+        """리포트와 (통합 분석 시) 두 이미지 프롬프트를 생성 (백그라운드 단계)"""
+        if config.ANALYSIS_MODE == "fused":
+            try:
+                # 리포트와 두 이미지 프롬프트를 한 번의 호출로 생성
+                fused = _fused_analysis_service.analyze(dream_text)
+                if fused:
+                    return fused
+            except PipelineCancelled:
+                raise
+            except Exception as e:
+                logger.warning("통합 분석에 실패하여 단계별 분석으로 진행합니다: %s", e)
+        # RAG 리포트를 우선 사용하고, 기한 안에 끝나지 않으면 일반 리포트로 대체
+        return {"report": _report_generator_service.generate_report_with_fallback(dream_text)}
+
+    def generate_nightmare_image(dream_text, report, prompt):
+        """악몽 이미지 프롬프트(없으면 생성)와 이미지 URL을 세션 상태 키별로 반환 (백그라운드 단계)"""
+        prompt = prompt or _dream_analyzer_service.create_nightmare_prompt(dream_text, report)
+        return {"nightmare_prompt": prompt, "nightmare_image_url": _image_generator_service.generate_image_from_prompt(prompt)}
+
+    def generate_reconstructed_image(dream_text, report, prompt):
+        """재구성 프롬프트와 변환 결과(없으면 생성), 이미지 URL을 세션 상태 키별로 반환 (백그라운드 단계)"""
+        result = {}
+        if not prompt:
+            prompt, result["transformation_summary"], result["keyword_mappings"] = \
+                _dream_analyzer_service.create_reconstructed_prompt_and_analysis(dream_text, report)
+        result["reconstructed_prompt"] = prompt
+        result["reconstructed_image_url"] = _image_generator_service.generate_image_from_prompt(prompt)
+        return result
+
     # --- 7. UI 구성: 오디오 입력 부분 ---
     tab1, tab2 = st.tabs(["🎤 실시간 녹음하기", "📁 오디오 파일 업로드"])  # 두 개의 탭 생성
 
-    audio_bytes = None  # 오디오 바이트 데이터를 저장할 변수
+    audio_bytes = None  # 새로 들어온 오디오 바이트 데이터를 저장할 변수
     file_name = None  # 오디오 파일 이름을 저장할 변수
 
     with tab1:  # 실시간 녹음 탭
         st.write("녹음 버튼을 눌러 악몽을 이야기해 주세요.")
         wav_audio_data = st_audiorec()  # st_audiorec 위젯으로 오디오 녹음
-        if wav_audio_data is not None:
+        if wav_audio_data is not None and is_new_input("recorder", wav_audio_data):
             audio_bytes = wav_audio_data  # 녹음된 오디오 데이터 저장
             file_name = "recorded_dream.wav"  # 파일 이름 설정
 
@@ -148,65 +324,45 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
             type=["mp3", "wav", "m4a", "ogg"],  # 지원하는 파일 형식
             key="audio_uploader"  # 위젯의 고유 키
         )
-        if uploaded_file is not None:
+        if uploaded_file is not None and is_new_input("uploader", uploaded_file.getvalue()):
             audio_bytes = uploaded_file.getvalue()  # 업로드된 파일의 바이트 데이터 저장
             file_name = uploaded_file.name  # 업로드된 파일의 이름 저장
 
     # --- 8. 1단계: 오디오 → 텍스트 전사 (STT) + 안전성 검사 ---
-    # 오디오 데이터가 있고 아직 처리되지 않았다면
-    if audio_bytes is not None and not st.session_state.audio_processed:
+    # 두 탭 중 어느 쪽이든 새 오디오가 들어왔다면
+    if audio_bytes is not None:
+        # 이전 오디오에 대해 남아 있는 작업은 취소하고 새 요청 컨텍스트로 시작
+        st.session_state.pipeline_context.cancel("새 오디오 입력")
         initialize_session_state()  # 새로운 오디오가 들어오면 세션 상태 초기화
+        st.session_state.pipeline_context = RequestContext(config.DREAM_REQUEST_BUDGET_SECONDS)
+        st.session_state.pending_stages = {}  # 이전 입력의 단계 결과는 기다리지 않음
+        start_stage("audio", lambda: process_audio(audio_bytes, file_name))
 
-        temp_audio_dir = "user_data/audio"  # 임시 오디오 파일 저장 디렉토리
-        os.makedirs(temp_audio_dir, exist_ok=True)  # 디렉토리가 없으면 생성
-
-        audio_path = None  # 임시 오디오 파일 경로
-
+    if has_stage("audio"):
         try:
-            # 파일 확장자 추출 또는 기본값 설정
-            suffix = os.path.splitext(file_name)[1] if file_name else ".wav"
-            # 임시 파일 생성 및 오디오 바이트 데이터 쓰기
-            with tempfile.NamedTemporaryFile(delete=False, dir=temp_audio_dir, suffix=suffix) as temp_file:
-                temp_file.write(audio_bytes)
-                audio_path = temp_file.name  # 임시 파일 경로 저장
-
-            # 임시 파일이 제대로 생성되지 않은 경우 오류 처리
-            if not audio_path or not os.path.exists(audio_path):
-                st.error("임시 오디오 파일 생성에 실패했습니다.")
-                st.session_state.audio_processed = False
-                st.rerun()  # UI 재실행하여 상태 갱신
-
             with st.spinner("음성을 텍스트로 변환하고 안전성 검사 중... 🕵️‍♂️"):
-                transcribed_text = _stt_service.transcribe_audio(audio_path)  # STT 서비스로 음성 텍스트 변환
-
-                st.session_state.original_dream_text = transcribed_text  # 원본 텍스트 저장
-
-                safety_result = _moderation_service.check_text_safety(transcribed_text)  # 변환된 텍스트 안전성 검사
-
-                if safety_result["flagged"]:  # 안전성 검사 실패 시
-                    st.error(safety_result["text"])  # 에러 메시지 출력
-                    st.session_state.audio_processed = False  # 오디오 처리 상태 초기화
-                    st.session_state.dream_text = ""  # 꿈 텍스트 비움
-                else:  # 안전성 검사 통과 시
-                    st.session_state.dream_text = transcribed_text  # 꿈 텍스트 저장
-                    st.success("안전성 검사: " + safety_result["text"])  # 성공 메시지 출력
-                    st.session_state.audio_processed = True  # 오디오 처리 완료 상태로 변경
-
+                transcribed_text, safety_result = wait_stage("audio")
+
+            st.session_state.original_dream_text = transcribed_text  # 원본 텍스트 저장
+
+            if safety_result["flagged"]:  # 안전성 검사 실패 시
+                st.error(safety_result["text"])  # 에러 메시지 출력
+                st.session_state.audio_processed = False  # 오디오 처리 상태 초기화
+                st.session_state.dream_text = ""  # 꿈 텍스트 비움
+            else:  # 안전성 검사 통과 시
+                st.session_state.dream_text = transcribed_text  # 꿈 텍스트 저장
+                st.success("안전성 검사: " + safety_result["text"])  # 성공 메시지 출력
+                st.session_state.audio_processed = True  # 오디오 처리 완료 상태로 변경
+
+        except PipelineCancelled as e:
+            # 취소된 요청은 오류로 표시하지 않음 (새 입력으로 다시 시작)
+            logger.info("오디오 처리 취소: %s", e)
+            st.session_state.audio_processed = False
         except Exception as e:
             st.error(f"오디오 처리 중 예상치 못한 오류가 발생했습니다: {e}")
             st.session_state.audio_processed = False
             st.session_state.dream_text = ""
-            print(f"ERROR during audio processing: {e}")
-        finally:
-            # 임시 오디오 파일 삭제
-            if audio_path and os.path.exists(audio_path):
-                try:
-                    os.remove(audio_path)
-                    print(f"DEBUG: 임시 오디오 파일 성공적으로 삭제됨: {audio_path}")
-                except Exception as e:
-                    print(f"WARNING: 임시 오디오 파일 '{audio_path}' 삭제 실패: {e}")
-            elif audio_path:
-                print(f"DEBUG: 임시 오디오 파일 '{audio_path}'은 이미 존재하지 않아 삭제를 건너뛰었습니다.")
+            logger.error("오디오 처리 중 오류: %s", e, exc_info=True)
 
         st.rerun()  # UI 갱신을 위해 재실행
 
@@ -228,12 +384,25 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
     # 분석이 시작되었고 아직 리포트가 생성되지 않았다면
     if st.session_state.analysis_started and st.session_state.dream_report is None:
         if st.session_state.original_dream_text:  # 원본 꿈 텍스트가 있다면
+            # 요청이 몰려 대기해야 하는 경우 예상 대기 시간 안내
+            eta = scheduler.estimate_wait(model_router.select("report")[0], 2000)
+            if eta >= 1:
+                st.info(f"요청이 많아 약 {eta:.0f}초 대기 후 분석이 시작됩니다.")
+            if not has_stage("report"):
+                dream_text = st.session_state.original_dream_text
+                start_stage("report", lambda: analyze_dream(dream_text))
             with st.spinner("RAG가 지식 베이스를 참조하여 리포트를 생성하는 중... 🧠"):
-                # RAG를 활용한 리포트 생성 서비스 호출
-                report = _report_generator_service.generate_report_with_rag(st.session_state.original_dream_text)
-                st.session_state.dream_report = report  # 생성된 리포트 저장
-                st.session_state.nightmare_keywords = report.get("keywords", [])  # 리포트에서 키워드 추출하여 저장
-                st.rerun()  # UI 재실행하여 상태 갱신
+                result = wait_stage("report")
+            report = result["report"]
+            if "nightmare_prompt" in result:  # 통합 분석 결과
+                # 이미지 버튼에서 LLM을 다시 호출하지 않도록 프롬프트와 재구성 결과를 미리 저장
+                st.session_state.nightmare_prompt = result["nightmare_prompt"]
+                st.session_state.reconstructed_prompt = result["reconstructed_prompt"]
+                st.session_state.transformation_summary = result["transformation_summary"]
+                st.session_state.keyword_mappings = result["keyword_mappings"]
+            st.session_state.dream_report = report  # 생성된 리포트 저장
+            st.session_state.nightmare_keywords = report.get("keywords", [])  # 리포트에서 키워드 추출하여 저장
+            st.rerun()  # UI 재실행하여 상태 갱신
         else:
             st.error("분석할 꿈 텍스트가 없습니다. 다시 시도해주세요.")
             st.session_state.analysis_started = False  # 분석 시작 플래그 초기화
@@ -243,6 +412,8 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
         report = st.session_state.dream_report  # 세션 상태에서 리포트 가져오기
         st.markdown("---")
         st.subheader("📊 감정 분석 리포트")  # 리포트 섹션 제목
+        if report.get("source") == "plain":  # 지식 베이스 검색이 늦어 일반 리포트로 대체된 경우
+            st.caption("지식 베이스 검색이 지연되어 꿈 내용만으로 분석한 리포트입니다.")
 
         emotions = report.get("emotions", [])  # 감정 목록 가져오기
         if emotions:
@@ -272,36 +443,47 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
         col1, col2 = st.columns(2)  # 이미지 생성 버튼을 위한 2개 컬럼 생성
 
         with col1:  # 악몽 이미지 생성 컬럼
-            if st.button("😱 악몽 이미지 그대로 보기"):  # 악몽 이미지 버튼
-                with st.spinner("악몽을 시각화하는 중... 잠시만 기다려주세요."):
-                    # 악몽 이미지 생성 프롬프트 생성
-                    prompt = _dream_analyzer_service.create_nightmare_prompt(
-                        st.session_state.original_dream_text,  # 원본 꿈 텍스트
-                        st.session_state.dream_report  # 꿈 리포트
-                    )
-                    st.session_state.nightmare_prompt = prompt  # 생성된 프롬프트 저장
-                    # 이미지 생성 서비스로 악몽 이미지 생성
-                    nightmare_image_url = _image_generator_service.generate_image_from_prompt(prompt)
-                    st.session_state.nightmare_image_url = nightmare_image_url  # 생성된 이미지 URL 저장
-                    st.rerun()  # UI 재실행하여 상태 갱신
+            # 악몽 이미지 버튼 (방금 같은 꿈으로 생성이 끝났거나 생성 중이면 두 번째 클릭은 무시)
+            if st.button("😱 악몽 이미지 그대로 보기") and not recently_completed("nightmare_image", st.session_state.original_dream_text) \
+                    and not has_stage("nightmare_image"):
+                # 악몽 이미지 생성 프롬프트 생성 (통합 분석으로 이미 만들어졌다면 그대로 사용)
+                stage_args = (st.session_state.original_dream_text, st.session_state.dream_report, st.session_state.nightmare_prompt)
+                start_stage("nightmare_image", lambda: generate_nightmare_image(*stage_args))
 
         with col2:  # 재구성된 꿈 이미지 생성 컬럼
-            if st.button("✨ 재구성된 꿈 이미지 보기"):  # 재구성된 꿈 이미지 버튼
+            # 재구성된 꿈 이미지 버튼 (방금 같은 꿈으로 생성이 끝났거나 생성 중이면 두 번째 클릭은 무시)
+            if st.button("✨ 재구성된 꿈 이미지 보기") and not recently_completed("reconstructed_image", st.session_state.original_dream_text) \
+                    and not has_stage("reconstructed_image"):
+                # 꿈 재구성 프롬프트 및 분석 결과 생성 (통합 분석으로 이미 만들어졌다면 그대로 사용)
+                stage_args = (st.session_state.original_dream_text, st.session_state.dream_report, st.session_state.reconstructed_prompt)
+                start_stage("reconstructed_image", lambda: generate_reconstructed_image(*stage_args))
+
+        # 두 이미지는 동시에 생성하고, 각 컬럼에서 끝나기를 기다림
+        with col1:
+            if has_stage("nightmare_image"):
+                with st.spinner("악몽을 시각화하는 중... 잠시만 기다려주세요."):
+                    try:
+                        for key, value in wait_stage("nightmare_image").items():
+                            st.session_state[key] = value  # 생성된 프롬프트와 이미지 URL 저장
+                        mark_completed("nightmare_image", st.session_state.original_dream_text)
+                    except Exception as e:
+                        # 재시도 후에도 실패한 경우 전체 흐름을 멈추지 않고 오류만 표시
+                        st.error(f"악몽 이미지 프롬프트 생성 중 오류가 발생했습니다: {e}")
+                    else:
+                        st.rerun()  # UI 재실행하여 상태 갱신 (다른 이미지가 생성 중이면 다음 실행에서 이어서 기다림)
+
+        with col2:
+            if has_stage("reconstructed_image"):
                 with st.spinner("악몽을 긍정적인 꿈으로 재구성하는 중... 🌈"):
-                    # 꿈 재구성 프롬프트 및 분석 결과 생성
-                    reconstructed_prompt, transformation_summary, keyword_mappings = \
-                        _dream_analyzer_service.create_reconstructed_prompt_and_analysis(
-                            st.session_state.original_dream_text,  # 원본 꿈 텍스트
-                            st.session_state.dream_report  # 꿈 리포트
-                        )
-                    st.session_state.reconstructed_prompt = reconstructed_prompt  # 재구성된 프롬프트 저장
-                    st.session_state.transformation_summary = transformation_summary  # 변환 요약 저장
-                    st.session_state.keyword_mappings = keyword_mappings  # 키워드 매핑 저장
-
-                    # 이미지 생성 서비스로 재구성된 이미지 생성
-                    reconstructed_image_url = _image_generator_service.generate_image_from_prompt(reconstructed_prompt)
-                    st.session_state.reconstructed_image_url = reconstructed_image_url  # 생성된 이미지 URL 저장
-                    st.rerun()  # UI 재실행하여 상태 갱신
+                    try:
+                        for key, value in wait_stage("reconstructed_image").items():
+                            st.session_state[key] = value  # 재구성 프롬프트, 변환 결과, 이미지 URL 저장
+                        mark_completed("reconstructed_image", st.session_state.original_dream_text)
+                    except Exception as e:
+                        # 재시도 후에도 실패한 경우 전체 흐름을 멈추지 않고 오류만 표시
+                        st.error(f"꿈 재구성 중 오류가 발생했습니다: {e}")
+                    else:
+                        st.rerun()  # UI 재실행하여 상태 갱신
 
     # --- 12. 5단계: 생성된 이미지 표시 및 키워드 강조 ---
     # 텍스트 내 키워드를 강조하는 헬퍼 함수
@@ -386,4 +568,11 @@ with col_center:  # 모든 UI 요소를 이 중앙 컬럼 안에 배치
                             st.markdown("---")
                             st.markdown(f"**변환된 키워드:** {', '.join(transformed_keywords_display_list)}", unsafe_allow_html=True)
                 elif st.session_state.reconstructed_image_url:
-                    st.error(f"재구성 이미지 생성 실패: {st.session_state.reconstructed_image_url}")  # 이미지 생성 실패 메시지
\ No newline at end of file
+                    st.error(f"재구성 이미지 생성 실패: {st.session_state.reconstructed_image_url}")  # 이미지 생성 실패 메시지
+
+    # --- 13. 결과 저장 ---
+    # 마지막으로 저장한 뒤 바뀐 결과가 있으면 저장 (st.rerun()으로 중간에 끝난 실행은 다음 실행에서 저장)
+    current_snapshot = snapshot_state(st.session_state, persisted_keys)
+    if current_snapshot != st.session_state.saved_snapshot:
+        session_store.save(st.session_state.session_token, current_snapshot, st.session_state.session_owner)
+        st.session_state.saved_snapshot = current_snapshot
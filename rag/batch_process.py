@@ -0,0 +1,223 @@
+"""
+보관된 꿈 녹음 파일을 일괄 처리하는 CLI입니다. (연구 코호트 분석용)
+파일마다 STT → 안전성 검사 → RAG 리포트를 실행하고, 선택적으로 두 이미지 프롬프트와 이미지를 생성합니다.
+
+- 입력: 오디오 파일 폴더(하위 폴더 포함) 또는 목록 파일(.txt 한 줄에 경로 하나 / .csv, .jsonl의 "path"와 선택적 "id" 열)
+- 결과: 파일마다 한 줄의 JSONL 레코드. 이 파일이 체크포인트를 겸하므로 중단 후 같은 명령을 다시 실행하면
+  이미 끝난 파일은 건너뜁니다. (--retry-failed면 실패한 파일도 다시 처리)
+- 이미지: DALL-E URL은 약 1시간 뒤 만료되므로 생성 직후 내려받아 --image-dir에 저장하고 레코드에는 파일 경로를 기록합니다.
+- 모든 API 호출은 BATCH 우선순위로 공용 속도 제한 스케줄러를 거치며, 한도에 걸리면 실패 대신 기다립니다.
+
+사용법 (rag 폴더에서 실행):
+    python batch_process.py recordings/ --output results/cohort.jsonl
+    python batch_process.py manifest.csv --output results/cohort.jsonl --prompts --images --parquet results/cohort.parquet
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+import httpx
+
+from core import config
+from core.deadline import RequestContext, activate as activate_request
+from core.rate_limiter import Priority, request_priority, scheduler
+from core.structured_logging import get_logger
+from core.tracing import tracer
+from services.pipeline_services import build_services
+from services.stt_service import is_transcript
+
+logger = get_logger("batch_process")
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg") # app.py의 업로드 허용 형식과 같음
+
+
+def load_inputs(source: str) -> List[Dict[str, str]]:
+    """
+    :param source: 오디오 폴더 또는 목록 파일 경로
+    :return: [{"id", "path"}] (id가 없으면 경로를 id로 사용)
+    """
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source) for name in names
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+        return [{"id": os.path.relpath(path, source), "path": path} for path in paths]
+
+    base = os.path.dirname(os.path.abspath(source)) # 목록의 상대 경로는 목록 파일 기준
+    with open(source, encoding="utf-8") as f:
+        if source.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif source.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [{"path": line.strip()} for line in f if line.strip() and not line.startswith("#")]
+    items = []
+    for row in rows:
+        path = row["path"] if os.path.isabs(row["path"]) else os.path.join(base, row["path"])
+        items.append({"id": str(row.get("id") or row["path"]), "path": path})
+    return items
+
+
+def load_checkpoint(output_path: str, retry_failed: bool) -> Dict[str, dict]:
+    """이미 결과 파일에 기록된 id → 레코드 (실패 재시도 시 실패 레코드는 제외)"""
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # 중단 시점에 잘린 마지막 줄
+            if retry_failed and record["status"] == "error":
+                done.pop(record["id"], None)
+            else:
+                done[record["id"]] = record
+    return done
+
+
+class BatchProcessor:
+    """
+    녹음 파일 하나를 전체 단계에 통과시키고 결과 레코드를 만드는 처리기입니다.
+    """
+    def __init__(self, services: dict, prompts: bool, images: bool, image_dir: str = "user_data/batch/images"):
+        """
+        :param services: services.pipeline_services.build_services 결과
+        :param prompts: 악몽/재구성 이미지 프롬프트까지 생성할지 여부
+        :param images: 두 프롬프트로 이미지까지 생성할지 여부 (prompts 포함)
+        :param image_dir: 생성한 이미지 파일을 저장할 폴더
+        """
+        self.services = services
+        self.prompts = prompts or images
+        self.images = images
+        self.image_dir = image_dir
+        self._http = httpx.Client(timeout=config.BATCH_IMAGE_DOWNLOAD_TIMEOUT_SECONDS, follow_redirects=True)
+
+    def _save_image(self, item_id: str, stage: str, url: str) -> str:
+        """
+        만료되는 이미지 URL에서 이미지를 내려받아 파일로 저장합니다.
+        :return: 저장한 파일 경로 (파일 이름은 id의 해시라 경로 문자가 들어간 id도 안전)
+        """
+        response = self._http.get(url)
+        response.raise_for_status()
+        os.makedirs(self.image_dir, exist_ok=True)
+        name = hashlib.sha256(item_id.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(self.image_dir, f"{name}-{stage}.png")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        return path
+
+    def process(self, item: Dict[str, str]) -> dict:
+        record = {"id": item["id"], "path": item["path"], "status": "ok"}
+        started = time.perf_counter()
+        context = RequestContext(config.BATCH_ITEM_BUDGET_SECONDS)
+        stage = "stt"
+        try:
+            with tracer.bind_session(f"batch:{item['id']}"), activate_request(context), request_priority(Priority.BATCH):
+                transcript = self.services["stt"].transcribe_audio(item["path"])
+                if not is_transcript(transcript):
+                    raise RuntimeError(transcript)
+                record["transcript"] = transcript
+
+                stage = "moderation"
+                safety = self.services["moderation"].check_text_safety(transcript)
+                record["moderation"] = {"flagged": safety["flagged"], "text": safety["text"]}
+                if safety["flagged"]:
+                    record["status"] = "flagged" # 안전성 검사를 통과하지 못한 꿈은 분석하지 않음
+                    return record
+
+                stage = "report"
+                report = self.services["report"].generate_report_with_fallback(transcript)
+                if report.get("source") == "none":
+                    raise RuntimeError(report["analysis_summary"])
+                record["report"] = report
+
+                if self.prompts:
+                    stage = "nightmare_prompt"
+                    record["nightmare_prompt"] = self.services["analyzer"].create_nightmare_prompt(transcript, report)
+                    stage = "reconstruction"
+                    (record["reconstructed_prompt"], record["transformation_summary"],
+                     record["keyword_mappings"]) = self.services["analyzer"].create_reconstructed_prompt_and_analysis(transcript, report)
+
+                if self.images:
+                    for stage, prompt_key in (("nightmare_image", "nightmare_prompt"), ("reconstructed_image", "reconstructed_prompt")):
+                        url = self.services["image"].generate_image_from_prompt(record[prompt_key])
+                        if not url.startswith("http"):
+                            raise RuntimeError(url)
+                        record[f"{stage}_path"] = self._save_image(item["id"], stage, url)
+        except Exception as e:
+            record.update(status="error", failed_stage=stage, error=f"{type(e).__name__}: {e}")
+            logger.warning("일괄 처리 실패: %s (%s 단계): %s", item["id"], stage, e)
+        finally:
+            record["seconds"] = round(time.perf_counter() - started, 3)
+            record["finished_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        return record
+
+
+def write_parquet(records: List[dict], path: str) -> None:
+    """JSONL 결과를 Parquet으로 저장합니다. (중첩 필드는 JSON 문자열로 저장)"""
+    import pandas as pd
+
+    nested = ("moderation", "report", "keyword_mappings")
+    rows = [{key: json.dumps(value, ensure_ascii=False) if key in nested else value for key, value in record.items()}
+            for record in records]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pd.DataFrame(rows).to_parquet(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="꿈 녹음 파일 일괄 처리 (STT → 안전성 검사 → 리포트 → 프롬프트/이미지)")
+    parser.add_argument("source", help="오디오 폴더 또는 목록 파일(.txt/.csv/.jsonl)")
+    parser.add_argument("--output", default="user_data/batch/results.jsonl", help="결과 JSONL 파일 (체크포인트 겸용)")
+    parser.add_argument("--parquet", help="처리가 끝난 뒤 전체 결과를 저장할 Parquet 파일")
+    parser.add_argument("--prompts", action="store_true", help="악몽/재구성 이미지 프롬프트까지 생성")
+    parser.add_argument("--images", action="store_true", help="두 프롬프트로 이미지까지 생성 (--prompts 포함)")
+    parser.add_argument("--image-dir", help="생성한 이미지 파일을 저장할 폴더 (기본값: 결과 파일 옆의 images 폴더)")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY, help="동시에 처리할 파일 수")
+    parser.add_argument("--retry-failed", action="store_true", help="이전 실행에서 실패한 파일도 다시 처리")
+    parser.add_argument("--limit", type=int, help="이번 실행에서 처리할 최대 파일 수")
+    args = parser.parse_args()
+
+    if not config.API_KEY:
+        parser.error("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다.")
+    items = load_inputs(args.source)
+    done = load_checkpoint(args.output, args.retry_failed)
+    remaining = [item for item in items if item["id"] not in done]
+    pending = remaining[:args.limit]
+    print(f"입력 {len(items)}개, 완료 {len(items) - len(remaining)}개, 이번 실행 {len(pending)}개")
+
+    # 화면에서 기다리는 사용자가 없으므로 속도 제한에 걸려도 실패하지 않고 기다림
+    # (call_with_resilience가 호출마다 이 값을 읽으므로 build_services 전후 어디서 바꿔도 적용됨)
+    scheduler.max_wait_seconds = config.BATCH_RATE_LIMIT_MAX_WAIT_SECONDS
+    image_dir = args.image_dir or os.path.join(os.path.dirname(args.output) or ".", "images")
+    processor = BatchProcessor(build_services(config.API_KEY), args.prompts, args.images, image_dir)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    counts = {"ok": 0, "flagged": 0, "error": 0}
+    started = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(processor.process, item) for item in pending]
+        for index, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush() # 중단되어도 끝난 파일은 다시 처리하지 않도록 바로 기록
+            counts[record["status"]] += 1
+            print(f"[{index}/{len(pending)}] {record['status']:<8}{record['seconds']:>8.1f}s  {record['id']}")
+
+    elapsed = time.perf_counter() - started
+    print(f"완료: 성공 {counts['ok']}, 차단 {counts['flagged']}, 실패 {counts['error']} ({elapsed:.1f}초)")
+    if args.parquet:
+        records = list(load_checkpoint(args.output, retry_failed=False).values())
+        write_parquet(records, args.parquet)
+        print(f"Parquet 저장: {args.parquet} ({len(records)}개)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+LLM 호출 전 체인 준비에 드는 CPU 시간을 비교하는 마이크로벤치마크입니다. (API 호출 없음)
+
+- per_call: 이전 방식처럼 호출마다 프롬프트 템플릿, 형식 지시어, LCEL 체인을 새로 구성
+- registry: 서비스 초기화 시 구성한 체인을 ChainRegistry에서 꺼내 사용
+두 방식 모두 실제 호출 직전 단계인 프롬프트 메시지 포맷팅까지 포함하여 측정합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.chain_overhead_benchmark --iterations 2000
+"""
+import argparse
+import statistics
+import time
+
+from langchain.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from core.chain_registry import ChainRegistry
+from services.dream_analyzer_service import (
+    NIGHTMARE_HUMAN_TEMPLATE, NIGHTMARE_PROMPT_VERSION, NIGHTMARE_SYSTEM_PROMPT,
+    RECONSTRUCTION_HUMAN_TEMPLATE, RECONSTRUCTION_PROMPT_VERSION, RECONSTRUCTION_SYSTEM_PROMPT, ReconstructionOutput,
+)
+
+INPUTS = {
+    "dream_text": "어두운 숲에서 누군가에게 쫓기다가 절벽에서 떨어졌어요.",
+    "keywords_info": "어두운 숲, 추격, 추락",
+    "emotions_info": "두려움: 80%; 불안: 60%",
+    "symbol_context": "[추격]\n쫓기는 꿈은 현실에서 피하고 싶은 문제나 스트레스가 있음을 나타냅니다.",
+}
+
+
+def _build_nightmare(llm):
+    return ChatPromptTemplate.from_messages([("system", NIGHTMARE_SYSTEM_PROMPT), ("human", NIGHTMARE_HUMAN_TEMPLATE)]) | llm
+
+
+def _build_reconstruction(llm):
+    return ChatPromptTemplate.from_messages([("system", RECONSTRUCTION_SYSTEM_PROMPT), ("human", RECONSTRUCTION_HUMAN_TEMPLATE)]) \
+        | llm.with_structured_output(ReconstructionOutput, method="json_schema", strict=True, include_raw=True)
+
+
+def per_call(llm):
+    # 이전 방식: 형식 지시어 계산 + 프롬프트/체인 구성을 호출마다 반복
+    PydanticOutputParser(pydantic_object=ReconstructionOutput).get_format_instructions()
+    nightmare, reconstruction = _build_nightmare(llm), _build_reconstruction(llm)
+    nightmare.first.format_messages(**INPUTS)
+    reconstruction.first.format_messages(**INPUTS)
+
+
+def from_registry(registry):
+    nightmare = registry.get("nightmare_prompt@gpt-4o", NIGHTMARE_PROMPT_VERSION)
+    reconstruction = registry.get("reconstruction@gpt-4o", RECONSTRUCTION_PROMPT_VERSION)
+    nightmare.first.format_messages(**INPUTS)
+    reconstruction.first.format_messages(**INPUTS)
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    ordered = sorted(samples)
+    return statistics.mean(samples), ordered[len(ordered) // 2], ordered[int(len(ordered) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="체인 준비 오버헤드 마이크로벤치마크")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    llm = ChatOpenAI(model="gpt-4o", api_key="sk-benchmark") # 호출하지 않으므로 가짜 키 사용
+    registry = ChainRegistry()
+    registry.register("nightmare_prompt@gpt-4o", NIGHTMARE_PROMPT_VERSION, _build_nightmare(llm))
+    registry.register("reconstruction@gpt-4o", RECONSTRUCTION_PROMPT_VERSION, _build_reconstruction(llm))
+
+    print(f"{'path':<10}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+    for name, fn in (("per_call", lambda: per_call(llm)), ("registry", lambda: from_registry(registry))):
+        fn() # 워밍업
+        mean, p50, p99 = measure(fn, args.iterations)
+        print(f"{name:<10}{mean:>12.1f}{p50:>12.1f}{p99:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
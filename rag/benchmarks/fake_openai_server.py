@@ -0,0 +1,379 @@
+"""
+네트워크 없이 서비스를 측정하기 위한 로컬 OpenAI API 대역(stand-in) 서버입니다.
+
+구현한 엔드포인트 (OpenAI Python SDK / LangChain이 보내는 요청 형식):
+    POST /v1/audio/transcriptions   Whisper 전사
+    POST /v1/moderations            콘텐츠 검열
+    POST /v1/chat/completions       챗 (response_format이 json_schema이면 스키마에 맞는 JSON 생성)
+    POST /v1/embeddings             임베딩 (입력 해시로 만든 결정적 벡터)
+    POST /v1/images/generations     DALL-E 이미지 생성
+    GET  /fake-image.png            생성 응답의 이미지 URL (작은 PNG, batch_process --images가 내려받음)
+응답 지연 시간(엔드포인트별 기본 지연 + 지터, 챗은 출력 토큰당 지연 추가)과
+오류(429/500/503) 및 무응답(stall) 주입 비율을 설정할 수 있습니다.
+--recordings 폴더에 <엔드포인트>.json(chat, transcriptions, moderations, embeddings, images)을 두면 기본 응답 대신 사용합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.fake_openai_server --port 8765 --latency chat=1.5,embeddings=0.05 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-fake streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# 엔드포인트별 기본 지연 시간(초), 실제 API의 대략적인 중앙값
+DEFAULT_LATENCY = {
+    "transcriptions": 2.0,
+    "moderations": 0.15,
+    "chat": 0.6,
+    "embeddings": 0.08,
+    "images": 8.0,
+}
+CHAT_SECONDS_PER_OUTPUT_TOKEN = 0.012 # 챗 응답의 출력 토큰당 추가 지연(초)
+EMBEDDING_DIMENSIONS = 1536 # text-embedding-ada-002와 같은 차원 (기존 faiss_index와 호환)
+
+
+
+def _png(width: int, height: int, rgb: tuple) -> bytes:
+    """한 가지 색으로 채운 RGB PNG (이미지 URL 응답용)"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height)) # 각 행 앞의 0은 필터 없음
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+_IMAGE_PNG = _png(64, 64, (40, 30, 70))
+_TRANSCRIPT = "어두운 숲에서 누군가에게 쫓기다가 절벽에서 떨어지는 꿈을 꿨어요. 계속 뒤를 돌아봐도 얼굴이 보이지 않았어요."
+_PARAGRAPH = ("A dim forest at dusk where tall, twisted trees lean over a narrow path, fog drifting between their trunks, "
+              "a faceless silhouette following at a distance while the ground ahead breaks into a steep cliff edge under a pale moon.")
+_MODERATION_CATEGORIES = [
+    "harassment", "harassment/threatening", "hate", "hate/threatening", "illicit", "illicit/violent", "self-harm",
+    "self-harm/instructions", "self-harm/intent", "sexual", "sexual/minors", "violence", "violence/graphic",
+]
+
+
+class FakeOpenAIConfig:
+    """서버 동작 설정 (지연 시간, 오류 주입, 녹화 응답)"""
+    def __init__(self, latency: Dict[str, float] = None, jitter: float = 0.3, error_rate: float = 0.0,
+                 error_codes=(429, 500, 503), stall_rate: float = 0.0, stall_seconds: float = 120.0,
+                 recordings_dir: Optional[str] = None, seed: Optional[int] = None):
+        """
+        :param latency: 엔드포인트별 기본 지연 시간(초), 없는 항목은 DEFAULT_LATENCY
+        :param jitter: 로그정규 지터의 표준편차 (0이면 항상 기본 지연)
+        :param error_rate: 오류 응답 비율
+        :param error_codes: 오류 응답 시 무작위로 고를 상태 코드
+        :param stall_rate: 응답하지 않고 stall_seconds 동안 멈추는 비율 (시간 초과/헤징 확인용)
+        :param recordings_dir: 녹화 응답 JSON 폴더
+        :param seed: 난수 시드 (재현 가능한 지연/오류 순서)
+        """
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.recordings = {}
+        if recordings_dir:
+            for endpoint in DEFAULT_LATENCY:
+                path = os.path.join(recordings_dir, f"{endpoint}.json")
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        self.recordings[endpoint] = json.load(f)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {} # 엔드포인트별 요청 수
+        self.errors: Dict[str, int] = {} # 엔드포인트별 주입한 오류 수
+        self._seen_prefixes = set() # 프롬프트 캐시 적중 흉내용 시스템 메시지 해시
+
+    def delay(self, endpoint: str, output_tokens: int = 0) -> float:
+        with self.lock:
+            factor = self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        return self.latency[endpoint] * factor + output_tokens * (CHAT_SECONDS_PER_OUTPUT_TOKEN if endpoint == "chat" else 0)
+
+    def inject(self, endpoint: str) -> Optional[str]:
+        """이번 요청에 주입할 동작 ("error" / "stall" / None)"""
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                return "error"
+            if roll < self.error_rate + self.stall_rate:
+                return "stall"
+        return None
+
+    def cached_tokens(self, system_prompt: str, prompt_tokens: int) -> int:
+        # 같은 시스템 메시지(1024토큰 이상)가 다시 오면 128토큰 단위로 캐시 적중 처리
+        key = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+        system_tokens = _approx_tokens(system_prompt)
+        with self.lock:
+            hit = key in self._seen_prefixes
+            self._seen_prefixes.add(key)
+        if not hit or system_tokens < 1024:
+            return 0
+        return min(prompt_tokens, system_tokens // 128 * 128)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 3)
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    while "$ref" in schema:
+        name = schema["$ref"].split("/")[-1]
+        schema = (root.get("$defs") or root.get("definitions") or {})[name]
+    return schema
+
+
+def fake_from_schema(schema: dict, root: dict = None, key: str = "") -> object:
+    """JSON 스키마를 만족하는 그럴듯한 값을 생성합니다. (strict 모드: 모든 속성 필수)"""
+    root = root or schema
+    schema = _resolve(schema, root)
+    if "anyOf" in schema:
+        return fake_from_schema(next(s for s in schema["anyOf"] if s.get("type") != "null"), root, key)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: fake_from_schema(prop, root, name) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_from_schema(schema.get("items", {}), root, key) for _ in range(3)]
+    if kind in ("number", "integer"):
+        return 0.6 if kind == "number" else 1
+    if kind == "boolean":
+        return False
+    if "enum" in schema:
+        return schema["enum"][0]
+    # 영어 프롬프트 필드는 이미지 프롬프트 길이의 문단, 나머지는 짧은 한국어 문장
+    if "prompt" in key:
+        return _PARAGRAPH
+    if key in ("keywords", "original", "emotion"):
+        return {"keywords": "추격", "original": "절벽", "emotion": "두려움"}[key]
+    if key == "transformed":
+        return "넓은 들판"
+    return "꿈 속의 불안이 현실의 압박감과 연결되어 있으며, 상징을 통해 안정감을 되찾을 수 있음을 보여줍니다."
+
+
+def _chat_response(body: dict, config: FakeOpenAIConfig) -> dict:
+    messages = body.get("messages", [])
+    prompt_text = "".join(str(message.get("content", "")) for message in messages)
+    system_prompt = "".join(str(message.get("content", "")) for message in messages if message.get("role") == "system")
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+        content = json.dumps(fake_from_schema(schema), ensure_ascii=False)
+    else:
+        content = config.recordings.get("chat", {}).get("content", _PARAGRAPH)
+    prompt_tokens = _approx_tokens(prompt_text)
+    completion_tokens = _approx_tokens(content)
+    return {
+        "id": f"chatcmpl-fake{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content, "refusal": None}, "finish_reason": "stop", "logprobs": None}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": config.cached_tokens(system_prompt, prompt_tokens), "audio_tokens": 0},
+            "completion_tokens_details": {"reasoning_tokens": 0, "audio_tokens": 0},
+        },
+    }
+
+
+def _embedding(text, dimensions: int) -> list:
+    # 입력 해시를 시드로 한 단위 벡터 (같은 입력은 항상 같은 벡터)
+    seed = int.from_bytes(hashlib.sha1(str(text).encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _embeddings_response(body: dict) -> dict:
+    inputs = body.get("input", [])
+    if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+    tokens = sum(len(item) if isinstance(item, list) else _approx_tokens(str(item)) for item in inputs)
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": _embedding(item, dimensions)} for i, item in enumerate(inputs)],
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def _moderation_response(body: dict) -> dict:
+    inputs = body.get("input", [])
+    inputs = [inputs] if isinstance(inputs, str) else inputs
+    result = {
+        "flagged": False,
+        "categories": {name: False for name in _MODERATION_CATEGORIES},
+        "category_scores": {name: 0.0001 for name in _MODERATION_CATEGORIES},
+        "category_applied_input_types": {name: ["text"] for name in _MODERATION_CATEGORIES},
+    }
+    return {"id": f"modr-fake{random.getrandbits(32):08x}", "model": body.get("model", "omni-moderation-latest"), "results": [result for _ in inputs]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # 클라이언트 연결 재사용
+    config: FakeOpenAIConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        # 스케줄러가 한도를 보정할 수 있도록 실제 API와 같은 속도 제한 헤더 포함
+        self.send_header("x-ratelimit-limit-requests", "10000")
+        self.send_header("x-ratelimit-remaining-requests", "9999")
+        self.send_header("x-ratelimit-limit-tokens", "10000000")
+        self.send_header("x-ratelimit-remaining-tokens", "9999000")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # 이미지 생성 응답의 URL을 내려받는 요청 (지연/오류 주입 없음)
+        if self.path.split("?")[0] != "/fake-image.png":
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path.split('?')[0]}", "type": "invalid_request_error"}})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(_IMAGE_PNG)))
+        self.end_headers()
+        self.wfile.write(_IMAGE_PNG)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = self.path.split("?")[0].rstrip("/")
+        endpoint = {
+            "/v1/audio/transcriptions": "transcriptions",
+            "/v1/moderations": "moderations",
+            "/v1/chat/completions": "chat",
+            "/v1/embeddings": "embeddings",
+            "/v1/images/generations": "images",
+        }.get(path)
+        if endpoint is None:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {path}", "type": "invalid_request_error"}})
+            return
+
+        config = self.config
+        action = config.inject(endpoint)
+        if action == "stall":
+            time.sleep(config.stall_seconds)
+        if action == "error":
+            time.sleep(config.delay(endpoint) * 0.2)
+            status = config.random.choice(config.error_codes)
+            headers = {"retry-after": "1"} if status == 429 else None
+            self._send_json(status, {"error": {"message": f"Injected error {status}", "type": "server_error", "code": None}}, headers)
+            return
+
+        body = json.loads(raw or b"{}") if endpoint != "transcriptions" else {}
+        if endpoint in config.recordings and endpoint != "chat":
+            payload = config.recordings[endpoint]
+        elif endpoint == "chat":
+            payload = _chat_response(body, config)
+        elif endpoint == "embeddings":
+            payload = _embeddings_response(body)
+        elif endpoint == "moderations":
+            payload = _moderation_response(body)
+        elif endpoint == "images":
+            payload = {"created": int(time.time()), "data": [
+                {"url": f"http://{self.headers.get('Host', 'localhost')}/fake-image.png", "revised_prompt": body.get("prompt", "")}
+                for _ in range(body.get("n") or 1)
+            ]}
+        else:
+            payload = {"text": _TRANSCRIPT}
+        output_tokens = payload.get("usage", {}).get("completion_tokens", 0) if endpoint == "chat" else 0
+        time.sleep(config.delay(endpoint, output_tokens))
+        self._send_json(200, payload)
+
+
+def start_fake_server(config: FakeOpenAIConfig = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    백그라운드 스레드에서 서버를 시작합니다. port=0이면 빈 포트를 사용합니다.
+    :return: 서버 객체 (server.server_address로 실제 포트 확인, server.shutdown()으로 종료)
+    """
+    handler = type("FakeOpenAIHandler", (_Handler,), {"config": config or FakeOpenAIConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def use_fake_server(server: ThreadingHTTPServer) -> str:
+    """
+    이후 생성되는 OpenAI/LangChain 클라이언트가 대역 서버를 사용하도록 환경 변수를 설정합니다.
+    (서비스 객체를 만들기 전에 호출해야 함)
+    :return: base URL
+    """
+    host, port = server.server_address[:2]
+    base_url = f"http://{host}:{port}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    return base_url
+
+
+def parse_latency(value: str) -> Dict[str, float]:
+    """"chat=1.5,embeddings=0.05" 형식의 엔드포인트별 지연 시간"""
+    latency = {}
+    for item in filter(None, (value or "").split(",")):
+        endpoint, seconds = item.split("=")
+        if endpoint not in DEFAULT_LATENCY:
+            raise argparse.ArgumentTypeError(f"알 수 없는 엔드포인트: {endpoint} ({', '.join(DEFAULT_LATENCY)})")
+        latency[endpoint] = float(seconds)
+    return latency
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """대역 서버 설정 인자를 추가합니다. (벤치마크/부하 테스트에서 공용)"""
+    parser.add_argument("--latency", type=parse_latency, default={}, help="엔드포인트별 기본 지연(초), 예: chat=1.5,images=4")
+    parser.add_argument("--jitter", type=float, default=0.3, help="지연 시간 로그정규 지터 (0이면 고정)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 응답(429/500/503) 비율")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="응답하지 않고 멈추는 요청 비율")
+    parser.add_argument("--stall-seconds", type=float, default=120.0)
+    parser.add_argument("--recordings", help="녹화 응답 JSON 폴더")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args) -> FakeOpenAIConfig:
+    return FakeOpenAIConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds, recordings_dir=args.recordings, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 OpenAI API 대역 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_server(config_from_args(args), args.host, args.port)
+    print(f"OpenAI 대역 서버 실행 중: http://{args.host}:{server.server_address[1]}/v1 (Ctrl+C로 종료)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+세 번의 순차 호출(리포트 → 악몽 프롬프트 → 재구성)과 한 번의 통합 호출(FusedAnalysisService)의
+지연 시간과 토큰 사용량을 비교하는 벤치마크입니다. 실제 API를 호출하므로 OPENAI_API_KEY와 faiss_index가 필요합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.fused_analysis_benchmark --repeat 3
+    python -m benchmarks.fused_analysis_benchmark --dreams dreams.txt   # 한 줄에 꿈 하나
+"""
+import argparse
+import statistics
+import time
+
+from core import config
+from core.llm_usage import llm_usage_metrics
+from core.shared_cache import shared_cache
+from services.pipeline_services import build_services
+
+SAMPLE_DREAMS = [
+    "어두운 숲에서 누군가에게 쫓기다가 절벽에서 떨어졌어요.",
+    "시험장에 갔는데 시험지가 전부 모르는 언어로 쓰여 있었고 시간이 계속 줄어들었어요.",
+    "바다 한가운데에서 파도에 휩쓸려 물속으로 가라앉는 꿈을 꿨어요.",
+]
+
+
+def staged(services, dream_text):
+    report_service, analyzer = services
+    report = report_service.generate_report_with_rag(dream_text)
+    analyzer.create_nightmare_prompt(dream_text, report)
+    analyzer.create_reconstructed_prompt_and_analysis(dream_text, report)
+
+
+def fused(service, dream_text):
+    service.analyze(dream_text)
+
+
+def measure(fn, dreams, repeat):
+    """실행별 지연 시간과 llm_usage_metrics에 기록된 토큰 합계를 반환합니다."""
+    latencies, input_tokens, cached_tokens, output_tokens, calls = [], [], [], [], []
+    for _ in range(repeat):
+        for dream_text in dreams:
+            before = len(llm_usage_metrics.recent)
+            start = time.perf_counter()
+            try:
+                fn(dream_text)
+            except Exception as e:
+                print(f"  실행 실패: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            records = list(llm_usage_metrics.recent)[before:]
+            calls.append(len(records))
+            input_tokens.append(sum(record["input_tokens"] for record in records))
+            cached_tokens.append(sum(record["cached_tokens"] for record in records))
+            output_tokens.append(sum(record["output_tokens"] for record in records))
+    return latencies, calls, input_tokens, cached_tokens, output_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="단계별 3회 호출 vs 통합 1회 호출 비교")
+    parser.add_argument("--dreams", help="꿈 텍스트 파일 (한 줄에 하나)")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--cache", action="store_true", help="공유 캐시와 동일 요청 합치기 사용 (기본값은 끄고 매번 LLM 호출 측정)")
+    args = parser.parse_args()
+
+    if not args.cache:
+        shared_cache.enabled = False # 같은 꿈을 반복하므로 캐시를 켜면 첫 실행 이후는 캐시 적중만 측정됨 (LLM 호출 0회)
+        shared_cache.flights.enabled = False # 진행 중인 같은 호출에 합쳐지지 않고 매번 LLM을 호출하도록
+
+    dreams = SAMPLE_DREAMS
+    if args.dreams:
+        with open(args.dreams, encoding="utf-8") as f:
+            dreams = [line.strip() for line in f if line.strip()]
+
+    services = build_services(config.API_KEY)
+    staged_services = (services["report"], services["analyzer"])
+    fused_service = services["fused"]
+
+    print(f"{'mode':<8}{'runs':>6}{'LLM calls':>11}{'p50(s)':>9}{'p95(s)':>9}{'input tok':>11}{'cached':>9}{'output tok':>12}")
+    for name, fn in (("staged", lambda text: staged(staged_services, text)), ("fused", lambda text: fused(fused_service, text))):
+        latencies, calls, input_tokens, cached_tokens, output_tokens = measure(fn, dreams, args.repeat)
+        if not latencies:
+            print(f"{name:<8}{0:>6}")
+            continue
+        ordered = sorted(latencies)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        print(f"{name:<8}{len(latencies):>6}{statistics.mean(calls):>11.1f}{statistics.median(latencies):>9.2f}{p95:>9.2f}"
+              f"{statistics.mean(input_tokens):>11.0f}{statistics.mean(cached_tokens):>9.0f}{statistics.mean(output_tokens):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+여러 사용자가 동시에 app.py 전체 흐름(오디오 업로드 → 안전성 검사 → 분석 → 두 이미지 생성)을 진행하는 상황을
+Streamlit AppTest로 재현하는 부하 테스트입니다. OpenAI 호출은 로컬 대역 서버(benchmarks.fake_openai_server)로 보냅니다.
+
+동시 세션 수를 단계적으로 늘리며 처리량(흐름/초), 단계별 지연 시간 분포, 세션당 메모리 증가량을 측정하고,
+처리량이 더 이상 늘지 않거나 지연 시간이 크게 늘어나는 지점(포화 지점)을 찾습니다.
+(한 프로세스 = 레플리카 하나가 감당할 수 있는 동시 세션 수를 가늠하는 용도)
+
+AppTest는 파일 업로드 위젯과 녹음 컴포넌트를 조작할 수 없으므로, 업로드 단계는 앱과 같은 구성의 서비스로
+STT와 안전성 검사를 실행한 뒤 그 결과를 세션 상태에 넣고 재실행하는 방식으로 대신합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.load_test --users 1,2,4,8,16
+    python -m benchmarks.load_test --users 4,8 --flows 2 --latency chat=1.0,images=5.0 --error-rate 0.02
+"""
+import argparse
+import gc
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.shared_cache import shared_cache
+from benchmarks.fake_openai_server import add_server_arguments, config_from_args, start_fake_server, use_fake_server
+from benchmarks.service_benchmark import build_services, silent_wav
+
+STAGES = ("upload", "analyze", "nightmare_image", "reconstructed_image")
+ANALYZE_BUTTON = "✅ 이 내용으로 꿈 분석하기"
+NIGHTMARE_BUTTON = "😱 악몽 이미지 그대로 보기"
+RECONSTRUCTED_BUTTON = "✨ 재구성된 꿈 이미지 보기"
+
+
+def flow_state_defaults() -> dict:
+    """
+    흐름 하나가 채우는 세션 상태 키와 기본값 (app.py의 session_defaults와 같은 값)
+    흐름을 반복할 때 이전 흐름의 리포트/프롬프트/이미지 URL이 남아 있으면 다음 흐름의 확인이 그 값으로 통과하므로 모두 되돌립니다.
+    """
+    return {
+        "dream_text": "",
+        "original_dream_text": "",
+        "analysis_started": False,
+        "audio_processed": False,
+        "dream_report": None,
+        "nightmare_prompt": "",
+        "reconstructed_prompt": "",
+        "transformation_summary": "",
+        "keyword_mappings": [],
+        "nightmare_image_url": "",
+        "reconstructed_image_url": "",
+        "nightmare_keywords": [],
+    }
+
+
+def rss_bytes() -> int:
+    """현재 프로세스의 상주 메모리(RSS) 크기 (/proc를 읽을 수 없으면 최대 RSS로 대신)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _click(app, label: str, timeout: float):
+    for button in app.button:
+        if button.label == label:
+            button.click().run(timeout=timeout)
+            return
+    errors = [element.value for element in app.error]
+    raise RuntimeError(f"'{label}' 버튼이 없습니다." + (f" (화면 오류: {errors[0]})" if errors else ""))
+
+
+class SimulatedUser:
+    """
+    AppTest 세션 하나로 앱의 전체 흐름을 한 번 진행하는 가상 사용자입니다.
+    """
+    def __init__(self, services, audio: bytes, timeout: float):
+        """
+        :param services: build_services()가 만든 서비스 (업로드 단계의 STT/안전성 검사에 사용)
+        :param audio: 업로드할 오디오 바이트
+        :param timeout: 스크립트 재실행 한 번의 제한 시간(초)
+        """
+        from streamlit.testing.v1 import AppTest
+
+        self.services = services
+        self.audio = audio
+        self.timeout = timeout
+        self.app = AppTest.from_file("app.py", default_timeout=timeout)
+
+    def _upload(self) -> None:
+        # 앱의 1단계와 같은 순서로 STT → 안전성 검사를 실행하고 결과를 세션 상태에 반영
+        text = self.services["stt"].transcribe_from_bytes(self.audio, "load_test.wav")
+        safety = self.services["moderation"].check_text_safety(text)
+        if safety["flagged"]:
+            raise RuntimeError(f"안전성 검사 차단: {safety['text']}")
+        self.app.session_state["original_dream_text"] = text
+        self.app.session_state["dream_text"] = text
+        self.app.session_state["audio_processed"] = True
+        self.app.run(timeout=self.timeout)
+
+    def _analyze(self) -> None:
+        _click(self.app, ANALYZE_BUTTON, self.timeout)
+        if self.app.session_state["dream_report"] is None:
+            raise RuntimeError("리포트가 생성되지 않았습니다.")
+
+    def _nightmare_image(self) -> None:
+        _click(self.app, NIGHTMARE_BUTTON, self.timeout)
+        if not self.app.session_state["nightmare_image_url"]:
+            raise RuntimeError("악몽 이미지가 생성되지 않았습니다.")
+
+    def _reconstructed_image(self) -> None:
+        _click(self.app, RECONSTRUCTED_BUTTON, self.timeout)
+        if not self.app.session_state["reconstructed_image_url"]:
+            raise RuntimeError("재구성된 이미지가 생성되지 않았습니다.")
+
+    def run_flow(self):
+        """
+        :return: (단계 이름 → 소요 시간(초), 실패한 단계 이름 또는 None)
+        """
+        self.app.run(timeout=self.timeout) # 첫 화면 (세션 상태 기본값 초기화)
+        timings = {}
+        try:
+            for stage, step in zip(STAGES, (self._upload, self._analyze, self._nightmare_image, self._reconstructed_image)):
+                start = time.perf_counter()
+                try:
+                    step()
+                except Exception:
+                    timings[stage] = time.perf_counter() - start
+                    return timings, stage
+                timings[stage] = time.perf_counter() - start
+            return timings, None
+        finally:
+            # 다음 흐름은 같은 세션에서 새 오디오를 올린 것처럼 처음부터 진행 (중간에 실패한 흐름도 동일)
+            for key, value in flow_state_defaults().items():
+                self.app.session_state[key] = value
+
+
+class StepResult:
+    """동시 세션 수 한 단계의 측정 결과"""
+    def __init__(self, users: int):
+        self.users = users
+        self.stage_latencies = {stage: [] for stage in STAGES}
+        self.flow_latencies = []
+        self.failures = {}
+        self.elapsed = 0.0
+        self.memory_per_session = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.flow_latencies) / self.elapsed if self.elapsed else 0.0
+
+
+def _percentile(values, ratio):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def run_step(services, audio: bytes, users: int, flows: int, timeout: float) -> StepResult:
+    """
+    users명의 가상 사용자가 동시에 각자 flows번 흐름을 진행합니다.
+    세션당 메모리는 모든 세션을 살려 둔 상태에서 측정한 RSS 증가량을 세션 수로 나눈 값입니다.
+    """
+    result = StepResult(users)
+    lock = threading.Lock()
+    gc.collect()
+    rss_before = rss_bytes()
+    sessions = [SimulatedUser(services, audio, timeout) for _ in range(users)]
+
+    def drive(user: SimulatedUser) -> None:
+        for _ in range(flows):
+            start = time.perf_counter()
+            timings, failed = user.run_flow()
+            with lock:
+                for stage, seconds in timings.items():
+                    result.stage_latencies[stage].append(seconds)
+                if failed:
+                    result.failures[failed] = result.failures.get(failed, 0) + 1
+                else:
+                    result.flow_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(drive, sessions))
+    result.elapsed = time.perf_counter() - start
+    gc.collect()
+    result.memory_per_session = max(0, rss_bytes() - rss_before) / users
+    del sessions
+    return result
+
+
+def find_saturation(results, min_gain: float = 0.10, max_p95_ratio: float = 2.0):
+    """
+    처리량 증가율이 min_gain 미만이거나 흐름 p95 지연 시간이 첫 단계의 max_p95_ratio배를 넘는 첫 단계를 찾습니다.
+    :return: (포화 직전의 동시 세션 수, 판단 이유) 또는 포화되지 않았으면 (None, None)
+    """
+    baseline_p95 = _percentile(results[0].flow_latencies, 0.95)
+    for previous, current in zip(results, results[1:]):
+        if previous.throughput and current.throughput < previous.throughput * (1 + min_gain):
+            return previous.users, f"{current.users}명에서 처리량 증가가 {min_gain:.0%} 미만"
+        if _percentile(current.flow_latencies, 0.95) > baseline_p95 * max_p95_ratio:
+            return previous.users, f"{current.users}명에서 흐름 p95가 {results[0].users}명 기준의 {max_p95_ratio:g}배 초과"
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 대역 서버 기반 Streamlit 전체 흐름 동시 세션 부하 테스트")
+    parser.add_argument("--users", default="1,2,4,8,16", help="단계별 동시 세션 수 목록")
+    parser.add_argument("--flows", type=int, default=1, help="세션마다 진행할 전체 흐름 횟수")
+    parser.add_argument("--timeout", type=float, default=180.0, help="스크립트 재실행 한 번의 제한 시간(초)")
+    parser.add_argument("--cache", action="store_true", help="공유 캐시와 동일 요청 합치기 사용 (기본값은 끄고 모든 세션이 서로 다른 꿈을 보낸 것처럼 측정)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.cache:
+        shared_cache.enabled = False # 대역 서버는 항상 같은 전사문을 반환하므로 캐시를 켜면 첫 흐름 이후는 캐시 적중만 측정됨
+        shared_cache.flights.enabled = False # 동시에 같은 입력을 보내는 세션들이 한 번의 호출로 합쳐지지 않도록
+    server = start_fake_server(config_from_args(args))
+    base_url = use_fake_server(server)
+    print(f"OpenAI 대역 서버: {base_url}")
+    services = build_services(api_key=os.environ["OPENAI_API_KEY"])
+    audio = silent_wav()
+
+    SimulatedUser(services, audio, args.timeout).run_flow() # 워밍업 (인덱스 로드, 체인/커넥션 준비)
+
+    results = []
+    print(f"{'users':>5}{'flows':>7}{'failed':>8}{'flows/s':>9}{'flow p50':>10}{'flow p95':>10}{'MiB/sess':>10}  "
+          + "  ".join(f"{stage} p50/p95/p99(s)" for stage in STAGES))
+    for users in [int(value) for value in args.users.split(",")]:
+        result = run_step(services, audio, users, args.flows, args.timeout)
+        results.append(result)
+        stage_columns = "  ".join(
+            f"{_percentile(result.stage_latencies[stage], 0.50):.2f}/{_percentile(result.stage_latencies[stage], 0.95):.2f}"
+            f"/{_percentile(result.stage_latencies[stage], 0.99):.2f}".rjust(len(stage) + 16)
+            for stage in STAGES
+        )
+        print(f"{users:>5}{len(result.flow_latencies):>7}{sum(result.failures.values()):>8}{result.throughput:>9.2f}"
+              f"{_percentile(result.flow_latencies, 0.50):>10.2f}{_percentile(result.flow_latencies, 0.95):>10.2f}"
+              f"{result.memory_per_session / 2**20:>10.1f}  {stage_columns}")
+        if result.failures:
+            print("      실패 단계: " + ", ".join(f"{stage}={count}" for stage, count in result.failures.items()))
+
+    capacity, reason = find_saturation([result for result in results if result.flow_latencies] or results)
+    if capacity is None:
+        print(f"포화 지점: 측정 범위({results[-1].users}명)까지 포화되지 않음")
+    else:
+        print(f"포화 지점: 약 {capacity}명 ({reason})")
+    print(f"최대 처리량: {max(result.throughput for result in results):.2f} 흐름/초, 현재 RSS: {rss_bytes() / 2**20:.0f} MiB")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+로컬 OpenAI 대역 서버(benchmarks.fake_openai_server)를 대상으로 서비스별 호출 지연 시간과
+동시 실행 시 처리량을 측정하는 벤치마크입니다. 네트워크와 API 키 없이 재현 가능한 수치를 얻을 수 있습니다.
+(대역 서버의 지연 시간은 고정값이므로, 결과의 차이는 서비스 코드의 오버헤드와 동시성 처리에서 나옵니다)
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.service_benchmark --calls 20 --concurrency 1,4,16
+    python -m benchmarks.service_benchmark --services report,nightmare,reconstruction --latency chat=1.0 --error-rate 0.05
+"""
+import argparse
+import io
+import statistics
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from core.shared_cache import shared_cache
+from benchmarks.fake_openai_server import add_server_arguments, config_from_args, start_fake_server, use_fake_server
+
+SAMPLE_DREAM = "어두운 숲에서 누군가에게 쫓기다가 절벽에서 떨어졌어요. 뒤를 돌아봐도 얼굴이 보이지 않았어요."
+SAMPLE_REPORT = {
+    "emotions": [{"emotion": "두려움", "score": 0.8}, {"emotion": "불안", "score": 0.6}],
+    "keywords": ["숲", "추격", "절벽"],
+    "analysis_summary": "쫓기는 꿈은 현실에서 피하고 싶은 압박을 나타냅니다.",
+}
+SERVICES = ("stt", "moderation", "report", "nightmare", "reconstruction", "image")
+
+
+def silent_wav(seconds: float = 3.0, rate: int = 16000) -> bytes:
+    """STT 요청에 사용할 무음 WAV 바이트"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def build_services(api_key: str = "sk-fake", moderation_mode: str = "off"):
+    """
+    services.pipeline_services로 앱과 같은 구성의 서비스를 생성합니다. (대역 서버를 사용하려면 use_fake_server 호출 후 실행)
+    :return: 서비스 이름 → 서비스 객체
+    """
+    from services import pipeline_services # use_fake_server로 환경 변수를 설정한 뒤 서비스 모듈을 읽도록 지연 임포트
+
+    return pipeline_services.build_services(api_key, moderation_mode=moderation_mode)
+
+
+def service_calls(services, audio: bytes):
+    """
+    서비스 이름 → (호출 함수, 성공 여부 판정 함수)
+    서비스 대부분은 오류를 예외 대신 안내 문자열/빈 리포트로 반환하므로 결과로 성공 여부를 판정합니다.
+    """
+    return {
+        "stt": (lambda: services["stt"].transcribe_from_bytes(audio, "bench.wav"),
+                lambda text: bool(text) and not text.startswith(("오류", "오디오 데이터 처리 중 오류"))),
+        "moderation": (lambda: services["moderation"].check_text_safety(SAMPLE_DREAM),
+                       lambda result: "error" not in result.get("details", {})),
+        "report": (lambda: services["report"].generate_report_with_fallback(SAMPLE_DREAM),
+                   lambda report: bool(report.get("emotions"))),
+        "nightmare": (lambda: services["analyzer"].create_nightmare_prompt(SAMPLE_DREAM, SAMPLE_REPORT),
+                      lambda prompt: bool(prompt)),
+        "reconstruction": (lambda: services["analyzer"].create_reconstructed_prompt_and_analysis(SAMPLE_DREAM, SAMPLE_REPORT),
+                           lambda result: bool(result[0])),
+        "image": (lambda: services["image"].generate_image_from_prompt("A calm meadow at dawn."),
+                  lambda url: url.startswith("http")),
+    }
+
+
+def _timed(call, ok):
+    start = time.perf_counter()
+    try:
+        success = ok(call())
+    except Exception:
+        success = False
+    return time.perf_counter() - start, success
+
+
+def run(call, ok, calls: int, concurrency: int):
+    """calls번 호출을 concurrency개 스레드로 실행하고 (지연 시간 목록, 오류 수, 경과 시간)을 반환합니다."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _timed(call, ok), range(calls)))
+    elapsed = time.perf_counter() - start
+    return [seconds for seconds, _ in results], sum(1 for _, success in results if not success), elapsed
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 대역 서버 기반 서비스별 마이크로벤치마크")
+    parser.add_argument("--services", default=",".join(SERVICES), help=f"측정할 서비스 ({', '.join(SERVICES)})")
+    parser.add_argument("--calls", type=int, default=20, help="동시성 수준마다 실행할 호출 수")
+    parser.add_argument("--concurrency", default="1,4,16", help="동시 실행 스레드 수 목록")
+    parser.add_argument("--moderation-mode", default="off", help="검열 사전 필터 모드 (off면 항상 API 경로 측정)")
+    parser.add_argument("--cache", action="store_true", help="공유 캐시와 동일 요청 합치기 사용 (기본값은 끄고 매번 서비스 경로 측정)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.cache:
+        shared_cache.enabled = False # 같은 입력을 반복하므로 캐시를 켜면 첫 호출 이후는 캐시 적중만 측정됨
+        shared_cache.flights.enabled = False # 동시 스레드가 같은 입력을 보내도 각각 서비스 경로를 거치도록
+    server = start_fake_server(config_from_args(args))
+    base_url = use_fake_server(server)
+    print(f"OpenAI 대역 서버: {base_url}")
+    calls = service_calls(build_services(moderation_mode=args.moderation_mode), silent_wav())
+
+    print(f"{'service':<16}{'conc':>5}{'calls':>7}{'errors':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}{'calls/s':>9}")
+    for name in [name.strip() for name in args.services.split(",") if name.strip()]:
+        call, ok = calls[name]
+        _timed(call, ok) # 워밍업 (체인/커넥션 준비)
+        for concurrency in [int(value) for value in args.concurrency.split(",")]:
+            latencies, errors, elapsed = run(call, ok, args.calls, concurrency)
+            print(f"{name:<16}{concurrency:>5}{len(latencies):>7}{errors:>8}"
+                  f"{_percentile(latencies, 0.50) * 1000:>10.1f}{_percentile(latencies, 0.95) * 1000:>10.1f}"
+                  f"{_percentile(latencies, 0.99) * 1000:>10.1f}{statistics.mean(latencies) * 1000:>10.1f}{len(latencies) / elapsed:>9.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
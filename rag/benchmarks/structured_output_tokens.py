@@ -0,0 +1,106 @@
+"""
+PydanticOutputParser 형식 지시어 방식과 구조화 출력(with_structured_output) 방식의
+입력 토큰 수를 비교하는 벤치마크입니다.
+
+- 기본 실행: 프롬프트에서 제거된 형식 지시어의 토큰 수와, 구조화 출력이 대신 전송하는 JSON 스키마의 토큰 수를 계산합니다. (API 호출 없음)
+- --live: 같은 꿈 텍스트로 두 방식을 실제 호출하여 usage_metadata의 입력/출력 토큰과 지연 시간을 비교합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.structured_output_tokens
+    python -m benchmarks.structured_output_tokens --live --repeat 3
+"""
+import argparse
+import json
+import statistics
+import time
+
+from langchain.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from core import config
+from core.context_packing import count_tokens
+from services.dream_analyzer_service import ReconstructionOutput
+from services.report_generator_service import Report
+
+SAMPLE_DREAM = "어두운 숲에서 누군가에게 쫓기다가 절벽에서 떨어졌어요. 깨어나 보니 이가 빠져 있는 느낌이었어요."
+SAMPLE_CONTEXT = "쫓기는 꿈은 현실에서 피하고 싶은 문제나 스트레스가 있음을 나타냅니다."
+REPORT_PROMPT = """
+You are an AI dream analyst who is an expert in IRT and dream symbolism.
+Analyze the user's dream by referring to the provided [Professional Knowledge].
+All parts of the report (emotions, keywords, summary) MUST be in Korean.
+{format_instructions}
+
+[Professional Knowledge]
+{context}
+
+[User's Dream Text]
+{dream_text}
+"""
+
+
+def compare_offline():
+    """모델별로 형식 지시어와 JSON 스키마의 토큰 수를 비교합니다."""
+    print(f"{'model':<24}{'format instr.':>15}{'json schema':>14}{'saved':>8}")
+    for model in (Report, ReconstructionOutput):
+        instructions = PydanticOutputParser(pydantic_object=model).get_format_instructions()
+        schema = json.dumps(model.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+        instruction_tokens, schema_tokens = count_tokens(instructions), count_tokens(schema)
+        print(f"{model.__name__:<24}{instruction_tokens:>15}{schema_tokens:>14}{instruction_tokens - schema_tokens:>8}")
+
+
+def _run(chain, inputs, repeat):
+    usages, latencies, failures = [], [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            usages.append(chain.invoke(inputs))
+        except Exception as e:
+            print(f"  호출 실패: {e}")
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return usages, latencies, failures
+
+
+def compare_live(repeat: int):
+    """리포트 체인을 두 방식으로 실제 호출하여 usage_metadata를 비교합니다."""
+    llm = ChatOpenAI(model="gpt-4o", api_key=config.API_KEY, temperature=0.3)
+    parser = PydanticOutputParser(pydantic_object=Report)
+    inputs = {"context": SAMPLE_CONTEXT, "dream_text": SAMPLE_DREAM}
+
+    # 형식 지시어 방식: 원시 응답(AIMessage)의 usage를 보고, 파싱 실패도 함께 집계
+    legacy_prompt = ChatPromptTemplate.from_template(
+        REPORT_PROMPT, partial_variables={"format_instructions": parser.get_format_instructions()}
+    )
+    legacy_chain = legacy_prompt | llm | (lambda message: (message, parser.parse(message.content)))
+    # 구조화 출력 방식: include_raw로 원시 응답의 usage 확인
+    structured_prompt = ChatPromptTemplate.from_template(REPORT_PROMPT.replace("{format_instructions}\n", ""))
+    structured_chain = structured_prompt | llm.with_structured_output(Report, method="json_schema", strict=True, include_raw=True) \
+        | (lambda result: (result["raw"], result["parsed"]))
+
+    print(f"{'path':<14}{'runs':>6}{'input tok':>11}{'output tok':>12}{'p50(s)':>9}{'failures':>10}")
+    for name, chain in (("format_instr", legacy_chain), ("structured", structured_chain)):
+        results, latencies, failures = _run(chain, inputs, repeat)
+        if not results:
+            print(f"{name:<14}{0:>6}{'-':>11}{'-':>12}{'-':>9}{failures:>10}")
+            continue
+        input_tokens = statistics.mean(raw.usage_metadata["input_tokens"] for raw, _ in results)
+        output_tokens = statistics.mean(raw.usage_metadata["output_tokens"] for raw, _ in results)
+        print(f"{name:<14}{len(results):>6}{input_tokens:>11.0f}{output_tokens:>12.0f}{statistics.median(latencies):>9.2f}{failures:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="형식 지시어 vs 구조화 출력 토큰 비교")
+    parser.add_argument("--live", action="store_true", help="실제 API를 호출하여 usage_metadata 비교")
+    parser.add_argument("--repeat", type=int, default=3, help="--live에서 방식별 호출 횟수")
+    args = parser.parse_args()
+
+    compare_offline()
+    if args.live:
+        print()
+        compare_live(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+STT 엔진별 지연 시간과 실시간 배율(RTF)을 비교하는 벤치마크입니다.
+RTF = 변환 소요 시간 / 음성 길이 (1보다 작을수록 실시간보다 빠름)
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.stt_benchmark --audio-dir user_data/audio_samples --repeat 3
+"""
+import argparse
+import os
+import statistics
+import time
+from io import BytesIO
+
+from openai import OpenAI
+
+from core import config
+from services.stt_backends import LocalWhisperBackend, WhisperAPIBackend, estimate_audio_duration
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg")
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_benchmark(backends, audio_files, repeat: int):
+    """
+    각 엔진으로 모든 파일을 repeat번 변환하고 엔진별 통계를 반환합니다.
+    :return: {엔진 이름: {"latencies": [...], "rtfs": [...], "errors": int}}
+    """
+    results = {backend.name: {"latencies": [], "rtfs": [], "errors": 0} for backend in backends}
+    for path in audio_files:
+        with open(path, "rb") as f:
+            audio_bytes = f.read()
+        for backend in backends:
+            for _ in range(repeat):
+                buffer = BytesIO(audio_bytes)
+                buffer.name = os.path.basename(path)
+                duration = estimate_audio_duration(buffer)
+                start = time.perf_counter()
+                try:
+                    backend.transcribe(buffer)
+                except Exception as e:
+                    print(f"  [{backend.name}] {path} 변환 실패: {e}")
+                    results[backend.name]["errors"] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                results[backend.name]["latencies"].append(elapsed)
+                if duration:
+                    results[backend.name]["rtfs"].append(elapsed / duration)
+    return results
+
+
+def print_report(results):
+    print(f"{'backend':<14}{'runs':>6}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}{'mean RTF':>10}{'errors':>8}")
+    for name, stats in results.items():
+        latencies = stats["latencies"]
+        if not latencies:
+            print(f"{name:<14}{0:>6}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{stats['errors']:>8}")
+            continue
+        mean_rtf = statistics.mean(stats["rtfs"]) if stats["rtfs"] else float("nan")
+        print(
+            f"{name:<14}{len(latencies):>6}"
+            f"{_percentile(latencies, 0.50):>10.2f}{_percentile(latencies, 0.95):>10.2f}{_percentile(latencies, 0.99):>10.2f}"
+            f"{mean_rtf:>10.3f}{stats['errors']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STT 엔진 지연 시간 / RTF 벤치마크")
+    parser.add_argument("--audio-dir", required=True, help="벤치마크에 사용할 오디오 파일 디렉토리")
+    parser.add_argument("--repeat", type=int, default=1, help="파일당 반복 횟수")
+    parser.add_argument("--backends", default="remote,local", help="비교할 엔진 목록 (remote, local)")
+    args = parser.parse_args()
+
+    audio_files = sorted(
+        os.path.join(args.audio_dir, name) for name in os.listdir(args.audio_dir)
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    if not audio_files:
+        print(f"'{args.audio_dir}'에서 오디오 파일을 찾을 수 없습니다.")
+        return
+
+    backends = []
+    selected = [name.strip() for name in args.backends.split(",")]
+    if "remote" in selected:
+        backends.append(WhisperAPIBackend(OpenAI(api_key=config.API_KEY)))
+    if "local" in selected:
+        local_backend = LocalWhisperBackend(
+            config.STT_LOCAL_MODEL_PATH,
+            compute_type=config.STT_LOCAL_COMPUTE_TYPE,
+            cpu_threads=config.STT_LOCAL_CPU_THREADS,
+        )
+        if local_backend.is_available():
+            backends.append(local_backend)
+        else:
+            print(f"로컬 모델이 없어 local 엔진을 건너뜁니다: {config.STT_LOCAL_MODEL_PATH}")
+
+    print(f"{len(audio_files)}개 파일 x {args.repeat}회, 엔진: {[b.name for b in backends]}")
+    print_report(run_benchmark(backends, audio_files, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+core.tracing이 내보낸 OTLP/JSON span 파일을 읽어 단계별 p50/p95/p99 지연 시간을 출력합니다.
+
+사용법 (rag 폴더에서 실행):
+    python -m benchmarks.trace_summary
+    python -m benchmarks.trace_summary --path user_data/traces/spans.jsonl --session <세션 ID>
+"""
+import argparse
+import json
+import statistics
+
+from core import config
+
+
+def load_spans(path, session=None):
+    """파일의 모든 span을 (이름, 초, 속성) 목록으로 반환합니다."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for span in scope["spans"]:
+                        attributes = {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+                        if session and attributes.get("session.id") != session:
+                            continue
+                        seconds = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e9
+                        spans.append((span["name"], seconds, attributes))
+    return spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="단계별 지연 시간 분위수 요약")
+    parser.add_argument("--path", default=config.TRACE_EXPORT_PATH)
+    parser.add_argument("--session", help="이 세션 ID의 span만 집계")
+    args = parser.parse_args()
+
+    by_stage = {}
+    for name, seconds, _ in load_spans(args.path, args.session):
+        by_stage.setdefault(name, []).append(seconds)
+
+    print(f"{'stage':<58}{'count':>7}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}{'total(s)':>10}")
+    # 누적 시간이 큰 단계부터 출력 (최적화 우선순위)
+    for name, samples in sorted(by_stage.items(), key=lambda item: -sum(item[1])):
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        print(f"{name:<58}{len(ordered):>7}{statistics.median(ordered):>9.3f}{p95:>9.3f}{p99:>9.3f}{sum(ordered):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from typing import List
+from langchain_core.embeddings import Embeddings # LangChain 임베딩 인터페이스
+
+from core import config
+from core.context_packing import count_tokens
+from core.deadline import remaining_or_none
+from core.micro_batcher import MicroBatcher, get_batcher
+from core.rate_limiter import estimate_tokens
+from core.resilience import call_with_resilience
+from core.shared_cache import shared_cache
+from core.tracing import traced
+from core.usage_store import embedding_cost, usage_store
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    쿼리 임베딩(embed_query)을 프로세스 공용 마이크로 배처로 모아
+    embed_documents 한 번의 호출로 처리하는 임베딩 래퍼입니다.
+    FAISS 벡터 스토어에 그대로 전달하여 사용할 수 있습니다.
+    """
+    def __init__(self, base: Embeddings, batcher_name: str = "embeddings"):
+        """
+        :param base: 실제 임베딩 객체 (예: OpenAIEmbeddings)
+        :param batcher_name: 공용 배처 이름 (같은 이름과 같은 base 객체는 같은 배처를 공유)
+        """
+        self.base = base
+        self.batcher = get_batcher(batcher_name, id(base), lambda: MicroBatcher(
+            self._embed_batch,
+            max_batch_size=config.MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=config.MICRO_BATCH_MAX_WAIT_MS,
+            default_timeout=config.MICRO_BATCH_CALL_TIMEOUT_SECONDS,
+            name=batcher_name,
+        ))
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        def request():
+            return self.base.embed_documents(texts)
+        # 공용 스케줄러에서 예산을 확보한 뒤 호출
+        return call_with_resilience("BatchedEmbeddings.embed_batch", "embeddings", request, tokens=estimate_tokens(*texts))
+
+    def _record_usage(self, stage: str, texts: List[str]) -> None:
+        # 배처 스레드가 아닌 호출자 쪽에서 기록해야 세션별로 집계됨 (requests는 호출 수, 실제 API 요청은 배치로 묶임)
+        tokens = sum(count_tokens(text) for text in texts)
+        usage_store.record(stage, self.model_name, requests=1, input_tokens=tokens, cost_usd=embedding_cost(tokens))
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.base, "model", "embeddings")
+
+    @traced()
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 문서 임베딩은 이미 배치 요청이므로 배처를 거치지 않고 전달
+        vectors = self._embed_batch(texts)
+        self._record_usage("embeddings.documents", texts)
+        return vectors
+
+    @shared_cache.cached("embedding", key=lambda self, text: (self.model_name, text))
+    @traced()
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.batcher.call(text, timeout=remaining_or_none()) # 요청의 남은 예산만큼만 대기
+        self._record_usage("embeddings.query", [text])
+        return vector
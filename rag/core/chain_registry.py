@@ -0,0 +1,47 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ChainRegistry:
+    """
+    미리 구성한 LCEL 체인을 (체인 이름, 템플릿 버전)으로 보관하는 저장소입니다.
+    서비스 초기화 시 체인을 한 번만 구성하고, 이후 호출과 스레드에서는 같은 체인을 재사용합니다.
+    (LCEL 체인은 상태를 갖지 않으므로 여러 스레드에서 동시에 invoke해도 안전합니다.)
+    """
+    def __init__(self):
+        self._chains: Dict[Tuple[str, str], Any] = {}
+        self._latest: Dict[str, str] = {} # 체인 이름 → 가장 최근에 등록된 버전
+        self._lock = threading.Lock()
+
+    def register(self, name: str, version: str, chain: Any) -> Any:
+        """체인을 등록합니다. 같은 (이름, 버전)이 이미 있으면 기존 체인을 유지하고 반환합니다."""
+        with self._lock:
+            key = (name, version)
+            if key not in self._chains:
+                self._chains[key] = chain
+            self._latest[name] = version
+            return self._chains[key]
+
+    def get_or_build(self, name: str, version: str, builder: Callable[[], Any]) -> Any:
+        """등록된 체인을 반환하고, 없으면 builder로 한 번만 구성하여 등록합니다."""
+        with self._lock:
+            chain = self._chains.get((name, version))
+        if chain is not None:
+            return chain
+        return self.register(name, version, builder())
+
+    def get(self, name: str, version: Optional[str] = None) -> Any:
+        """
+        :param name: 체인 이름
+        :param version: 템플릿 버전 (없으면 가장 최근에 등록된 버전)
+        :raises KeyError: 등록되지 않은 체인인 경우
+        """
+        with self._lock:
+            version = version or self._latest.get(name)
+            if (name, version) not in self._chains:
+                raise KeyError(f"등록되지 않은 체인입니다: {name} ({version})")
+            return self._chains[(name, version)]
+
+    def keys(self):
+        with self._lock:
+            return list(self._chains)
@@ -3,4 +3,171 @@ from dotenv import load_dotenv # .env 파일 로드를 위한 load_dotenv 함수
 
 load_dotenv() # .env 파일의 환경 변수 로드
 
-API_KEY = os.environ.get("OPENAI_API_KEY") # 환경 변수에서 "OPENAI_API_KEY" 값을 가져와 API_KEY에 할당
\ No newline at end of file
+API_KEY = os.environ.get("OPENAI_API_KEY") # 환경 변수에서 "OPENAI_API_KEY" 값을 가져와 API_KEY에 할당
+
+# --- STT(음성 인식) 백엔드 설정 ---
+# remote: Whisper API만 사용 / local: 로컬 CPU 엔진만 사용 / auto: 길이 기준으로 라우팅
+STT_BACKEND = os.environ.get("STT_BACKEND", "remote")
+STT_LOCAL_MODEL_PATH = os.environ.get("STT_LOCAL_MODEL_PATH", "models/whisper-small-ct2-int8") # CTranslate2로 변환된 Whisper 모델 경로
+STT_LOCAL_COMPUTE_TYPE = os.environ.get("STT_LOCAL_COMPUTE_TYPE", "int8") # 양자화 타입 (int8, int8_float32 등)
+STT_LOCAL_CPU_THREADS = int(os.environ.get("STT_LOCAL_CPU_THREADS", "0")) # 0이면 CTranslate2 기본값 사용
+STT_LOCAL_MAX_SECONDS = float(os.environ.get("STT_LOCAL_MAX_SECONDS", "30")) # 이 길이 이하의 짧은 음성만 로컬에서 처리
+
+# --- 콘텐츠 검열(Moderation) 사전 필터 설정 ---
+# off: 항상 API 호출 / shadow: 항상 API 호출 + 사전 필터 판정과 비교 / enforce: 일치율이 검증된 명백한 경우만 API 호출 생략
+MODERATION_PREFILTER_MODE = os.environ.get("MODERATION_PREFILTER_MODE", "shadow")
+MODERATION_ENFORCE_MIN_SAMPLES = int(os.environ.get("MODERATION_ENFORCE_MIN_SAMPLES", "500")) # enforce 모드에서 판정별로 API와 이만큼 비교한 뒤부터 API 호출 생략
+MODERATION_ENFORCE_MIN_AGREEMENT = float(os.environ.get("MODERATION_ENFORCE_MIN_AGREEMENT", "0.995")) # 판정별 API 일치율이 이 값 이상일 때만 API 호출 생략
+MODERATION_SHADOW_SAMPLE_RATE = float(os.environ.get("MODERATION_SHADOW_SAMPLE_RATE", "0.05")) # enforce 모드에서 백그라운드로 API 판정과 비교할 비율
+
+# --- 마이크로 배칭 설정 (Moderation / 쿼리 임베딩) ---
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", "32")) # 한 번에 보낼 최대 입력 수
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", "10")) # 배치를 모으는 최대 대기 시간(밀리초)
+MICRO_BATCH_CALL_TIMEOUT_SECONDS = float(os.environ.get("MICRO_BATCH_CALL_TIMEOUT_SECONDS", "30")) # 요청 예산이 없는 호출자가 배치 결과를 기다리는 최대 시간(초)
+
+# --- OpenAI 호출 속도 제한(클라이언트 측 스케줄러) 설정 ---
+# 엔드포인트별 (분당 요청 수 RPM, 분당 토큰 수 TPM). 0은 제한 없음. 실제 한도는 응답 헤더로 자동 보정됩니다.
+RATE_LIMITS = {
+    "whisper-1": (int(os.environ.get("RPM_WHISPER", "50")), 0),
+    "moderation": (int(os.environ.get("RPM_MODERATION", "1000")), int(os.environ.get("TPM_MODERATION", "150000"))),
+    "gpt-4o": (int(os.environ.get("RPM_GPT4O", "500")), int(os.environ.get("TPM_GPT4O", "30000"))),
+    "gpt-4o-mini": (int(os.environ.get("RPM_GPT4O_MINI", "500")), int(os.environ.get("TPM_GPT4O_MINI", "200000"))),
+    "embeddings": (int(os.environ.get("RPM_EMBEDDINGS", "3000")), int(os.environ.get("TPM_EMBEDDINGS", "1000000"))),
+    "dall-e-3": (int(os.environ.get("RPM_DALLE3", "5")), 0),
+}
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "30")) # 이 시간보다 오래 기다려야 하면 예상 대기 시간을 반환
+
+# --- 재시도 / 헤징 / 회로 차단기 설정 ---
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5")) # 연속 실패 몇 번에 차단할지
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30")) # 차단 후 시험 요청까지 대기 시간(초)
+# 서비스 메서드별 정책 (core.resilience.ResiliencePolicy의 필드). 없는 항목은 기본값 사용.
+# timeout은 HTTP 요청 자체의 제한 시간으로 적용되며, 속도 제한 대기 시간은 포함하지 않습니다.
+# DALL-E는 비용 문제로 헤징하지 않고, 서버가 이미 생성 중일 수 있는 타임아웃/연결 오류는 재시도하지 않습니다. (idempotent: False)
+RESILIENCE_POLICIES = {
+    "STTService.transcribe": {"max_attempts": 3, "timeout": 60},
+    "ModerationService.moderate_batch": {"max_attempts": 3, "timeout": 10, "hedge": True},
+    "BatchedEmbeddings.embed_batch": {"max_attempts": 3, "timeout": 10, "hedge": True},
+    "ReportGeneratorService.generate_report_with_rag": {"max_attempts": 2, "timeout": 60},
+    "ReportGeneratorService.generate_report": {"max_attempts": 2, "timeout": 30},
+    "DreamAnalyzerService.create_nightmare_prompt": {"max_attempts": 3, "timeout": 45, "hedge": True},
+    "DreamAnalyzerService.create_reconstructed_prompt_and_analysis": {"max_attempts": 3, "timeout": 60, "hedge": True},
+    "ImageGeneratorService.generate_image_from_prompt": {"max_attempts": 3, "timeout": 90, "idempotent": False},
+    "FusedAnalysisService.analyze": {"max_attempts": 2, "timeout": 75},
+}
+
+# --- 요청 지연 시간 예산 ---
+DREAM_REQUEST_BUDGET_SECONDS = float(os.environ.get("DREAM_REQUEST_BUDGET_SECONDS", "90")) # 사용자 동작 하나(전사, 분석, 이미지 생성)에 허용하는 전체 시간(초)
+PIPELINE_STAGE_WORKERS = int(os.environ.get("PIPELINE_STAGE_WORKERS", "16")) # Streamlit 스크립트 밖에서 파이프라인 단계를 실행하는 스레드 수 (모든 세션 공용)
+PIPELINE_STAGE_POLL_SECONDS = float(os.environ.get("PIPELINE_STAGE_POLL_SECONDS", "0.2")) # 단계가 끝나기를 기다리는 동안 재실행(새 입력) 요청을 확인하는 간격(초)
+
+# --- RAG 검색 및 컨텍스트 구성 ---
+RAG_SEARCH_TYPE = os.environ.get("RAG_SEARCH_TYPE", "similarity_score_threshold") # similarity / mmr / similarity_score_threshold
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "4")) # 컨텍스트 후보 청크 수
+RAG_FETCH_K = int(os.environ.get("RAG_FETCH_K", "20")) # MMR / 임계값 검색에서 먼저 가져올 후보 수
+RAG_MMR_LAMBDA = float(os.environ.get("RAG_MMR_LAMBDA", "0.5")) # MMR 관련도-다양성 가중치
+RAG_SCORE_THRESHOLD = float(os.environ.get("RAG_SCORE_THRESHOLD", "0.3")) # 이 관련도(0~1) 미만의 청크는 제외
+RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "1200")) # 리포트 프롬프트에 넣을 컨텍스트 최대 토큰 수
+RAG_KEYWORD_TOP_K = int(os.environ.get("RAG_KEYWORD_TOP_K", "2")) # 키워드별 상징 검색 후보 청크 수
+RAG_KEYWORD_TOKEN_BUDGET = int(os.environ.get("RAG_KEYWORD_TOKEN_BUDGET", "1000")) # 재구성 프롬프트에 넣을 키워드 상징 컨텍스트 최대 토큰 수
+
+# --- 분석 모드 ---
+# staged: 리포트 → 악몽 프롬프트 → 재구성을 단계별 호출 / fused: 한 번의 구조화 출력 호출로 모두 생성 (실패 시 staged로 진행)
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "staged")
+
+# --- 단계별 모델 라우팅 ---
+MODEL_TIERS = ["gpt-4o-mini", "gpt-4o"] # 가벼운 모델 → 강한 모델 순서 (검증 실패 시 다음 모델로 상향)
+STAGE_MODELS = { # 단계별 기본 모델
+    "report": os.environ.get("MODEL_REPORT", "gpt-4o-mini"), # 감정/키워드 추출 및 요약
+    "nightmare": os.environ.get("MODEL_NIGHTMARE", "gpt-4o-mini"),
+    "reconstruction": os.environ.get("MODEL_RECONSTRUCTION", "gpt-4o"), # 재구성 품질이 중요하므로 강한 모델 사용
+    "fused": os.environ.get("MODEL_FUSED", "gpt-4o"),
+}
+STAGE_LATENCY_SLO_SECONDS = { # 단계별 p95 지연 시간 목표(초), 넘으면 한 단계 가벼운 모델로 하향
+    "report": float(os.environ.get("SLO_REPORT", "10")),
+    "nightmare": float(os.environ.get("SLO_NIGHTMARE", "8")),
+    "reconstruction": float(os.environ.get("SLO_RECONSTRUCTION", "15")),
+    "fused": float(os.environ.get("SLO_FUSED", "20")),
+}
+MODEL_DOWNGRADE_SECONDS = float(os.environ.get("MODEL_DOWNGRADE_SECONDS", "300")) # SLO 위반 시 가벼운 모델을 사용하는 시간(초)
+MODEL_PRICES = { # 100만 토큰당 가격(USD), 비용 기록용
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+
+# --- 리포트 경로 대체 (RAG → 일반) ---
+# race: RAG/일반 리포트를 동시에 시작 / fallback: RAG가 기한을 넘기거나 실패한 뒤 일반 리포트 시작 / off: RAG만 사용
+REPORT_FALLBACK_MODE = os.environ.get("REPORT_FALLBACK_MODE", "fallback")
+REPORT_RAG_DEADLINE_SECONDS = float(os.environ.get("REPORT_RAG_DEADLINE_SECONDS", "12")) # RAG 리포트를 기다리는 시간(초)
+
+# --- 단계별 지연 시간 추적 ---
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "user_data/traces/spans.jsonl") # OTLP/JSON span 파일 경로 (빈 값이면 내보내지 않음)
+TRACE_EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024))) # span 파일이 이 크기를 넘으면 교체 (0이면 제한 없음)
+TRACE_EXPORT_BACKUPS = int(os.environ.get("TRACE_EXPORT_BACKUPS", "3")) # 보관할 이전 span 파일 수 (spans.jsonl.1 ~ .N)
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "dreamcode-rag") # span의 service.name
+TRACE_HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120] # 지연 시간 히스토그램 경계(초)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464")) # Prometheus 텍스트 지표 포트 (0이면 사용 안 함)
+
+# --- 사용량 및 비용 기록 ---
+USAGE_DB_PATH = os.environ.get("USAGE_DB_PATH", "user_data/usage.sqlite3") # 세션/단계/날짜별 사용량 SQLite 파일
+EMBEDDING_PRICE_PER_1M = float(os.environ.get("EMBEDDING_PRICE_PER_1M", "0.10")) # 임베딩 100만 토큰당 가격(USD, text-embedding-ada-002)
+AUDIO_PRICES_PER_MINUTE = {"whisper-1": 0.006} # 음성 1분당 가격(USD)
+IMAGE_PRICES = { # 이미지 1장당 가격(USD), "크기/품질"별
+    "dall-e-3": {"1024x1024/standard": 0.040, "1024x1792/standard": 0.080, "1792x1024/standard": 0.080,
+                 "1024x1024/hd": 0.080, "1024x1792/hd": 0.120, "1792x1024/hd": 0.120},
+}
+
+# --- 로깅 ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper() # DEBUG / INFO / WARNING / ERROR
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json") # json: 한 줄 JSON 레코드 / text: 사람이 읽기 쉬운 형식
+LOG_FILE = os.environ.get("LOG_FILE", "") # 빈 값이면 표준 출력
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.05")) # DEBUG 레코드를 남기는 비율
+LOG_USAGE_SAMPLE_RATE = float(os.environ.get("LOG_USAGE_SAMPLE_RATE", "0.05")) # 호출별 토큰/모델 기록(INFO)을 남기는 비율 (누적값은 지표 서버에서 제공)
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000")) # 출력 대기 큐 크기, 가득 차면 레코드를 버림
+
+# --- 파이프라인 API 서버 ---
+PIPELINE_API_URL = os.environ.get("PIPELINE_API_URL", "") # 설정하면 Streamlit 앱은 이 API 서버의 클라이언트로만 동작 (빈 값이면 앱 프로세스 안에서 서비스 실행)
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_WORKERS = int(os.environ.get("API_WORKERS", "2")) # 서버 프로세스(워커) 수
+API_THREADS = int(os.environ.get("API_THREADS", "32")) # 워커당 서비스 호출을 실행할 스레드 수 (동시에 처리할 요청 수)
+# /v1/* 요청에 필요한 Bearer 토큰 목록 (쉼표로 구분, 교체 중에는 새 토큰과 이전 토큰을 함께 설정). 비어 있으면 서버가 시작하지 않음
+API_AUTH_TOKENS = [token.strip() for token in os.environ.get("API_AUTH_TOKENS", "").split(",") if token.strip()]
+PIPELINE_API_TOKEN = os.environ.get("PIPELINE_API_TOKEN", "") # 앱/일괄 처리가 API 서버에 보낼 Bearer 토큰
+API_MAX_UPLOAD_BYTES = int(os.environ.get("API_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024))) # /v1/transcribe 본문 최대 크기 (Whisper API 제한 25MB)
+
+# --- 일괄 처리 (batch_process.py) ---
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4")) # 동시에 처리할 녹음 파일 수
+BATCH_ITEM_BUDGET_SECONDS = float(os.environ.get("BATCH_ITEM_BUDGET_SECONDS", "900")) # 파일 하나(전체 단계)에 허용하는 시간(초)
+BATCH_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("BATCH_RATE_LIMIT_MAX_WAIT_SECONDS", "600")) # 일괄 처리는 속도 제한에 걸리면 실패 대신 이 시간까지 대기
+BATCH_IMAGE_DOWNLOAD_TIMEOUT_SECONDS = float(os.environ.get("BATCH_IMAGE_DOWNLOAD_TIMEOUT_SECONDS", "60")) # 생성된 이미지 파일 다운로드 제한 시간(초)
+
+# --- 공유 캐시 (프로세스 안 LRU + 레플리카 공용 저장소) ---
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite") # sqlite: WAL 파일 / redis: Redis 호환 서버(redis 패키지 필요) / memory: LRU만 / off: 캐시 사용 안 함
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "user_data/cache.sqlite3") # 여러 레플리카가 공유하려면 공유 볼륨 경로 지정
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_LRU_SIZE = int(os.environ.get("CACHE_LRU_SIZE", "2048")) # 프로세스 안 LRU 최대 항목 수
+CACHE_TTL_SECONDS = { # 네임스페이스(단계)별 보관 시간(초)
+    "transcript": 30 * 86400, # 같은 녹음의 전사 결과는 바뀌지 않음
+    "moderation": 7 * 86400,
+    "embedding": 30 * 86400,
+    "report": 7 * 86400,
+    "analysis": 7 * 86400,
+    "nightmare_prompt": 7 * 86400,
+    "reconstruction": 7 * 86400,
+    "image": 50 * 60, # DALL-E 이미지 URL은 약 1시간 뒤 만료되므로 그 전에 버림
+    "default": 3600,
+}
+
+# --- 세션 결과 저장 (새로고침/재연결 시 복원) ---
+SESSION_STORE_BACKEND = os.environ.get("SESSION_STORE_BACKEND", "sqlite") # sqlite / redis(CACHE_REDIS_URL 사용) / off
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "user_data/sessions.sqlite3") # 레플리카 간 복원이 필요하면 공유 볼륨 경로 지정
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(7 * 86400))) # 마지막 저장 후 보관 시간(초)
+SESSION_QUERY_PARAM = os.environ.get("SESSION_QUERY_PARAM", "session") # 재개 토큰을 담는 URL 쿼리 파라미터 이름
+SESSION_COOKIE_NAME = os.environ.get("SESSION_COOKIE_NAME", "dreamcode_owner") # 재개 토큰을 발급받은 브라우저임을 확인하는 비밀값 쿠키 이름
+
+# --- 동일 요청 합치기 (single-flight) 및 중복 제출 방지 ---
+SINGLE_FLIGHT_SCOPE = os.environ.get("SINGLE_FLIGHT_SCOPE", "shared") # shared: 공유 캐시 저장소로 레플리카 사이에서도 합침 / process: 프로세스 안에서만
+SINGLE_FLIGHT_LOCK_SECONDS = float(os.environ.get("SINGLE_FLIGHT_LOCK_SECONDS", "120")) # 다른 레플리카의 실행을 기다리는 최대 시간(초, 이미지 생성보다 길게)
+SINGLE_FLIGHT_RESULT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_RESULT_SECONDS", "60")) # 다른 레플리카를 위해 결과를 게시해 두는 시간(초)
+DOUBLE_SUBMIT_SECONDS = float(os.environ.get("DOUBLE_SUBMIT_SECONDS", "5")) # 같은 버튼 동작이 끝난 뒤 이 시간 안에 다시 들어오면 무시(초)
@@ -0,0 +1,187 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np # FAISS 다중 쿼리 검색용 벡터 배열
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from core import config
+from core.tracing import traced
+
+MIN_OVERLAP_CHARS = 20 # 이보다 짧은 겹침은 우연한 일치로 보고 제거하지 않음
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken # 인덱싱/검색 시에만 필요하므로 지연 임포트
+    return tiktoken.encoding_for_model("gpt-4o")
+
+
+def count_tokens(text: str) -> int:
+    """gpt-4o 토크나이저 기준 토큰 수"""
+    return len(_encoding().encode(text))
+
+
+def chunk_token_count(doc: Document) -> int:
+    """
+    인덱싱 시 metadata에 저장한 토큰 수를 사용합니다.
+    이전 버전 인덱스처럼 값이 없으면 한 번 계산하여 metadata에 캐시합니다.
+    """
+    if "token_count" not in doc.metadata:
+        doc.metadata["token_count"] = count_tokens(doc.page_content)
+    return doc.metadata["token_count"]
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """left의 끝부분과 right의 시작 부분이 겹치는 가장 긴 길이 (청크 분할 시의 chunk_overlap)"""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _strip_overlap(text: str, kept: List[str]) -> str:
+    """이미 선택된 청크와 겹치는 앞/뒤 구간을 잘라냅니다."""
+    for other in kept:
+        head = _overlap_length(other, text)
+        if head:
+            text = text[head:]
+        tail = _overlap_length(text, other)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+
+def pack_documents(scored_docs: List[Tuple[Document, float]], token_budget: int) -> List[Document]:
+    """
+    검색된 (문서, 관련도 점수) 목록을 LLM에 넣을 컨텍스트로 정리합니다.
+    - 관련도 점수가 높은 순서로 정렬
+    - 내용이 같은 청크와 다른 청크에 포함된 청크는 제거
+    - 인접 청크와 겹치는(chunk_overlap) 구간은 한 번만 남김
+    - 캐시된 청크별 토큰 수로 token_budget을 넘지 않을 때까지 채움
+    :return: 정리된 문서 목록 (metadata에 score와 조정된 token_count 포함)
+    """
+    packed, kept_texts, seen = [], [], set()
+    used_tokens = 0
+    for doc, score in sorted(scored_docs, key=lambda pair: pair[1], reverse=True):
+        original = doc.page_content.strip()
+        digest = hashlib.sha1(original.encode("utf-8")).hexdigest()
+        if digest in seen or any(original in other for other in kept_texts):
+            continue
+        seen.add(digest)
+        text = _strip_overlap(original, kept_texts)
+        if not text:
+            continue
+        tokens = chunk_token_count(doc)
+        if len(text) < len(original):
+            tokens = max(1, round(tokens * len(text) / len(original))) # 잘라낸 비율만큼 캐시된 토큰 수를 조정
+        if used_tokens + tokens > token_budget:
+            continue # 더 짧은 하위 순위 청크는 들어갈 수 있으므로 계속 확인
+        used_tokens += tokens
+        kept_texts.append(original)
+        packed.append(Document(page_content=text, metadata={**doc.metadata, "score": score, "token_count": tokens}))
+    return packed
+
+
+class PackedContextRetriever(BaseRetriever):
+    """
+    FAISS 벡터 스토어에서 유사도 / MMR / 점수 임계값 방식으로 청크를 검색한 뒤
+    pack_documents로 중복과 겹침을 제거하고 토큰 예산에 맞게 잘라 반환하는 검색기입니다.
+    상징 조회 테이블(SymbolLookup)이 있으면 알려진 상징의 섹션을 벡터 검색 결과에 합쳐 함께 정리합니다.
+    기존 retriever 자리에 그대로 사용할 수 있습니다.
+    """
+    vector_store: Any # FAISS 벡터 스토어
+    symbol_lookup: Any = None # (선택 사항) core.symbol_lookup.SymbolLookup
+    search_type: str = config.RAG_SEARCH_TYPE # similarity / mmr / similarity_score_threshold
+    k: int = config.RAG_TOP_K # 최종 후보 청크 수
+    fetch_k: int = config.RAG_FETCH_K # MMR / 임계값 검색에서 먼저 가져올 후보 수
+    lambda_mult: float = config.RAG_MMR_LAMBDA # MMR의 관련도-다양성 가중치 (1이면 관련도만 고려)
+    score_threshold: Optional[float] = config.RAG_SCORE_THRESHOLD # 이 관련도 미만의 청크는 제외
+    token_budget: int = config.RAG_CONTEXT_TOKEN_BUDGET # 컨텍스트 전체의 최대 토큰 수
+
+    @traced()
+    def search(self, query: str) -> List[Tuple[Document, float]]:
+        """검색 방식에 따라 (문서, 0~1 관련도 점수) 목록을 반환합니다."""
+        if self.search_type == "mmr":
+            embedding = self.vector_store.embedding_function.embed_query(query)
+            results = self.vector_store.max_marginal_relevance_search_with_score_by_vector(
+                embedding, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+            )
+            # MMR 결과의 점수는 거리이므로 벡터 스토어의 관련도 함수로 변환
+            relevance = self.vector_store._select_relevance_score_fn()
+            return [(doc, relevance(distance)) for doc, distance in results]
+        if self.search_type == "similarity_score_threshold":
+            results = self.vector_store.similarity_search_with_relevance_scores(
+                query, k=self.fetch_k, score_threshold=self.score_threshold
+            )
+            return results[:self.k]
+        if self.search_type == "similarity":
+            return self.vector_store.similarity_search_with_relevance_scores(query, k=self.k)
+        raise ValueError(f"지원하지 않는 검색 방식입니다: {self.search_type}")
+
+    @traced()
+    def search_by_keywords(self, keywords: List[str], k: int = None, token_budget: int = None) -> Dict[str, List[Document]]:
+        """
+        여러 키워드를 임베딩 배치 호출 한 번과 FAISS 다중 쿼리 검색 한 번으로 처리합니다.
+        여러 키워드에 걸린 청크는 한 번만 포함하고, 전체 결과를 token_budget 안에서 정리한 뒤 키워드별로 나누어 반환합니다.
+        :param keywords: 리포트의 키워드 목록
+        :param k: 키워드당 후보 청크 수 (기본값 config.RAG_KEYWORD_TOP_K)
+        :param token_budget: 전체 키워드 컨텍스트의 최대 토큰 수 (기본값 config.RAG_KEYWORD_TOKEN_BUDGET)
+        :return: 키워드 → 관련 청크 목록 (관련 청크가 없으면 빈 목록)
+        """
+        keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword and keyword.strip()))
+        if not keywords:
+            return {}
+        matches = {} # 문서 식별자 → (문서, 최고 점수, 일치한 키워드 목록)
+
+        # 알려진 상징은 조회 테이블에서 바로 찾고, 나머지 키워드만 벡터 검색
+        unmatched = []
+        for keyword in keywords:
+            known = self.symbol_lookup.lookup(keyword) if self.symbol_lookup is not None else []
+            if not known:
+                unmatched.append(keyword)
+            for doc, score in known:
+                key = f"symbol:{doc.metadata['symbol']}"
+                _, best, matched = matches.get(key) or (doc, score, [])
+                matched.append(keyword)
+                matches[key] = (doc, max(best, score), matched)
+        if unmatched:
+            self._search_keywords_by_vector(unmatched, k or config.RAG_KEYWORD_TOP_K, matches)
+
+        packed = pack_documents(
+            [(Document(page_content=doc.page_content, metadata={**doc.metadata, "keywords": matched}), score)
+             for doc, score, matched in matches.values()],
+            token_budget or config.RAG_KEYWORD_TOKEN_BUDGET,
+        )
+        return {keyword: [doc for doc in packed if keyword in doc.metadata["keywords"]] for keyword in keywords}
+
+    @traced()
+    def _search_keywords_by_vector(self, keywords: List[str], k: int, matches: Dict[str, tuple]) -> None:
+        """키워드들을 임베딩 배치 호출 한 번과 FAISS 다중 쿼리 검색 한 번으로 처리하여 matches에 추가합니다."""
+        store = self.vector_store
+        vectors = np.asarray(store.embedding_function.embed_documents(keywords), dtype=np.float32)
+        if store._normalize_L2:
+            import faiss # 정규화가 필요한 인덱스에서만 사용
+            faiss.normalize_L2(vectors)
+        distances, positions = store.index.search(vectors, k)
+        relevance = store._select_relevance_score_fn()
+        for keyword, row_distances, row_positions in zip(keywords, distances, positions):
+            for distance, position in zip(row_distances, row_positions):
+                if position == -1: # 인덱스의 청크 수보다 k가 큰 경우
+                    continue
+                score = relevance(float(distance))
+                if self.score_threshold is not None and score < self.score_threshold:
+                    continue
+                doc_id = store.index_to_docstore_id[int(position)]
+                doc, best, matched = matches.get(doc_id) or (store.docstore.search(doc_id), score, [])
+                matched.append(keyword)
+                matches[doc_id] = (doc, max(best, score), matched)
+
+    @traced("PackedContextRetriever.retrieve")
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # 꿈 텍스트에는 상징 외의 맥락(IRT 원칙 등)도 필요하므로 벡터 검색은 항상 수행하고,
+        # 알려진 상징의 섹션은 결과에 합쳐 pack_documents에서 중복/겹침과 함께 정리
+        known = self.symbol_lookup.lookup(query) if self.symbol_lookup is not None else []
+        return pack_documents(known + self.search(query), self.token_budget)
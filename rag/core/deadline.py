@@ -0,0 +1,176 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class PipelineCancelled(Exception):
+    """요청이 취소되어(예: 새 오디오 업로드) 남은 단계를 실행하지 않을 때 발생하는 예외"""
+    def __init__(self, stage: str, reason: str):
+        self.stage = stage
+        self.reason = reason
+        super().__init__(f"{stage} 단계가 취소되었습니다: {reason}")
+
+
+class DeadlineExceeded(Exception):
+    """요청 전체의 지연 시간 예산을 모두 사용했을 때 발생하는 예외 (재시도 대상 아님)"""
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"{stage} 단계에서 요청 시간 예산을 모두 사용했습니다.")
+
+
+class CancellationMetrics:
+    """
+    취소로 절약한 작업량을 집계합니다.
+    아예 보내지 않은 호출(skipped)만 절약으로 집계합니다. 이미 전송한 호출은 취소되어도 끝까지 실행되고 비용이 들기 때문입니다.
+    """
+    def __init__(self, history: int = 100):
+        self._lock = threading.Lock()
+        self.cancellations = 0
+        self.skipped_calls = 0
+        self.saved_seconds = 0.0 # 생략한 호출의 예상 소요 시간 합계
+        self.deadline_exceeded = {} # 단계 → 예산 초과 횟수
+        self.recent = deque(maxlen=history) # 최근 취소별 절약 내역
+
+    def new_cancellation(self, request_id: str, reason: str) -> dict:
+        record = {"request_id": request_id, "reason": reason, "skipped_calls": 0, "saved_seconds": 0.0}
+        with self._lock:
+            self.cancellations += 1
+            self.recent.append(record)
+        return record
+
+    def record_skipped(self, record: dict, seconds: float) -> None:
+        with self._lock:
+            record["skipped_calls"] += 1
+            record["saved_seconds"] += seconds
+            self.skipped_calls += 1
+            self.saved_seconds += seconds
+
+    def record_deadline(self, stage: str) -> None:
+        with self._lock:
+            self.deadline_exceeded[stage] = self.deadline_exceeded.get(stage, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "cancellations": self.cancellations,
+                "skipped_calls": self.skipped_calls,
+                "saved_seconds": round(self.saved_seconds, 2),
+                "deadline_exceeded": dict(self.deadline_exceeded),
+                "recent": [dict(record) for record in self.recent],
+            }
+
+
+# 프로세스 전체에서 공유하는 취소 지표
+cancellation_metrics = CancellationMetrics()
+
+
+class RequestContext:
+    """
+    꿈 요청 하나의 지연 시간 예산과 취소 상태를 담는 객체입니다.
+    각 단계(STT, 검열, 검색, LLM, 이미지)는 남은 예산을 제한 시간으로 사용하고,
+    취소된 뒤에는 새 API 호출을 보내지 않습니다.
+    """
+    def __init__(self, budget_seconds: float, request_id: str = None, cancel_check: Callable[[], Optional[str]] = None):
+        """
+        :param budget_seconds: 요청 전체의 지연 시간 예산(초)
+        :param request_id: 요청 식별자 (없으면 자동 생성)
+        :param cancel_check: (선택 사항) 외부 취소 신호를 확인하는 함수, 취소 사유 문자열 또는 None 반환
+        """
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.cancel_check = cancel_check
+        self.cancel_reason = None
+        self._cancel_record = None
+        self.reset_budget(budget_seconds)
+
+    def reset_budget(self, budget_seconds: float) -> "RequestContext":
+        """사용자 동작(분석 시작, 이미지 생성 등)마다 새 예산으로 시작합니다."""
+        self.deadline = time.monotonic() + budget_seconds
+        return self
+
+    def remaining(self) -> float:
+        """남은 예산(초)"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str) -> None:
+        """요청을 취소합니다. 이미 취소된 경우에는 아무것도 하지 않습니다."""
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+            self._cancel_record = cancellation_metrics.new_cancellation(self.request_id, reason)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.cancel_reason is None and self.cancel_check is not None:
+            reason = self.cancel_check()
+            if reason:
+                self.cancel(reason)
+        return self.cancel_reason is not None
+
+    def check(self, stage: str, expected_seconds: float = 0.0) -> None:
+        """
+        단계를 시작하기 전에 호출합니다. 취소되었거나 예산이 없으면 예외를 발생시킵니다.
+        :param stage: 단계 이름
+        :param expected_seconds: 이 단계의 평소 소요 시간 (절약량 집계용)
+        """
+        if self.cancelled:
+            cancellation_metrics.record_skipped(self._cancel_record, expected_seconds)
+            raise PipelineCancelled(stage, self.cancel_reason)
+        if self.remaining() <= 0:
+            cancellation_metrics.record_deadline(stage)
+            raise DeadlineExceeded(stage)
+
+
+# 현재 실행 흐름에 연결된 요청 컨텍스트
+_current_request: contextvars.ContextVar = contextvars.ContextVar("request_context", default=None)
+
+
+def current_request() -> Optional[RequestContext]:
+    """현재 실행 흐름의 요청 컨텍스트 (없으면 None)"""
+    return _current_request.get()
+
+
+def remaining_or_none() -> Optional[float]:
+    """현재 요청의 남은 예산(초), 요청 컨텍스트가 없으면 None"""
+    request = _current_request.get()
+    return None if request is None else request.remaining()
+
+
+# 현재 실행 흐름에서 보내는 API 호출 한 번의 제한 시간 (core.resilience 정책의 timeout)
+_call_timeout: contextvars.ContextVar = contextvars.ContextVar("call_timeout", default=None)
+
+
+@contextmanager
+def call_timeout(seconds: Optional[float]):
+    """with 블록 안에서 보내는 HTTP 요청의 제한 시간을 지정합니다."""
+    token = _call_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _call_timeout.reset(token)
+
+
+def http_timeout() -> Optional[float]:
+    """
+    지금 보내는 HTTP 요청에 적용할 제한 시간(초)입니다.
+    호출 정책의 제한 시간과 요청의 남은 예산 중 짧은 쪽이며, 둘 다 없으면 None입니다.
+    """
+    limits = [seconds for seconds in (_call_timeout.get(), remaining_or_none()) if seconds is not None]
+    return min(limits) if limits else None
+
+
+@contextmanager
+def activate(request: RequestContext, budget_seconds: float = None):
+    """
+    with 블록 안의 서비스 호출에 요청 컨텍스트를 연결합니다.
+    :param budget_seconds: 주어지면 이 동작에 대한 새 예산으로 시작
+    """
+    if budget_seconds is not None:
+        request.reset_budget(budget_seconds)
+    token = _current_request.set(request)
+    try:
+        yield request
+    finally:
+        _current_request.reset(token)
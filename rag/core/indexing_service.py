@@ -1,4 +1,5 @@
 import os # 운영체제 기능 제공
+import sys # 모듈 검색 경로 설정
 from langchain_community.document_loaders import (
     DirectoryLoader, # 디렉토리에서 문서 로드
     TextLoader, # 텍스트 파일 로드
@@ -7,6 +8,29 @@ from langchain_community.vectorstores import FAISS # FAISS 벡터 스토어 사
 from langchain_openai import OpenAIEmbeddings # OpenAI 임베딩 사용
 from langchain.text_splitter import RecursiveCharacterTextSplitter # 텍스트 재귀 분할
 
+# 'python core/indexing_service.py'로 실행해도 core 패키지를 찾을 수 있도록 프로젝트 루트를 경로에 추가
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.context_packing import count_tokens # 청크별 토큰 수 계산 (검색 시 컨텍스트 예산 계산에 사용)
+from core.usage_store import embedding_cost, usage_store # 인덱싱 임베딩 토큰 사용량 기록
+from core.symbol_lookup import SYMBOL_SOURCE_PATH, build_symbol_table, save_symbol_table # 상징 조회 테이블
+
+INDEX_DIR = "faiss_index" # 벡터 스토어와 상징 조회 테이블을 저장하는 폴더
+
+def build_symbol_index(index_dir: str = INDEX_DIR):
+    """
+    상징 사전 문서로 상징 → 섹션 조회 테이블을 만들어 인덱스 폴더에 저장합니다.
+    임베딩 호출이 없으므로 기존 인덱스에도 '--symbols-only'로 따로 생성할 수 있습니다.
+    :param index_dir: 조회 테이블을 저장할 인덱스 폴더
+    """
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        table = build_symbol_table(SYMBOL_SOURCE_PATH)
+        path = save_symbol_table(table, index_dir)
+        print(f"✅ 상징 조회 테이블 생성 완료: 상징 {len(table['sections'])}개, 변형 {len(table['aliases'])}개 ({path})")
+
+    except Exception as e:
+        print(f"❌ 상징 조회 테이블 생성 중 오류가 발생했습니다: {e}")
+
 def build_vector_store():
     """
     'data' 디렉토리의 .md 및 .txt 파일을 로드하고,
@@ -54,6 +78,10 @@ def build_vector_store():
     docs = text_splitter.split_documents(documents)
     print(f"문서를 총 {len(docs)}개의 청크로 나누었습니다.")
 
+    # 청크별 토큰 수를 미리 계산하여 metadata에 저장 (검색할 때마다 다시 계산하지 않도록)
+    for doc in docs:
+        doc.metadata["token_count"] = count_tokens(doc.page_content)
+
     # 분할된 청크가 없는 경우 오류
     if not docs:
         print("\n❌ 오류: 텍스트를 나눈 후 처리할 문서 조각(청크)이 없습니다.")
@@ -68,14 +96,26 @@ def build_vector_store():
 
         # FAISS 벡터 저장소에 문서와 임베딩 저장
         db = FAISS.from_documents(docs, embeddings)
-        db.save_local("faiss_index") # 로컬에 인덱스 저장
+        db.save_local(INDEX_DIR) # 로컬에 인덱스 저장
+        # 인덱싱에 사용한 임베딩 토큰 수 기록 (청크별 token_count 합계)
+        tokens = sum(doc.metadata["token_count"] for doc in docs)
+        usage_store.record("indexing", embeddings.model, session_id="indexer", requests=1, input_tokens=tokens, cost_usd=embedding_cost(tokens))
+        print(f"임베딩 토큰 약 {tokens}개 (예상 비용 ${embedding_cost(tokens):.4f})")
     
         print("\n✅ 벡터 스토어 생성이 완료되었습니다. 'faiss_index' 폴더가 생성되었습니다.")
     
     except Exception as e:
         print(f"❌ 임베딩 또는 벡터 스토어 생성 중 오류가 발생했습니다: {e}")
         print("   OpenAI API 키가 유효한지, 인터넷 연결에 문제가 없는지 확인해주세요.")
+        return
+
+    # 상징 사전 문서로 상징 → 섹션 조회 테이블 생성 (검색 결과에 알려진 상징 섹션을 함께 포함)
+    build_symbol_index(INDEX_DIR)
 
 # 스크립트 직접 실행 시 build_vector_store 함수 호출
+# ('--symbols-only'를 주면 임베딩 없이 기존 인덱스에 상징 조회 테이블만 생성)
 if __name__ == '__main__':
-    build_vector_store()
\ No newline at end of file
+    if "--symbols-only" in sys.argv[1:]:
+        build_symbol_index(INDEX_DIR)
+    else:
+        build_vector_store()
\ No newline at end of file
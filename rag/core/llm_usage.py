@@ -0,0 +1,66 @@
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from core import config
+from core.structured_logging import get_logger
+from core.tracing import register_json_endpoint
+
+logger = get_logger("core.llm_usage")
+
+
+def total_tokens(message: Any) -> Optional[int]:
+    """응답 메시지(AIMessage)의 입력 + 출력 토큰 수, usage_metadata가 없으면 None (속도 제한 예산 보정용)"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+class LLMUsageMetrics:
+    """
+    LLM 호출별 토큰 사용량(usage_metadata)을 집계합니다.
+    cached_tokens는 공급자 측 프롬프트 캐시에서 재사용된 입력 토큰 수로, 고정된 프롬프트 접두부가 캐시에 적중했는지 보여줍니다.
+    """
+    def __init__(self, history: int = 200):
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Dict[str, int]] = {} # 호출 이름 → 누적 사용량
+        self.recent = deque(maxlen=history) # 최근 호출별 사용량
+
+    def record(self, name: str, message: Any) -> dict:
+        """
+        응답 메시지(AIMessage)의 usage_metadata를 기록하고 호출별 사용량을 반환합니다.
+        :param name: 호출 이름 (예: "ReportGeneratorService.generate_report_with_rag")
+        :param message: LangChain 챗 모델의 응답 메시지
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        record = {
+            "name": name,
+            "input_tokens": usage.get("input_tokens", 0),
+            "cached_tokens": details.get("cache_read", 0) or 0,
+            "output_tokens": usage.get("output_tokens", 0),
+        }
+        with self._lock:
+            totals = self.totals.setdefault(name, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0})
+            totals["calls"] += 1
+            for key in ("input_tokens", "cached_tokens", "output_tokens"):
+                totals[key] += record[key]
+            self.recent.append(record)
+        # 호출마다 발생하므로 일부만 기록 (LogRecord의 name 속성과 겹치지 않도록 call로 기록)
+        logger.info("LLM 토큰 사용량", extra={"call": name, "sample_rate": config.LOG_USAGE_SAMPLE_RATE,
+                                          **{key: value for key, value in record.items() if key != "name"}})
+        return record
+
+    def snapshot(self) -> dict:
+        """호출 이름별 누적 사용량과 캐시 적중률"""
+        with self._lock:
+            return {
+                name: {**totals, "cache_hit_ratio": round(totals["cached_tokens"] / totals["input_tokens"], 3) if totals["input_tokens"] else 0.0}
+                for name, totals in self.totals.items()
+            }
+
+
+# 프로세스 전체에서 공유하는 LLM 사용량 지표
+llm_usage_metrics = LLMUsageMetrics()
+register_json_endpoint("/llm-usage", llm_usage_metrics.snapshot)
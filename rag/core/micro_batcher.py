@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from core.structured_logging import get_logger
+
+logger = get_logger("core.micro_batcher")
+
+
+class MicroBatcher:
+    """
+    여러 세션에서 들어오는 단건 요청을 모아 한 번의 배치 요청으로 보내는 마이크로 배처입니다.
+    호출자는 submit()으로 Future를 받아 결과를 기다리고, 백그라운드 플러셔가
+    max_wait_ms가 지나거나 max_batch_size만큼 쌓이면 batch_fn을 한 번 호출합니다.
+    배치 요청이 실패하면 입력마다 따로 다시 요청하므로, 입력 하나의 문제가 같은 배치의 다른 세션을 실패시키지 않습니다.
+    """
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 10.0, max_concurrent_batches: int = 4, name: str = "batcher",
+                 default_timeout: float = 30.0):
+        """
+        :param batch_fn: 입력 리스트를 받아 같은 순서·같은 길이의 결과 리스트를 반환하는 함수
+        :param max_batch_size: 한 번에 보낼 최대 입력 수
+        :param max_wait_ms: 첫 입력이 들어온 뒤 배치를 보내기까지 기다리는 최대 시간(밀리초)
+        :param max_concurrent_batches: 동시에 전송 중일 수 있는 배치 수
+        :param name: 로그 및 스레드 이름
+        :param default_timeout: call()에 제한 시간이 주어지지 않았을 때 결과를 기다리는 최대 시간(초)
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.default_timeout = default_timeout
+        self._pending: List[tuple] = [] # (입력, Future) 대기열
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix=f"{name}-send")
+        # 배치 효율 확인용 통계
+        self.items_submitted = 0
+        self.batches_sent = 0
+        self._flusher = threading.Thread(target=self._run, name=f"{name}-flusher", daemon=True)
+        self._flusher.start()
+
+    def submit(self, item: Any) -> Future:
+        """입력 하나를 대기열에 넣고 결과를 받을 Future를 반환합니다."""
+        future = Future()
+        with self._condition:
+            self._pending.append((item, future))
+            self.items_submitted += 1
+            self._condition.notify()
+        return future
+
+    def call(self, item: Any, timeout: float = None) -> Any:
+        """
+        입력 하나를 배치로 처리하고 결과가 나올 때까지 기다립니다.
+        :param timeout: 최대 대기 시간(초), 없으면 default_timeout
+        :raises concurrent.futures.TimeoutError: 제한 시간 안에 결과가 나오지 않은 경우 (아직 보내지 않은 입력은 배치에서 빠짐)
+        """
+        future = self.submit(item)
+        try:
+            return future.result(timeout=self.default_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # 첫 입력 이후 max_wait 동안 또는 배치가 가득 찰 때까지 더 모음
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                # 기다리다 제한 시간이 지나 취소된 입력은 보내지 않음
+                batch = [entry for entry in self._pending[:self.max_batch_size] if not entry[1].cancelled()]
+                self._pending = self._pending[self.max_batch_size:]
+                if not batch:
+                    continue
+                self.batches_sent += 1
+            self._executor.submit(self._send, batch)
+
+    def _call_batch(self, items: List[Any]) -> List[Any]:
+        results = self.batch_fn(items)
+        if len(results) != len(items):
+            raise ValueError(f"{self.name}: 배치 결과 수({len(results)})가 입력 수({len(items)})와 다릅니다.")
+        return results
+
+    def _send(self, batch: List[tuple]) -> None:
+        try:
+            results = self._call_batch([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], exception=e)
+                return
+            # 배치 전체가 실패하면 입력마다 따로 다시 요청해서 실패 원인이 된 입력의 호출자만 실패시킴
+            logger.warning("%s 배치(%d개) 요청 실패, 입력별로 다시 요청합니다: %s", self.name, len(batch), e)
+            for item, future in batch:
+                if future.cancelled():
+                    continue
+                try:
+                    _resolve(future, result=self._call_batch([item])[0])
+                except Exception as item_error:
+                    _resolve(future, exception=item_error)
+            return
+        for (_, future), result in zip(batch, results):
+            _resolve(future, result=result)
+
+    def stats(self) -> dict:
+        """제출된 입력 수, 전송된 배치 수, 평균 배치 크기를 반환합니다."""
+        return {
+            "items_submitted": self.items_submitted,
+            "batches_sent": self.batches_sent,
+            "avg_batch_size": (self.items_submitted / self.batches_sent) if self.batches_sent else 0.0,
+        }
+
+
+def _resolve(future: Future, result: Any = None, exception: BaseException = None) -> None:
+    # 호출자가 제한 시간이 지나 취소한 Future에는 결과를 넣지 않음
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# 프로세스 전체에서 공유하는 배처 레지스트리 (Streamlit 재실행과 세션 간에 유지됨)
+_batchers: Dict[Tuple[str, Hashable], MicroBatcher] = {}
+_registry_lock = threading.Lock()
+
+
+def get_batcher(name: str, owner: Hashable, factory: Callable[[], MicroBatcher]) -> MicroBatcher:
+    """
+    (이름, 소유자)에 해당하는 프로세스 공용 배처를 반환하고, 없으면 factory로 생성합니다.
+    배처는 처음 생성한 객체의 batch_fn(과 그 클라이언트)으로 요청을 보내므로, 소유자는 요청을 보낼 클라이언트로 구분합니다.
+    (배처가 batch_fn을 통해 클라이언트를 계속 참조하므로 id(클라이언트)를 소유자로 써도 다른 객체와 겹치지 않음)
+    :param name: 배처 이름 (예: "moderation", "embeddings")
+    :param owner: 요청을 보낼 클라이언트를 식별하는 값 (예: id(client))
+    :param factory: 배처를 생성하는 함수
+    """
+    with _registry_lock:
+        batcher = _batchers.get((name, owner))
+        if batcher is None:
+            batcher = factory()
+            _batchers[(name, owner)] = batcher
+        return batcher
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from core import config
+from core.llm_usage import llm_usage_metrics
+from core.resilience import LatencyTracker
+from core.structured_logging import get_logger
+from core.tracing import register_json_endpoint, tracer
+from core.usage_store import usage_store
+
+logger = get_logger("core.model_router")
+
+T = TypeVar("T")
+
+
+class ValidationFailed(Exception):
+    """모든 모델 단계에서 응답 검증에 실패했을 때 발생하는 예외"""
+    def __init__(self, stage: str, models: List[str]):
+        self.stage = stage
+        self.models = models
+        super().__init__(f"{stage} 단계의 응답이 모든 모델({', '.join(models)})에서 검증에 실패했습니다.")
+
+
+def estimate_cost(model: str, usage: dict) -> float:
+    """usage(입력/캐시/출력 토큰)와 config.MODEL_PRICES로 호출 비용(USD)을 계산합니다."""
+    prices = config.MODEL_PRICES.get(model)
+    if not prices:
+        return 0.0
+    cached = usage.get("cached_tokens", 0)
+    uncached = max(0, usage.get("input_tokens", 0) - cached)
+    return (uncached * prices["input"] + cached * prices["cached_input"] + usage.get("output_tokens", 0) * prices["output"]) / 1_000_000
+
+
+class ModelRouter:
+    """
+    단계(stage)별로 사용할 모델을 고르는 라우터입니다.
+    - 기본: config.STAGE_MODELS에 지정된 모델
+    - 상향(escalate): 응답 검증에 실패하면 MODEL_TIERS에서 한 단계 더 강한 모델로 다시 시도
+    - 하향(downgrade): 해당 모델의 관측 p95 지연 시간이 단계의 SLO를 넘으면 일정 시간 한 단계 가벼운 모델을 먼저 사용
+    모델별 지연 시간과 비용을 기록합니다.
+    """
+    def __init__(self, stage_models: Dict[str, str], tiers: List[str], slos: Dict[str, float], downgrade_seconds: float):
+        """
+        :param stage_models: 단계 → 기본 모델
+        :param tiers: 가벼운 모델부터 강한 모델 순서의 모델 목록
+        :param slos: 단계 → p95 지연 시간 목표(초)
+        :param downgrade_seconds: SLO 위반 시 가벼운 모델을 사용하는 시간(초), 이후 기본 모델을 다시 측정
+        """
+        self.stage_models = stage_models
+        self.tiers = tiers
+        self.slos = slos
+        self.downgrade_seconds = downgrade_seconds
+        self._latencies: Dict[tuple, LatencyTracker] = {} # (단계, 모델) → 지연 시간
+        self._downgraded_until: Dict[str, float] = {} # 단계 → 하향 종료 시각
+        self._stats: Dict[tuple, dict] = {} # (단계, 모델) → 호출 수, 검증 실패, 지연 시간, 비용
+        self._lock = threading.Lock()
+
+    def _tracker(self, stage: str, model: str) -> LatencyTracker:
+        with self._lock:
+            return self._latencies.setdefault((stage, model), LatencyTracker())
+
+    def candidates(self, stage: str) -> List[str]:
+        """단계에서 사용될 수 있는 모든 모델 (체인 사전 구성용)"""
+        preferred = self.stage_models.get(stage, self.tiers[-1])
+        index = self.tiers.index(preferred) if preferred in self.tiers else len(self.tiers) - 1
+        return self.tiers[max(0, index - 1):] if preferred in self.tiers else [preferred]
+
+    def select(self, stage: str) -> List[str]:
+        """
+        이번 호출에서 시도할 모델 순서를 반환합니다. (첫 번째 모델로 시작, 검증 실패 시 다음 모델로 상향)
+        """
+        preferred = self.stage_models.get(stage, self.tiers[-1])
+        if preferred not in self.tiers:
+            return [preferred]
+        index = self.tiers.index(preferred)
+        slo = self.slos.get(stage)
+        now = time.monotonic()
+        with self._lock:
+            downgraded = now < self._downgraded_until.get(stage, 0.0)
+        if not downgraded and slo is not None and index > 0:
+            p95 = self._tracker(stage, preferred).quantile(0.95, min_samples=10)
+            if p95 is not None and p95 > slo:
+                logger.warning("%s 단계 %s의 p95 %.1f초가 SLO %.1f초를 넘어 %.0f초 동안 %s를 먼저 사용합니다.",
+                               stage, preferred, p95, slo, self.downgrade_seconds, self.tiers[index - 1])
+                with self._lock:
+                    self._downgraded_until[stage] = now + self.downgrade_seconds
+                    self._latencies[(stage, preferred)] = LatencyTracker() # 하향이 끝나면 새로 측정
+                downgraded = True
+        return self.tiers[index - 1:] if downgraded and index > 0 else self.tiers[index:]
+
+    def _record(self, stage: str, model: str, seconds: float, usage: Optional[dict], valid: bool) -> None:
+        cost = estimate_cost(model, usage or {})
+        self._tracker(stage, model).record(seconds)
+        with self._lock:
+            stats = self._stats.setdefault((stage, model), {"calls": 0, "invalid": 0, "seconds": 0.0, "cost_usd": 0.0})
+            stats["calls"] += 1
+            stats["invalid"] += 0 if valid else 1
+            stats["seconds"] += seconds
+            stats["cost_usd"] += cost
+        usage = usage or {}
+        usage_store.record(
+            stage, model, requests=1, input_tokens=usage.get("input_tokens", 0), cached_tokens=usage.get("cached_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0), cost_usd=cost,
+        )
+        # 성공한 호출은 호출마다 발생하므로 일부만 기록하고, 검증 실패는 항상 기록
+        logger.log(logging.INFO if valid else logging.WARNING, "모델 호출 %s", "완료" if valid else "검증 실패",
+                   extra={"stage": stage, "model": model, "seconds": round(seconds, 3), "cost_usd": round(cost, 6), "valid": valid,
+                          "sample_rate": config.LOG_USAGE_SAMPLE_RATE if valid else 1.0})
+
+    def run(self, stage: str, name: str, call: Callable[[str], T], raw_message: Callable[[T], Any] = None,
+            validate: Callable[[T], bool] = None) -> T:
+        """
+        선택된 모델로 call을 실행하고, 검증에 실패하면 더 강한 모델로 다시 실행합니다.
+        :param stage: 단계 이름 (config.STAGE_MODELS의 키)
+        :param name: 사용량 기록용 호출 이름 (예: "ReportGeneratorService.generate_report_with_rag")
+        :param call: 모델 이름을 받아 LLM 호출을 수행하는 함수
+        :param raw_message: 결과에서 usage_metadata가 있는 응답 메시지를 꺼내는 함수 (없으면 결과 자체)
+        :param validate: 결과가 유효하면 True를 반환하는 함수 (없으면 항상 유효)
+        :raises ValidationFailed: 모든 모델에서 검증에 실패한 경우
+        """
+        models = self.select(stage)
+        for model in models:
+            started = time.monotonic()
+            with tracer.span(f"llm.{stage}", model=model) as span:
+                result = call(model)
+                seconds = time.monotonic() - started
+                usage = llm_usage_metrics.record(name, raw_message(result) if raw_message else result)
+                valid = validate is None or validate(result)
+                span.set_attribute("valid", valid)
+                if usage:
+                    span.set_attribute("input_tokens", usage["input_tokens"])
+                    span.set_attribute("output_tokens", usage["output_tokens"])
+            self._record(stage, model, seconds, usage, valid)
+            if valid:
+                return result
+        raise ValidationFailed(stage, models)
+
+    def snapshot(self) -> dict:
+        """(단계, 모델)별 호출 수, 검증 실패 수, 평균 지연 시간, 누적 비용"""
+        with self._lock:
+            return {
+                f"{stage}/{model}": {**stats, "avg_seconds": round(stats["seconds"] / stats["calls"], 3), "cost_usd": round(stats["cost_usd"], 5)}
+                for (stage, model), stats in self._stats.items()
+            }
+
+
+# 프로세스 전체에서 공유하는 모델 라우터
+model_router = ModelRouter(config.STAGE_MODELS, config.MODEL_TIERS, config.STAGE_LATENCY_SLO_SECONDS, config.MODEL_DOWNGRADE_SECONDS)
+register_json_endpoint("/model-router", model_router.snapshot)
@@ -0,0 +1,99 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from core import config
+from core.deadline import current_request
+from core.rate_limiter import current_priority
+from core.structured_logging import get_logger
+from core.tracing import traced, tracer
+
+logger = get_logger("core.pipeline_client")
+
+
+class PipelineAPIError(Exception):
+    """파이프라인 API 서버가 오류를 반환했거나 연결할 수 없을 때 발생하는 예외"""
+    def __init__(self, path: str, status_code: Optional[int], detail: str):
+        self.path = path
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(f"{path} 요청 실패 ({status_code or '연결 오류'}): {detail}")
+
+
+class PipelineClient:
+    """
+    api_server.py의 파이프라인 API를 호출하는 클라이언트입니다.
+    서비스 클래스와 같은 메서드 이름과 반환 형식을 제공하므로 Streamlit 앱에서 서비스 객체 대신 사용할 수 있습니다.
+    현재 요청 컨텍스트의 남은 예산, 세션 ID, 우선순위는 헤더로 서버에 전달됩니다.
+    """
+    def __init__(self, base_url: str, timeout: float = None):
+        """
+        :param base_url: API 서버 주소 (예: "http://127.0.0.1:8000")
+        :param timeout: 요청 제한 시간(초), 없으면 요청 컨텍스트의 남은 예산 또는 DREAM_REQUEST_BUDGET_SECONDS
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._client = httpx.Client(base_url=self.base_url)
+
+    def _post(self, path: str, json: dict = None, content: bytes = None, params: dict = None) -> Any:
+        request = current_request()
+        headers = {"X-Request-Priority": current_priority().name.lower()}
+        if config.PIPELINE_API_TOKEN:
+            headers["Authorization"] = f"Bearer {config.PIPELINE_API_TOKEN}"
+        timeout = self.timeout or config.DREAM_REQUEST_BUDGET_SECONDS
+        if request is not None:
+            headers["X-Request-Id"] = request.request_id
+            headers["X-Request-Budget"] = f"{request.remaining():.3f}"
+            timeout = min(timeout, request.remaining() + 5) # 서버가 예산 초과 응답을 보낼 시간 여유
+        if tracer.session_id():
+            headers["X-Session-Id"] = tracer.session_id()
+        try:
+            response = self._client.post(path, json=json, content=content, params=params, headers=headers, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise PipelineAPIError(path, None, str(e)) from e
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise PipelineAPIError(path, response.status_code, str(detail))
+        return response.json()
+
+    @traced()
+    def transcribe_from_bytes(self, audio_bytes: bytes, file_name: str = "audio.wav") -> str:
+        return self._post("/v1/transcribe", content=audio_bytes, params={"file_name": file_name})["text"]
+
+    def transcribe_audio(self, audio_path: str) -> str:
+        with open(audio_path, "rb") as audio_file:
+            return self.transcribe_from_bytes(audio_file.read(), os.path.basename(audio_path))
+
+    @traced()
+    def check_text_safety(self, text: str) -> dict:
+        return self._post("/v1/moderate", json={"text": text})
+
+    @traced(accept=lambda report: report.get("source") != "none")
+    def generate_report_with_fallback(self, dream_text: str) -> dict:
+        try:
+            return self._post("/v1/report", json={"dream_text": dream_text})
+        except PipelineAPIError as e:
+            # 서비스의 generate_report_with_fallback과 같이 예외 대신 빈 리포트로 반환
+            logger.error("리포트 생성 실패: %s", e)
+            return {"emotions": [], "keywords": [], "analysis_summary": f"리포트 생성 중 오류가 발생했습니다: {e}", "source": "none"}
+
+    @traced()
+    def analyze(self, dream_text: str) -> Dict[str, Any]:
+        return self._post("/v1/analysis", json={"dream_text": dream_text})
+
+    @traced()
+    def create_nightmare_prompt(self, dream_text: str, dream_report: Dict[str, Any]) -> str:
+        return self._post("/v1/nightmare-prompt", json={"dream_text": dream_text, "report": dream_report})["prompt"]
+
+    @traced()
+    def create_reconstructed_prompt_and_analysis(self, dream_text: str, dream_report: Dict[str, Any]) -> Tuple[str, str, List[Dict[str, str]]]:
+        result = self._post("/v1/reconstruct", json={"dream_text": dream_text, "report": dream_report})
+        return result["prompt"], result["transformation_summary"], result["keyword_mappings"]
+
+    @traced()
+    def generate_image_from_prompt(self, prompt: str) -> str:
+        return self._post("/v1/image", json={"prompt": prompt})["url"]
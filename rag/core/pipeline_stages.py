@@ -0,0 +1,30 @@
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from core import config
+from core.deadline import RequestContext, activate
+
+T = TypeVar("T")
+
+# Streamlit 스크립트 스레드 대신 파이프라인 단계(STT, 분석, 이미지 생성)를 실행하는 공용 스레드 풀
+# 스크립트 스레드가 API 호출에 묶여 있으면 새 입력에 대한 재실행이 그 호출이 끝날 때까지 시작되지 않으므로,
+# 단계는 여기서 실행하고 스크립트 스레드는 결과를 기다리는 동안 재실행 요청을 처리합니다.
+_executor = ThreadPoolExecutor(max_workers=config.PIPELINE_STAGE_WORKERS, thread_name_prefix="pipeline-stage")
+
+
+def submit(request: RequestContext, fn: Callable[[], T], budget_seconds: float = None) -> Future:
+    """
+    fn을 요청 컨텍스트에 연결하여 백그라운드에서 실행합니다.
+    request가 취소되면 fn 안의 다음 API 호출부터 보내지 않고 PipelineCancelled로 끝납니다.
+    :param request: 세션의 현재 요청 컨텍스트
+    :param fn: 단계를 실행하는 인자 없는 함수
+    :param budget_seconds: 주어지면 이 단계에 대한 새 예산으로 시작
+    :return: 단계 결과의 Future
+    """
+    context = contextvars.copy_context() # 호출자의 컨텍스트(세션 ID, 추적 span 등)를 유지
+
+    def run():
+        with activate(request, budget_seconds):
+            return fn()
+    return _executor.submit(context.run, run)
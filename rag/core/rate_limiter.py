@@ -0,0 +1,397 @@
+import contextvars
+import heapq
+import itertools
+import json
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx # OpenAI 클라이언트가 사용하는 HTTP 클라이언트 (응답 헤더 수집용)
+
+from core import config
+from core.deadline import http_timeout
+
+
+class Priority(IntEnum):
+    """요청 우선순위 (값이 작을수록 먼저 처리)"""
+    INTERACTIVE = 0 # 사용자가 화면에서 기다리는 요청
+    BATCH = 1 # 일괄 처리 작업
+    SPECULATIVE = 2 # 미리 계산해 두는 추측성 작업
+
+
+# 현재 실행 흐름의 요청 우선순위 (기본값: 사용자 요청)
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("request_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """with 블록 안에서 발생하는 API 호출의 우선순위를 지정합니다."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Priority:
+    """현재 실행 흐름의 요청 우선순위"""
+    return _current_priority.get()
+
+
+class RateLimitWait(Exception):
+    """허용된 대기 시간 안에 요청을 보낼 수 없을 때 예상 대기 시간(ETA)과 함께 발생하는 예외"""
+    def __init__(self, endpoint: str, eta_seconds: float):
+        self.endpoint = endpoint
+        self.eta_seconds = eta_seconds
+        super().__init__(f"{endpoint} 요청이 많아 약 {eta_seconds:.0f}초 후에 처리할 수 있습니다.")
+
+
+def estimate_tokens(*texts: str, completion_tokens: int = 0) -> int:
+    """
+    TPM 예산 계산용 토큰 수를 대략 추정합니다. (한국어 기준 약 2글자당 1토큰)
+    :param texts: 요청에 포함되는 텍스트들
+    :param completion_tokens: 예상 출력 토큰 수
+    """
+    return sum(len(text or "") for text in texts) // 2 + completion_tokens
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """'6m0s', '1.5s', '20ms' 형식의 x-ratelimit-reset-* 값을 초 단위로 변환합니다."""
+    if not value:
+        return None
+    total = 0.0
+    for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(number) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+    return total
+
+
+class EndpointBudget:
+    """
+    엔드포인트 하나의 RPM/TPM 예산을 관리하는 토큰 버킷입니다.
+    limit이 0이면 해당 항목은 제한하지 않습니다.
+    """
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests_available = float(rpm)
+        self.tokens_available = float(tpm)
+        self.blocked_until = 0.0 # 429 응답 등으로 서버가 지정한 재개 시각
+        self._last_refill = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self.requests_available = min(self.rpm, self.requests_available + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self.tokens_available = min(self.tpm, self.tokens_available + elapsed * self.tpm / 60.0)
+
+    def time_until(self, requests: float, tokens: float, now: float) -> float:
+        """요청 requests개와 토큰 tokens개를 쓸 수 있을 때까지 남은 시간(초)"""
+        wait = max(0.0, self.blocked_until - now)
+        if self.rpm and requests > self.requests_available:
+            wait = max(wait, (requests - self.requests_available) * 60.0 / self.rpm)
+        if self.tpm and tokens > self.tokens_available:
+            wait = max(wait, (min(tokens, self.tpm) - self.tokens_available) * 60.0 / self.tpm)
+        return wait
+
+    def consume(self, tokens: float) -> None:
+        if self.rpm:
+            self.requests_available -= 1
+        if self.tpm:
+            self.tokens_available -= min(tokens, self.tpm)
+
+    def correct_tokens(self, reserved: float, actual: float) -> None:
+        """추정해서 차감한 토큰 수를 실제 사용량으로 바로잡습니다. (남으면 돌려주고 모자라면 더 차감)"""
+        if self.tpm:
+            self.tokens_available = min(self.tpm, self.tokens_available + min(reserved, self.tpm) - actual)
+
+    def apply_headers(self, headers, now: float) -> None:
+        """서버가 알려준 x-ratelimit-* 헤더로 한도와 남은 예산을 보정합니다."""
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if limit_requests and limit_requests.isdigit():
+            self.rpm = int(limit_requests)
+        if limit_tokens and limit_tokens.isdigit():
+            self.tpm = int(limit_tokens)
+        # 서버 기준 남은 양이 로컬 추정보다 적으면 서버 값을 따름 (다른 프로세스/레플리카의 사용량 반영)
+        if remaining_requests and remaining_requests.isdigit() and self.rpm:
+            self.requests_available = min(self.requests_available, float(remaining_requests))
+        if remaining_tokens and remaining_tokens.isdigit() and self.tpm:
+            self.tokens_available = min(self.tokens_available, float(remaining_tokens))
+        if remaining_requests == "0":
+            reset = _parse_reset(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+
+class RateLimitScheduler:
+    """
+    모든 OpenAI 호출이 거쳐 가는 프로세스 공용 속도 제한 스케줄러입니다.
+    엔드포인트별 RPM/TPM 예산을 추적하고, 대기 중인 요청은 우선순위 순서대로 내보냅니다.
+    허용 대기 시간을 넘는 경우에는 실패 대신 예상 대기 시간(RateLimitWait)을 알려줍니다.
+    """
+    def __init__(self, limits: Dict[str, Tuple[int, int]], max_wait_seconds: float = 30.0):
+        """
+        :param limits: {엔드포인트: (RPM, TPM)}
+        :param max_wait_seconds: 기본 최대 대기 시간(초)
+        """
+        self.budgets = {endpoint: EndpointBudget(rpm, tpm) for endpoint, (rpm, tpm) in limits.items()}
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+        self._waiting: Dict[str, list] = {endpoint: [] for endpoint in limits} # 엔드포인트별 대기열 (힙)
+        self._sequence = itertools.count()
+
+    def _budget(self, endpoint: str) -> EndpointBudget:
+        if endpoint not in self.budgets:
+            # 설정에 없는 엔드포인트는 제한 없이 통과 (헤더가 오면 그때부터 추적)
+            self.budgets[endpoint] = EndpointBudget(0, 0)
+            self._waiting[endpoint] = []
+        return self.budgets[endpoint]
+
+    def estimate_wait(self, endpoint: str, tokens: int = 0, priority: Priority = None) -> float:
+        """
+        지금 요청을 넣으면 앞선 대기 요청까지 고려해 몇 초 뒤에 보낼 수 있는지 추정합니다.
+        """
+        priority = _current_priority.get() if priority is None else priority
+        with self._condition:
+            return self._estimate_locked(endpoint, tokens, priority)
+
+    def _estimate_locked(self, endpoint: str, tokens: int, priority: Priority, position: tuple = None) -> float:
+        """
+        :param position: 이미 대기열에 있는 요청의 항목 (없으면 지금 새로 들어오는 요청으로 계산)
+        """
+        budget = self._budget(endpoint)
+        now = time.monotonic()
+        budget.refill(now)
+        if position is None:
+            ahead = [entry for entry in self._waiting[endpoint] if entry[0] <= priority]
+        else:
+            ahead = [entry for entry in self._waiting[endpoint] if entry[:2] < position[:2]] # 힙 순서상 앞선 요청만
+        return budget.time_until(len(ahead) + 1, sum(entry[2] for entry in ahead) + tokens, now)
+
+    def acquire(self, endpoint: str, tokens: int = 0, priority: Priority = None, max_wait: float = None) -> float:
+        """
+        예산이 확보될 때까지 기다린 후 요청 한 건 분량을 차감합니다.
+        :param endpoint: 엔드포인트 이름 (whisper-1, moderation, gpt-4o, embeddings, dall-e-3 등)
+        :param tokens: 예상 토큰 수 (TPM 계산용)
+        :param priority: 요청 우선순위 (없으면 현재 컨텍스트의 우선순위)
+        :param max_wait: 최대 대기 시간(초), 없으면 스케줄러 기본값
+        :return: 실제로 기다린 시간(초)
+        :raises RateLimitWait: 예상 대기 시간이 max_wait를 넘는 경우
+        """
+        priority = _current_priority.get() if priority is None else priority
+        max_wait = self.max_wait_seconds if max_wait is None else max_wait
+        started = time.monotonic()
+        with self._condition:
+            eta = self._estimate_locked(endpoint, tokens, priority)
+            if eta > max_wait:
+                raise RateLimitWait(endpoint, eta)
+            entry = (int(priority), next(self._sequence), tokens)
+            queue = self._waiting[endpoint]
+            heapq.heappush(queue, entry)
+            try:
+                while True:
+                    budget = self.budgets[endpoint]
+                    now = time.monotonic()
+                    budget.refill(now)
+                    if queue[0] is entry:
+                        wait = budget.time_until(1, tokens, now)
+                        if wait <= 0:
+                            budget.consume(tokens)
+                            return time.monotonic() - started
+                    else:
+                        wait = 0.05 # 앞선 요청이 빠질 때까지 짧게 대기
+                    if now - started > max_wait:
+                        # 앞선 요청과 예산을 다시 계산한 예상 대기 시간을 알림 (앞선 요청을 기다리던 경우의 짧은 대기 간격이 아님)
+                        raise RateLimitWait(endpoint, self._estimate_locked(endpoint, tokens, priority, entry))
+                    self._condition.wait(min(wait, 1.0))
+            finally:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._condition.notify_all()
+
+    def reconcile(self, endpoint: str, reserved_tokens: int, actual_tokens: Optional[int]) -> None:
+        """
+        acquire에서 추정치로 차감한 토큰을 API가 알려준 실제 사용량으로 보정합니다.
+        추정이 계속 빗나가도 TPM 예산이 실제 사용량에서 멀어지지 않습니다.
+        :param actual_tokens: 응답의 사용량(입력 + 출력 토큰), 알 수 없으면 None (보정하지 않음)
+        """
+        if actual_tokens is None:
+            return
+        with self._condition:
+            budget = self._budget(endpoint)
+            budget.refill(time.monotonic())
+            budget.correct_tokens(reserved_tokens, actual_tokens)
+            self._condition.notify_all()
+
+    def update_from_headers(self, endpoint: str, headers, status_code: int = 200) -> None:
+        """API 응답의 x-ratelimit-* 헤더와 429 응답을 예산에 반영합니다."""
+        with self._condition:
+            budget = self._budget(endpoint)
+            now = time.monotonic()
+            budget.refill(now)
+            budget.apply_headers(headers, now)
+            if status_code == 429:
+                retry_after = headers.get("retry-after")
+                pause = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else 1.0
+                budget.blocked_until = max(budget.blocked_until, now + pause)
+            self._condition.notify_all()
+
+
+# 프로세스 전체에서 공유하는 스케줄러
+scheduler = RateLimitScheduler(config.RATE_LIMITS, max_wait_seconds=config.RATE_LIMIT_MAX_WAIT_SECONDS)
+
+# 요청 경로 → 스케줄러 엔드포인트 이름
+_PATH_ENDPOINTS = {
+    "/audio/transcriptions": "whisper-1",
+    "/moderations": "moderation",
+    "/embeddings": "embeddings",
+    "/images/generations": "dall-e-3",
+}
+
+
+def endpoint_for_request(request: httpx.Request) -> Optional[str]:
+    """HTTP 요청에서 스케줄러 엔드포인트 이름을 찾습니다. 채팅 요청은 모델 이름을 사용합니다."""
+    path = request.url.path
+    for suffix, endpoint in _PATH_ENDPOINTS.items():
+        if path.endswith(suffix):
+            return endpoint
+    if path.endswith("/chat/completions"):
+        try:
+            return json.loads(request.content).get("model")
+        except Exception:
+            return None
+    return None
+
+
+def _apply_timeout(request: httpx.Request) -> None:
+    # 호출 정책의 제한 시간과 요청의 남은 예산을 HTTP 요청 자체의 제한 시간으로 적용
+    # (시간이 지나면 연결이 끊기므로 응답을 기다리지 않고 버린 요청이 뒤에서 계속 실행되지 않음)
+    seconds = http_timeout()
+    if seconds is None:
+        return
+    seconds = max(seconds, 0.01)
+    current = request.extensions.get("timeout") or {}
+    request.extensions["timeout"] = {
+        phase: seconds if current.get(phase) is None else min(current[phase], seconds)
+        for phase in ("connect", "read", "write", "pool")
+    }
+
+
+class AttemptHandle:
+    """
+    헤징 중인 시도 하나가 사용하는 HTTP 연결입니다. cancel()하면 소켓을 끊어
+    응답을 기다리던 요청이 바로 실패하고, OpenAI 쪽에서도 연결이 끊긴 요청으로 처리됩니다.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sockets: List[socket.socket] = []
+        self.cancelled = False
+
+    def _track(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sockets.append(sock)
+            cancelled = self.cancelled
+        if cancelled: # 연결 직후 이미 취소된 경우
+            _shutdown(sock)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            sockets = list(self._sockets)
+        for sock in sockets:
+            _shutdown(sock)
+
+
+def _shutdown(sock: socket.socket) -> None:
+    try:
+        sock.shutdown(socket.SHUT_RDWR) # 다른 스레드의 recv()도 바로 깨움 (close()만으로는 깨지 않음)
+    except OSError:
+        pass # 이미 닫힌 소켓
+
+
+_current_attempt: contextvars.ContextVar = contextvars.ContextVar("current_attempt", default=None)
+
+
+@contextmanager
+def attempt_handle(handle: AttemptHandle):
+    """with 블록 안에서 보내는 HTTP 요청을 handle로 취소할 수 있게 합니다. (core.resilience의 헤징에서 사용)"""
+    token = _current_attempt.set(handle)
+    try:
+        yield handle
+    finally:
+        _current_attempt.reset(token)
+
+
+class _ClosingStream(httpx.SyncByteStream):
+    """응답 본문을 다 읽고 닫을 때 시도 전용 연결도 함께 닫습니다."""
+    def __init__(self, stream: httpx.SyncByteStream, transport: httpx.HTTPTransport):
+        self._stream = stream
+        self._transport = transport
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._transport.close()
+
+
+class _AttemptTransport(httpx.BaseTransport):
+    """
+    평소에는 공용 연결 풀을 사용하고, 취소할 수 있는 시도(attempt_handle 안)의 요청만 전용 연결로 보냅니다.
+    공용 연결은 다른 요청과 함께 쓰므로 끊을 수 없고, 연결 재사용 시에는 소켓을 알 수 없기 때문입니다.
+    """
+    def __init__(self):
+        self._shared = httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        handle = _current_attempt.get()
+        if handle is None:
+            return self._shared.handle_request(request)
+        if handle.cancelled:
+            raise httpx.ReadError("헤징에서 진 시도라 요청을 보내지 않았습니다.", request=request)
+
+        def trace(event: str, info: dict) -> None:
+            # TCP 연결(과 TLS 연결)이 만들어지면 소켓을 기록해 두었다가 취소 시 끊음
+            if event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                sock = info["return_value"].get_extra_info("socket")
+                if sock is not None:
+                    handle._track(sock)
+        request.extensions["trace"] = trace
+        transport = httpx.HTTPTransport()
+        try:
+            response = transport.handle_request(request)
+        except BaseException:
+            transport.close()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, stream=_ClosingStream(response.stream, transport),
+                              extensions=response.extensions, request=request)
+
+    def close(self) -> None:
+        self._shared.close()
+
+
+def _on_response(response: httpx.Response) -> None:
+    endpoint = endpoint_for_request(response.request)
+    if endpoint:
+        scheduler.update_from_headers(endpoint, response.headers, response.status_code)
+
+
+def build_http_client(**kwargs) -> httpx.Client:
+    """
+    응답 헤더를 스케줄러에 전달하고, 호출 정책의 제한 시간을 요청마다 적용하는 httpx 클라이언트를 생성합니다.
+    OpenAI, ChatOpenAI, OpenAIEmbeddings의 http_client 인자로 전달합니다. (클라이언트 자체 재시도는 max_retries=0으로 끔)
+    헤징에서 진 시도는 attempt_handle로 연결을 끊어 취소합니다.
+    """
+    kwargs.setdefault("transport", _AttemptTransport())
+    return httpx.Client(event_hooks={"request": [_apply_timeout], "response": [_on_response]}, **kwargs)
@@ -0,0 +1,310 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, TypeVar
+
+import openai # 재시도 가능한 오류 종류를 판별하기 위해 임포트
+
+from core import config
+from core.deadline import DeadlineExceeded, call_timeout, cancellation_metrics, current_request
+from core.rate_limiter import AttemptHandle, RateLimitWait, attempt_handle, scheduler
+from core.structured_logging import get_logger
+from core.tracing import register_json_endpoint
+
+logger = get_logger("core.resilience")
+
+T = TypeVar("T")
+
+
+@dataclass
+class ResiliencePolicy:
+    """서비스 메서드별 재시도 / 타임아웃 / 헤징 정책"""
+    max_attempts: int = 3 # 최대 시도 횟수 (첫 시도 포함)
+    base_delay: float = 0.5 # 재시도 대기 시간의 기준값(초), 시도마다 2배씩 증가
+    max_delay: float = 8.0 # 재시도 대기 시간 상한(초)
+    timeout: Optional[float] = None # 시도 한 번의 제한 시간(초), HTTP 요청의 제한 시간으로 적용
+    idempotent: bool = True # False면 서버가 요청을 처리했을 수 있는 오류(타임아웃, 연결 끊김)는 재시도하지 않고 헤징도 하지 않음
+    hedge: bool = False # 느린 요청에 대해 중복 요청을 보낼지 여부
+    hedge_quantile: float = 0.95 # 이 분위수의 지연 시간이 지나면 중복 요청 전송
+    hedge_min_delay: float = 0.2 # 중복 요청 전 최소 대기 시간(초)
+    hedge_budget_ratio: float = 0.05 # 전체 호출 중 헤징을 허용하는 최대 비율 (과도한 비용 방지)
+
+
+class CircuitOpenError(Exception):
+    """엔드포인트의 회로 차단기가 열려 있어 요청을 보내지 않았을 때 발생하는 예외"""
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"{endpoint} 서비스가 일시적으로 불안정합니다. 약 {retry_after:.0f}초 후에 다시 시도해주세요.")
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, (openai.APITimeoutError, TimeoutError))
+
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    일시적인 오류(연결 실패, 타임아웃, 429, 5xx)인지 판별합니다.
+    :param idempotent: False면 요청이 서버에 도달했을 수 있는 타임아웃/연결 오류는 재시도하지 않음 (이미지 생성 등 비용이 드는 호출의 중복 방지)
+    """
+    if isinstance(error, (openai.APIConnectionError, TimeoutError)): # APITimeoutError 포함
+        return idempotent
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    연속된 일시적 오류가 임계값을 넘으면 일정 시간 요청을 차단하는 회로 차단기입니다.
+    차단 시간이 지나면 한 건의 시험 요청(half-open)으로 복구 여부를 확인합니다.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None # 차단이 시작된 시각 (None이면 닫힘)
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self.trial_in_flight:
+                self.trial_in_flight = True # half-open: 시험 요청 한 건만 허용
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self) -> None:
+        """엔드포인트 상태와 무관한 오류일 때 시험 요청 자리만 반납합니다."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """최근 성공 호출의 지연 시간을 보관하여 분위수를 계산합니다."""
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """샘플이 min_samples개 미만이면 None을 반환합니다."""
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# 프로세스 공용 상태
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_hedge_counts: Dict[str, list] = {} # 이름 → [전체 호출 수, 헤징 횟수]
+_hedge_losers: Dict[str, int] = {} # 이름 → 먼저 끝난 쪽이 있어 연결을 끊은(취소한) 시도 수
+_state_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    with _state_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_SECONDS)
+        return _breakers[endpoint]
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    with _state_lock:
+        if name not in _latencies:
+            _latencies[name] = LatencyTracker()
+        return _latencies[name]
+
+
+def get_policy(name: str) -> ResiliencePolicy:
+    """config.RESILIENCE_POLICIES에서 서비스 메서드의 정책을 찾고, 없으면 기본 정책을 반환합니다."""
+    return ResiliencePolicy(**config.RESILIENCE_POLICIES.get(name, {}))
+
+
+def _take_hedge_slot(name: str, ratio: float) -> bool:
+    with _state_lock:
+        counts = _hedge_counts.setdefault(name, [0, 0])
+        if counts[1] + 1 > counts[0] * ratio:
+            return False
+        counts[1] += 1
+        return True
+
+
+def _count_call(name: str) -> None:
+    with _state_lock:
+        _hedge_counts.setdefault(name, [0, 0])[0] += 1
+
+
+def hedge_snapshot() -> Dict[str, dict]:
+    """이름별 전체 호출 수, 헤징(중복 요청) 수, 취소한 느린 시도 수"""
+    with _state_lock:
+        return {
+            name: {"calls": calls, "hedges": hedges, "losers_cancelled": _hedge_losers.get(name, 0)}
+            for name, (calls, hedges) in _hedge_counts.items()
+        }
+
+
+def _start(name: str, fn: Callable[[], T], handle: AttemptHandle) -> Future:
+    # 헤징 중인 시도는 각자 전용 스레드에서 실행 (공용 풀을 쓰면 중첩 호출에서 스레드가 고갈될 수 있음)
+    future = Future()
+    context = contextvars.copy_context() # 호출자의 컨텍스트(요청 예산, 우선순위, 제한 시간 등)를 유지
+
+    def run():
+        try:
+            with attempt_handle(handle): # 이 시도의 HTTP 요청은 handle.cancel()로 끊을 수 있음
+                future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=context.run, args=(run,), name=f"hedge-{name}", daemon=True).start()
+    return future
+
+
+register_json_endpoint("/hedging", hedge_snapshot)
+
+
+def _cancel_losers(name: str, attempts: Dict[Future, AttemptHandle], winner: Future) -> None:
+    # 먼저 성공한 시도가 있으면 나머지 시도의 연결을 끊어 응답 생성 비용이 더 들지 않게 함
+    losers = [handle for future, handle in attempts.items() if future is not winner and not future.done()]
+    for handle in losers:
+        handle.cancel()
+    if losers:
+        with _state_lock:
+            _hedge_losers[name] = _hedge_losers.get(name, 0) + len(losers)
+
+
+def _attempt(name: str, endpoint: str, fn: Callable[[], T], policy: ResiliencePolicy, tokens: Optional[int]) -> T:
+    """
+    시도 한 번을 실행합니다. 제한 시간은 HTTP 클라이언트가 요청 자체에 적용하므로(core.rate_limiter.build_http_client)
+    여기서는 기다리다 버리지 않고, 느린 요청에 대한 헤징만 처리합니다.
+    """
+    hedge_delay = None
+    if policy.hedge and policy.idempotent:
+        observed = get_latency_tracker(name).quantile(policy.hedge_quantile)
+        if observed is not None:
+            hedge_delay = max(policy.hedge_min_delay, observed)
+    if hedge_delay is None:
+        return fn()
+
+    handle = AttemptHandle()
+    primary = _start(name, fn, handle)
+    attempts = {primary: handle}
+    done, _ = wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result()
+    # p95를 넘긴 느린 요청: 헤징 예산과 속도 제한 예산이 바로 허락하면 중복 요청을 보내고 먼저 성공한 결과를 사용
+    if _take_hedge_slot(name, policy.hedge_budget_ratio):
+        try:
+            if tokens is not None:
+                scheduler.acquire(endpoint, tokens, max_wait=0)
+            handle = AttemptHandle()
+            attempts[_start(name, fn, handle)] = handle
+        except RateLimitWait:
+            pass
+    futures = set(attempts)
+    last_error = None
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                _cancel_losers(name, attempts, future) # 느린 쪽은 연결을 끊어 취소
+                return future.result()
+            last_error = future.exception()
+    raise last_error
+
+
+def call_with_resilience(name: str, endpoint: str, fn: Callable[[], T], policy: ResiliencePolicy = None,
+                         tokens: Optional[int] = None) -> T:
+    """
+    재시도(지수 백오프 + 지터), 회로 차단기, 헤징을 적용하여 fn을 호출합니다.
+    시도마다 정책의 제한 시간과 요청의 남은 예산 중 짧은 쪽을 HTTP 요청의 제한 시간으로 적용하고, 취소된 요청은 호출하지 않습니다.
+    :param name: 정책 및 지연 시간 통계를 구분하는 이름 (예: "ImageGeneratorService.generate_image_from_prompt")
+    :param endpoint: 회로 차단기와 속도 제한 예산을 공유할 엔드포인트 이름 (예: "dall-e-3")
+    :param fn: 실제 API 호출을 수행하는 인자 없는 함수 (재시도 시 다시 호출됨)
+    :param policy: (선택 사항) 정책, 없으면 config에서 name으로 조회
+    :param tokens: (선택 사항) 시도마다 공용 스케줄러에서 확보할 예상 토큰 수 (None이면 속도 제한 예산을 확보하지 않음)
+                   예산을 기다리는 시간은 시도의 제한 시간에 포함되지 않습니다.
+    :raises CircuitOpenError: 회로 차단기가 열려 있는 경우
+    :raises RateLimitWait: 허용된 대기 시간 안에 속도 제한 예산을 확보할 수 없는 경우
+    :raises PipelineCancelled: 요청이 취소된 경우
+    :raises DeadlineExceeded: 요청 예산을 모두 사용한 경우
+    """
+    policy = policy or get_policy(name)
+    breaker = get_breaker(endpoint)
+    tracker = get_latency_tracker(name)
+    request = current_request()
+    _count_call(name)
+
+    for attempt in range(1, policy.max_attempts + 1):
+        if request is not None:
+            request.check(name, tracker.quantile(0.5, min_samples=1) or 0.0)
+        if not breaker.allow():
+            raise CircuitOpenError(endpoint, breaker.retry_after())
+        if tokens is not None:
+            try:
+                # 시도 밖에서 예산을 확보 (요청 예산이 있으면 그보다 오래 기다리지 않음)
+                max_wait = scheduler.max_wait_seconds if request is None else min(scheduler.max_wait_seconds, request.remaining())
+                scheduler.acquire(endpoint, tokens, max_wait=max_wait)
+            except Exception:
+                breaker.release()
+                raise
+            if request is not None:
+                request.check(name)
+        started = time.monotonic()
+        try:
+            with call_timeout(policy.timeout):
+                result = _attempt(name, endpoint, fn, policy, tokens)
+        except Exception as e:
+            retryable = is_retryable(e, policy.idempotent)
+            if retryable:
+                breaker.record_failure() # 일시적 오류만 차단기 실패로 집계
+            elif isinstance(e, openai.APIStatusError):
+                breaker.record_success() # 서버가 응답한 입력 오류 등은 엔드포인트가 정상이라는 뜻
+            else:
+                breaker.release()
+            if request is not None and request.remaining() <= 0 and _is_timeout(e):
+                cancellation_metrics.record_deadline(name)
+                raise DeadlineExceeded(name) from e
+            if not retryable or attempt == policy.max_attempts:
+                raise
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** (attempt - 1)))) # full jitter
+            if request is not None:
+                delay = min(delay, request.remaining())
+            logger.warning("%s - 일시적 오류로 %.2f초 후 재시도합니다 (%d/%d): %s", name, delay, attempt, policy.max_attempts, e,
+                           extra={"call": name, "endpoint": endpoint, "attempt": attempt})
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        tracker.record(time.monotonic() - started)
+        return result
@@ -0,0 +1,200 @@
+"""
+세션별 파이프라인 결과(전사문, 리포트, 프롬프트, 이미지 URL 등)를 재개 토큰으로 저장하는 저장소입니다.
+브라우저 새로고침이나 웹소켓 재연결로 Streamlit 세션 상태가 사라져도 URL의 토큰으로 결과를 바로 복원합니다.
+
+URL의 토큰만으로는 복원되지 않습니다. 저장할 때 서버가 발급해 브라우저 쿠키에 둔 비밀값(owner)의 해시를 함께 기록하고,
+복원할 때 같은 비밀값을 가진 브라우저에만 결과를 돌려줍니다. (공유된 링크나 다른 기기의 방문 기록으로는 복원되지 않음)
+복원에 성공하면 토큰을 새로 발급하여(claim) 같은 URL을 연 두 탭이 서로의 결과를 덮어쓰지 않게 합니다.
+
+저장소는 공유 캐시와 같은 백엔드(SQLite WAL 파일 또는 Redis 호환 서버)를 사용하므로,
+공유 볼륨이나 Redis를 지정하면 재연결이 다른 레플리카로 가도 복원됩니다.
+
+이미지 URL은 URL마다 만들어진 시각을 함께 저장하고 각각 따로 만료시킵니다.
+이미지 캐시는 이전에 만든 URL을 돌려줄 수 있으므로, 이미지 서비스가 새 URL을 받을 때 record_image_created로 생성 시각을 기록합니다.
+"""
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from core import config
+from core.shared_cache import RedisBackend, SQLiteBackend, make_key, shared_cache
+from core.structured_logging import get_logger
+
+logger = get_logger("core.session_store")
+
+_TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+IMAGE_URL_KEYS = ("nightmare_image_url", "reconstructed_image_url") # 만료되는 DALL-E 이미지 URL을 담는 세션 상태 키
+
+
+def record_image_created(url: str, created_at: float = None) -> None:
+    """
+    이미지 URL이 만들어진 시각을 공유 캐시에 기록합니다. (이미지 서비스가 새 URL을 받았을 때 호출)
+    이미지 캐시가 같은 URL을 나중에 돌려줘도 세션 저장소는 이 시각부터 만료를 계산합니다.
+    """
+    # 이미지 캐시 항목보다 조금 더 오래 보관 (캐시가 URL을 돌려주는 동안에는 항상 생성 시각을 찾을 수 있도록)
+    shared_cache.set(make_key("image_created", url), created_at or time.time(), ttl=shared_cache.ttl("image") + 60)
+
+
+def _owner_hash(owner: str) -> str:
+    """브라우저 비밀값은 그대로 저장하지 않고 해시만 저장"""
+    return hashlib.sha256(owner.encode("utf-8")).hexdigest()
+
+
+class SessionStore:
+    """
+    재개 토큰 → 세션 결과 저장소입니다. 저장할 때마다 만료 시간이 연장됩니다.
+    """
+    def __init__(self, backend, ttl_seconds: float, image_url_seconds: float = None):
+        """
+        :param backend: SQLiteBackend 또는 RedisBackend (None이면 저장하지 않음)
+        :param ttl_seconds: 마지막 저장 후 보관 시간(초)
+        :param image_url_seconds: 이미지 URL을 복원할 수 있는 시간(초), 지나면 URL만 빼고 복원 (DALL-E URL 만료)
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.image_url_seconds = image_url_seconds
+        self._lock = threading.Lock()
+        self._image_created: "OrderedDict[str, float]" = OrderedDict() # 저장/복원할 때 확인한 URL → 생성 시각 (최근 항목만 보관)
+        self._image_created_limit = 4096
+
+    @staticmethod
+    def new_token() -> str:
+        return secrets.token_urlsafe(16)
+
+    @staticmethod
+    def new_owner_secret() -> str:
+        """브라우저 쿠키에 둘 비밀값 (재개 토큰과 따로 발급)"""
+        return secrets.token_urlsafe(32)
+
+    @staticmethod
+    def is_valid_token(token: Optional[str]) -> bool:
+        return bool(token) and _TOKEN_PATTERN.match(token) is not None
+
+    def _load_entry(self, token: str, owner: Optional[str]) -> Optional[Tuple[dict, float]]:
+        """소유자가 일치하는 저장 항목과 만료 시각, 없거나 소유자가 다르면 None"""
+        if self.backend is None or not self.is_valid_token(token) or not owner:
+            return None
+        try:
+            entry = self.backend.get(f"session:{token}")
+        except Exception as e:
+            logger.warning("세션 결과를 불러오지 못했습니다: %s", e)
+            return None
+        if entry is None:
+            return None
+        saved = json.loads(entry[0])
+        if not hmac.compare_digest(saved.get("owner", ""), _owner_hash(owner)):
+            logger.warning("다른 브라우저의 재개 토큰으로 복원을 시도했습니다.")
+            return None
+        return saved, entry[1]
+
+    def load(self, token: str, owner: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        :param owner: 요청한 브라우저의 비밀값 (쿠키)
+        :return: 저장된 세션 결과, 없거나 만료되었거나 다른 브라우저의 결과이거나 읽을 수 없으면 None
+        """
+        loaded = self._load_entry(token, owner)
+        if loaded is None:
+            return None
+        return self._restorable_state(loaded[0])
+
+    def claim(self, token: str, owner: Optional[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        저장된 결과를 새 토큰으로 옮기고 이전 토큰은 삭제합니다. (저장 시각과 만료 시각은 그대로 유지)
+        같은 URL로 여러 탭이 열려도 각 탭이 서로 다른 토큰에 저장하게 됩니다.
+        :return: (새 토큰, 세션 결과), 복원할 수 없으면 None
+        """
+        loaded = self._load_entry(token, owner)
+        if loaded is None:
+            return None
+        saved, expires_at = loaded
+        new_token = self.new_token()
+        try:
+            self.backend.set(f"session:{new_token}", "session", json.dumps(saved, ensure_ascii=False, separators=(",", ":")), expires_at)
+            self.backend.delete(f"session:{token}")
+        except Exception as e:
+            logger.warning("세션 결과를 새 토큰으로 옮기지 못했습니다: %s", e)
+            return None
+        return new_token, self._restorable_state(saved)
+
+    def _remember_image(self, url: str, created_at: float) -> None:
+        with self._lock:
+            self._image_created[url] = created_at
+            self._image_created.move_to_end(url)
+            while len(self._image_created) > self._image_created_limit:
+                self._image_created.popitem(last=False)
+
+    def _image_created_at(self, url: str) -> float:
+        """URL의 생성 시각: 이미 확인한 값 → 이미지 서비스가 기록한 값 → 지금(처음 본 시각) 순으로 사용"""
+        with self._lock:
+            created_at = self._image_created.get(url)
+        if created_at is None:
+            recorded = shared_cache.get(make_key("image_created", url))
+            created_at = recorded if isinstance(recorded, (int, float)) else time.time()
+        self._remember_image(url, created_at)
+        return created_at
+
+    def _restorable_state(self, saved: dict) -> Dict[str, Any]:
+        state = saved["state"]
+        image_created = saved.get("image_created", {})
+        for key in IMAGE_URL_KEYS:
+            url = state.get(key)
+            if not url or not url.startswith("http"):
+                continue
+            created_at = image_created.get(key, saved["saved_at"]) # 이전 버전 항목은 저장 시각 기준
+            if self.image_url_seconds is not None and time.time() - created_at > self.image_url_seconds:
+                state[key] = "" # 만료된 URL 대신 이미지 버튼을 다시 보여줌 (프롬프트는 그대로 재사용)
+            else:
+                self._remember_image(url, created_at) # 복원한 뒤 다시 저장할 때도 같은 생성 시각 사용
+        return state
+
+    def save(self, token: str, state: Dict[str, Any], owner: str) -> None:
+        """
+        세션 결과를 저장합니다. 저장에 실패해도 화면 흐름은 계속 진행합니다.
+        :param owner: 이 결과를 복원할 수 있는 브라우저의 비밀값 (쿠키)
+        """
+        if self.backend is None or not self.is_valid_token(token) or not owner:
+            return
+        image_created = {
+            key: self._image_created_at(state[key]) for key in IMAGE_URL_KEYS if str(state.get(key) or "").startswith("http")
+        }
+        raw = json.dumps({"saved_at": time.time(), "owner": _owner_hash(owner), "state": state, "image_created": image_created},
+                         ensure_ascii=False, separators=(",", ":"))
+        try:
+            self.backend.set(f"session:{token}", "session", raw, time.time() + self.ttl_seconds)
+        except Exception as e:
+            logger.warning("세션 결과를 저장하지 못했습니다: %s", e)
+
+    def delete(self, token: str) -> None:
+        if self.backend is None or not self.is_valid_token(token):
+            return
+        try:
+            self.backend.delete(f"session:{token}")
+        except Exception as e:
+            logger.warning("세션 결과를 삭제하지 못했습니다: %s", e)
+
+
+def snapshot(state, keys: Iterable[str]) -> Dict[str, Any]:
+    """세션 상태에서 저장할 항목만 골라 냅니다. (st.session_state 또는 딕셔너리)"""
+    return {key: state[key] for key in keys if key in state}
+
+
+def _build_session_store() -> SessionStore:
+    backend = None
+    try:
+        if config.SESSION_STORE_BACKEND == "sqlite":
+            backend = SQLiteBackend(config.SESSION_STORE_PATH)
+        elif config.SESSION_STORE_BACKEND == "redis":
+            backend = RedisBackend(config.CACHE_REDIS_URL, prefix="dreamcode:")
+    except Exception as e:
+        logger.warning("세션 저장소(%s)를 사용할 수 없어 결과를 저장하지 않습니다: %s", config.SESSION_STORE_BACKEND, e)
+    return SessionStore(backend, config.SESSION_TTL_SECONDS, config.CACHE_TTL_SECONDS["image"])
+
+
+# 프로세스 전체에서 공유하는 세션 결과 저장소
+session_store = _build_session_store()
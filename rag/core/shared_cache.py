@@ -0,0 +1,303 @@
+"""
+서비스 호출 결과(전사, 검열 판정, 임베딩, 리포트, 프롬프트, 이미지)를 저장하는 2단계 캐시입니다.
+
+- 1단계: 프로세스 안의 LRU (가장 빠름, 재시작 시 사라짐)
+- 2단계: 여러 레플리카가 함께 쓰는 공유 저장소 (SQLite WAL 파일 또는 Redis 호환 서버)
+
+항목은 네임스페이스(단계)별 TTL로 만료되고, 캐시 미스는 core.single_flight를 거치므로
+같은 키를 동시에 계산하려는 요청은 프로세스 안과 레플리카 사이에서 한 번만 계산됩니다.
+(캐시가 비어 있을 때 같은 요청이 몰려도 API 호출은 한 번만 나가도록 하는 stampede 방지)
+"""
+import functools
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core import config
+from core.single_flight import SingleFlight
+from core.structured_logging import get_logger
+
+logger = get_logger("core.shared_cache")
+
+_MISSING = object()
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """네임스페이스와 입력값으로 캐시 키를 만듭니다. (입력값은 JSON으로 직렬화해 해시)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def file_digest(path: str) -> str:
+    """파일 내용의 SHA-256 (경로가 달라도 같은 녹음이면 같은 키)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LRUTier:
+    """프로세스 안의 LRU 캐시 (값은 JSON 문자열로 저장해 호출자가 결과를 수정해도 캐시에 영향이 없음)"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, raw: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (raw, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteBackend:
+    """
+    SQLite(WAL) 파일 기반 공유 저장소입니다. 같은 호스트(또는 공유 볼륨)의 여러 프로세스가 함께 사용합니다.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local() # 스레드마다 연결 하나
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None) # 자동 커밋
+            conn.execute("PRAGMA journal_mode=WAL") # 여러 프로세스가 동시에 써도 읽기를 막지 않음
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, "
+                         "value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._conn().execute("SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, namespace: str, raw: str, expires_at: float) -> None:
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, namespace, value, expires_at) VALUES (?, ?, ?, ?)",
+                     (key, namespace, raw, expires_at))
+        if random.random() < 0.01: # 가끔 만료된 항목 정리
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def acquire_lock(self, key: str, owner: str, seconds: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?", (key, now))
+        return conn.execute("INSERT OR IGNORE INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?)",
+                            (key, owner, now + seconds)).rowcount == 1
+
+    def lock_held(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM cache_locks WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone() is not None
+
+    def release_lock(self, key: str, owner: str) -> None:
+        self._conn().execute("DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, owner))
+
+
+class RedisBackend:
+    """
+    Redis 호환 서버 기반 공유 저장소입니다. 여러 호스트의 레플리카가 함께 사용합니다. (redis 패키지 필요)
+    """
+    def __init__(self, url: str, prefix: str = "dreamcode:cache:"):
+        import redis # 선택 의존성이므로 사용할 때만 임포트
+
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0, decode_responses=True)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + key)
+        pipe.pttl(self.prefix + key)
+        raw, ttl_ms = pipe.execute()
+        return (raw, time.time() + max(ttl_ms, 0) / 1000) if raw is not None else None
+
+    def set(self, key: str, namespace: str, raw: str, expires_at: float) -> None:
+        self.client.set(self.prefix + key, raw, px=max(1, int((expires_at - time.time()) * 1000)))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def acquire_lock(self, key: str, owner: str, seconds: float) -> bool:
+        return bool(self.client.set(f"{self.prefix}lock:{key}", owner, nx=True, px=int(seconds * 1000)))
+
+    def lock_held(self, key: str) -> bool:
+        return bool(self.client.exists(f"{self.prefix}lock:{key}"))
+
+    def release_lock(self, key: str, owner: str) -> None:
+        if self.client.get(f"{self.prefix}lock:{key}") == owner:
+            self.client.delete(f"{self.prefix}lock:{key}")
+
+
+def build_backend(kind: str):
+    """
+    :param kind: sqlite / redis / memory (memory와 off는 공유 저장소 없이 LRU만 사용)
+    """
+    if kind == "sqlite":
+        return SQLiteBackend(config.CACHE_SQLITE_PATH)
+    if kind == "redis":
+        return RedisBackend(config.CACHE_REDIS_URL)
+    return None
+
+
+class SharedCache:
+    """
+    LRU와 공유 저장소로 이루어진 2단계 캐시입니다.
+    공유 저장소 오류는 요청을 실패시키지 않고 캐시 없이 계산하는 것으로 대체합니다.
+    """
+    def __init__(self, backend=None, max_entries: int = 2048, ttl_seconds: Dict[str, float] = None,
+                 flights: SingleFlight = None, enabled: bool = True):
+        """
+        :param backend: 공유 저장소 (SQLiteBackend, RedisBackend 또는 None)
+        :param max_entries: LRU 최대 항목 수
+        :param ttl_seconds: 네임스페이스별 TTL(초), 없는 네임스페이스는 "default" 값
+        :param flights: 캐시 미스를 합칠 single-flight (없으면 프로세스 안에서만 합침)
+        :param enabled: False면 저장/조회 없이 항상 계산 (CACHE_BACKEND=off)
+        """
+        self.backend = backend
+        self.local = LRUTier(max_entries)
+        self.ttl_seconds = ttl_seconds or {}
+        self.flights = flights or SingleFlight()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, name: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {"local_hits": 0, "shared_hits": 0, "misses": 0, "errors": 0})
+            stats[name] += 1
+
+    def ttl(self, namespace: str) -> float:
+        return self.ttl_seconds.get(namespace, self.ttl_seconds.get("default", 3600))
+
+    def _shared(self, operation: str, *args, default=None):
+        if self.backend is None:
+            return default
+        try:
+            return getattr(self.backend, operation)(*args)
+        except Exception as e:
+            self._count(args[0].split(":", 1)[0], "errors")
+            logger.warning("공유 캐시 %s 실패, 캐시 없이 진행합니다: %s", operation, e)
+            return default
+
+    def get(self, key: str) -> Any:
+        """
+        :return: 저장된 값, 없으면 _MISSING (None도 값으로 저장될 수 있으므로 구분)
+        """
+        namespace = key.split(":", 1)[0]
+        raw = self.local.get(key)
+        if raw is not None:
+            self._count(namespace, "local_hits")
+            return json.loads(raw)
+        entry = self._shared("get", key)
+        if entry is not None:
+            self.local.set(key, entry[0], entry[1]) # 다음 조회는 LRU에서
+            self._count(namespace, "shared_hits")
+            return json.loads(entry[0])
+        return _MISSING
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        namespace = key.split(":", 1)[0]
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + (self.ttl(namespace) if ttl is None else ttl)
+        self.local.set(key, raw, expires_at)
+        self._shared("set", key, namespace, raw, expires_at)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        self._shared("delete", key)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], accept: Callable[[Any], bool] = None, ttl: float = None) -> Any:
+        """
+        캐시에 있으면 반환하고, 없으면 compute()로 계산해 저장합니다.
+        캐시 미스는 single-flight를 거치므로 같은 키를 동시에 계산하려는 요청은 한 번만 실행됩니다. (캐시를 끈 경우에도 적용)
+        :param accept: 저장할 결과인지 판정하는 함수 (오류 안내 문자열 등은 저장하지 않음)
+        """
+        if self.enabled:
+            value = self.get(key)
+            if value is not _MISSING:
+                return value
+
+        def load_or_compute():
+            if self.enabled:
+                value = self.get(key) # 앞선 호출이나 다른 레플리카가 방금 저장했을 수 있음
+                if value is not _MISSING:
+                    return value
+                self._count(key.split(":", 1)[0], "misses")
+            value = compute()
+            if self.enabled and (accept is None or accept(value)):
+                self.set(key, value, ttl)
+            return value
+
+        return self.flights.do(key, load_or_compute)
+
+    def cached(self, namespace: str, key: Callable[..., tuple] = None, accept: Callable[[Any], bool] = None, version: str = ""):
+        """
+        서비스 메서드의 결과를 캐시하는 데코레이터입니다.
+        :param namespace: 네임스페이스 (TTL과 통계 구분, 예: "report")
+        :param key: 메서드 인자(self 포함)를 받아 키에 쓸 값을 반환하는 함수 (없으면 self를 제외한 모든 인자)
+        :param accept: 저장할 결과인지 판정하는 함수
+        :param version: 프롬프트 버전 등 결과에 영향을 주는 값 (바뀌면 이전 항목을 쓰지 않음)
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(service, *args, **kwargs):
+                try:
+                    parts = key(service, *args, **kwargs) if key else (args, kwargs)
+                except Exception:
+                    return fn(service, *args, **kwargs) # 키를 만들 수 없으면(예: 파일 없음) 캐시 없이 호출
+                return self.get_or_compute(make_key(namespace, version, parts), lambda: fn(service, *args, **kwargs), accept)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """네임스페이스별 적중/미스 횟수와 적중률"""
+        with self._lock:
+            result = {}
+            for namespace, stats in self._stats.items():
+                hits = stats["local_hits"] + stats["shared_hits"]
+                total = hits + stats["misses"]
+                result[namespace] = dict(stats, hit_rate=hits / total if total else 0.0)
+            return result
+
+
+def _build_shared_cache() -> SharedCache:
+    try:
+        backend = build_backend(config.CACHE_BACKEND)
+    except Exception as e:
+        logger.warning("공유 캐시(%s)를 사용할 수 없어 프로세스 안의 LRU만 사용합니다: %s", config.CACHE_BACKEND, e)
+        backend = None
+    flights = SingleFlight(backend if config.SINGLE_FLIGHT_SCOPE == "shared" else None,
+                           config.SINGLE_FLIGHT_LOCK_SECONDS, config.SINGLE_FLIGHT_RESULT_SECONDS)
+    return SharedCache(backend, config.CACHE_LRU_SIZE, config.CACHE_TTL_SECONDS, flights, enabled=config.CACHE_BACKEND != "off")
+
+
+# 프로세스 전체에서 공유하는 캐시
+shared_cache = _build_shared_cache()
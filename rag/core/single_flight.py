@@ -0,0 +1,152 @@
+"""
+같은 (단계, 입력 해시) 요청이 동시에 여러 번 들어오면 한 번만 실행하고 모든 호출자에게 같은 결과를 돌려주는 single-flight 계층입니다.
+(버튼 두 번 클릭, 같은 꿈을 제출한 두 탭, 캐시가 비어 있을 때 몰린 요청 등)
+
+- 프로세스 안: 먼저 온 호출이 실행하고, 나머지는 그 결과(또는 예외)를 기다립니다.
+  실행한 호출이 자기 요청의 취소나 예산 초과로 끝났다면 그 예외는 기다리던 호출과 무관하므로,
+  기다리던 호출은 다시 합치기를 시도하여 새로 실행하거나 다른 실행을 기다립니다.
+- 레플리카 사이(선택 사항): 공유 저장소의 잠금을 잡은 레플리카가 실행하고 결과를 잠시 게시하며,
+  다른 레플리카는 잠금을 잡거나 결과가 게시될 때까지 요청 예산 안에서 기다립니다.
+  공유 저장소에 연결할 수 없을 때만 잠금 없이 직접 실행합니다.
+"""
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict
+
+from core.deadline import DeadlineExceeded, PipelineCancelled, remaining_or_none
+from core.structured_logging import get_logger
+
+logger = get_logger("core.single_flight")
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    키별로 실행 중인 호출을 하나로 합칩니다. 키는 "단계:입력 해시" 형식입니다. (core.shared_cache.make_key)
+    """
+    def __init__(self, backend=None, lock_seconds: float = 60.0, result_seconds: float = 60.0, enabled: bool = True):
+        """
+        :param backend: 레플리카 간 합치기에 사용할 공유 저장소 (core.shared_cache의 SQLiteBackend/RedisBackend, None이면 프로세스 안만)
+        :param lock_seconds: 다른 레플리카의 실행을 기다리는 최대 시간(초), 실행 중 프로세스가 죽어도 이 시간 뒤에 잠금이 풀림
+        :param result_seconds: 다른 레플리카를 위해 결과를 게시해 두는 시간(초)
+        :param enabled: False면 합치지 않고 항상 실행
+        """
+        self.backend = backend
+        self.lock_seconds = lock_seconds
+        self.result_seconds = result_seconds
+        self.enabled = enabled
+        self.owner = uuid.uuid4().hex # 이 프로세스의 공유 잠금 소유자 ID
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, name: str) -> None:
+        stage = key.split(":", 1)[0]
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"leaders": 0, "local_followers": 0, "remote_followers": 0})
+            stats[name] += 1
+
+    def _shared(self, operation: str, *args, default=None):
+        if self.backend is None:
+            return default
+        try:
+            return getattr(self.backend, operation)(*args)
+        except Exception as e:
+            logger.warning("공유 저장소 %s 실패, 이 프로세스 안에서만 합칩니다: %s", operation, e)
+            return default
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        같은 키로 실행 중인 호출이 있으면 그 결과를 기다리고, 없으면 fn()을 실행합니다.
+        :raises DeadlineExceeded: 요청 예산 안에 앞선 호출이 끝나지 않은 경우
+        """
+        if not self.enabled:
+            return fn()
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+            if leader:
+                break
+            self._count(key, "local_followers")
+            try:
+                return future.result(timeout=remaining_or_none())
+            except FutureTimeoutError:
+                raise DeadlineExceeded(key.split(":", 1)[0]) from None
+            except (PipelineCancelled, DeadlineExceeded):
+                # 실행한 호출의 요청이 취소되었거나 예산을 다 쓴 것이므로 이 호출은 다시 시도
+                # (이 호출 자신의 취소/예산 초과는 fn() 안의 확인이나 위의 대기 시간 초과로 드러남)
+                logger.debug("앞선 호출이 취소되어 다시 합치기를 시도합니다.", extra={"key": key})
+                continue
+
+        try:
+            result = self._lead(key, fn)
+        except BaseException as e:
+            self._forget(key, future) # 다시 시도하는 호출이 끝난 Future를 다시 받지 않도록 먼저 제거
+            future.set_exception(e) # 기다리던 호출도 같은 예외를 받음
+            raise
+        self._forget(key, future)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        # None: 공유 저장소를 사용하지 않거나 연결할 수 없음 (잠금 없이 실행), False: 다른 레플리카가 실행 중
+        locked = self._shared("acquire_lock", key, self.owner, self.lock_seconds, default=None)
+        while locked is False:
+            value = self._wait_remote(key)
+            if value is not _MISSING:
+                self._count(key, "remote_followers")
+                return value
+            locked = self._shared("acquire_lock", key, self.owner, self.lock_seconds, default=None)
+            remaining = remaining_or_none()
+            if locked is False and remaining is not None and remaining <= 0:
+                # 잠금을 잡지 못한 채 실행하면 중복 호출이 되므로, 예산이 끝나면 실행하지 않고 실패
+                raise DeadlineExceeded(key.split(":", 1)[0])
+
+        self._count(key, "leaders")
+        try:
+            result = fn()
+            if locked:
+                self._publish(key, result)
+            return result
+        finally:
+            if locked:
+                self._shared("release_lock", key, self.owner)
+
+    def _publish(self, key: str, result: Any) -> None:
+        try:
+            raw = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return # JSON으로 옮길 수 없는 결과는 이 프로세스 안에서만 공유
+        self._shared("set", f"flight:{key}", "flight", raw, time.time() + self.result_seconds)
+
+    def _wait_remote(self, key: str) -> Any:
+        # 다른 레플리카가 실행 중이면 결과가 게시되거나 잠금이 풀릴 때까지 조회
+        remaining = remaining_or_none()
+        deadline = time.monotonic() + (self.lock_seconds if remaining is None else min(self.lock_seconds, remaining))
+        while True:
+            entry = self._shared("get", f"flight:{key}")
+            if entry is not None:
+                return json.loads(entry[0])
+            if not self._shared("lock_held", key, default=False):
+                entry = self._shared("get", f"flight:{key}") # 게시 직후 잠금이 풀린 경우
+                return json.loads(entry[0]) if entry is not None else _MISSING
+            if time.monotonic() >= deadline:
+                return _MISSING
+            time.sleep(0.2)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """단계별 실행(leaders) 수와 합쳐진 호출(local/remote_followers) 수"""
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in self._stats.items()}
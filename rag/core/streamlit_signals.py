@@ -0,0 +1,12 @@
+from typing import Optional
+
+
+def current_session_id() -> Optional[str]:
+    """현재 Streamlit 세션의 ID (스크립트 실행 컨텍스트가 없으면 None)"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx is not None else None
+    except Exception:
+        return None
@@ -0,0 +1,158 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from typing import Callable, Dict, List
+
+from core import config
+from core.deadline import current_request
+
+# LogRecord의 기본 속성 (이 외의 속성은 extra로 전달된 구조화 필드로 간주)
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# 로그 레코드에 붙일 실행 컨텍스트(세션 ID, trace ID 등)를 돌려주는 함수 목록
+_context_providers: List[Callable[[], Dict[str, str]]] = []
+
+
+def register_context_provider(provider: Callable[[], Dict[str, str]]) -> None:
+    """
+    로그를 남기는 스레드에서 호출되어 레코드에 붙일 필드를 반환하는 함수를 등록합니다.
+    (예: core.tracing이 현재 세션 ID와 trace/span ID를 제공)
+    """
+    _context_providers.append(provider)
+
+
+class ContextFilter(logging.Filter):
+    """요청 ID와 등록된 컨텍스트 필드를 레코드에 붙입니다. (큐에 넣기 전, 로그를 남기는 스레드에서 실행)"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        request = current_request()
+        if request is not None and not hasattr(record, "request_id"):
+            record.request_id = request.request_id
+        for provider in _context_providers:
+            try:
+                for key, value in provider().items():
+                    if value is not None and not hasattr(record, key):
+                        setattr(record, key, value)
+            except Exception:
+                pass # 로그 컨텍스트 때문에 요청이 실패하지 않도록 무시
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    DEBUG 레코드는 debug_rate 비율만 남깁니다. 레코드에 sample_rate 필드를 주면 해당 비율을 사용합니다.
+    (예: logger.info("...", extra={"sample_rate": 0.1}) → INFO 레코드 10%만 기록)
+    남긴 레코드에는 sample_rate가 기록되므로 분석 시 1/sample_rate 배로 보정할 수 있습니다.
+    """
+    def __init__(self, debug_rate: float):
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            if record.levelno > logging.DEBUG or self.debug_rate >= 1.0:
+                return True
+            rate = record.sample_rate = self.debug_rate
+        return rate >= 1.0 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """레코드를 한 줄 JSON으로 출력합니다. extra로 전달된 필드는 최상위 키로 들어갑니다."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """사람이 읽기 쉬운 한 줄 형식 (구조화 필드는 key=value로 덧붙임)"""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED and not key.startswith("_"))
+        return f"{line} {fields}" if fields else line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    레코드를 큐에 넣기만 하고 바로 반환하는 핸들러입니다. 실제 출력은 QueueListener 스레드가 담당합니다.
+    큐가 가득 차면 기다리지 않고 레코드를 버린 뒤 개수만 셉니다.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 메시지 포맷팅과 예외 문자열화는 여기서 한 번만 수행 (다른 스레드에서 인자 객체가 바뀌지 않도록)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+
+
+def configure_logging() -> None:
+    """
+    "dreamcode" 로거 계층에 큐 핸들러를 한 번만 설정합니다.
+    LOG_LEVEL, LOG_FORMAT(json/text), LOG_FILE, LOG_DEBUG_SAMPLE_RATE, LOG_QUEUE_SIZE 설정을 따릅니다.
+    """
+    global _configured, _listener
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger("dreamcode")
+        root.setLevel(config.LOG_LEVEL)
+        root.propagate = False # 다른 라이브러리의 로깅 설정과 섞이지 않도록 분리
+
+        output = logging.FileHandler(config.LOG_FILE, encoding="utf-8") if config.LOG_FILE else logging.StreamHandler(sys.stdout)
+        output.setFormatter(JSONFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+        log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(config.LOG_DEBUG_SAMPLE_RATE)) # 버릴 레코드는 컨텍스트를 붙이기 전에 제외
+        handler.addFilter(ContextFilter())
+        root.addHandler(handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop) # 종료 시 큐에 남은 레코드 출력
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    :param name: 모듈/서비스 이름 (예: "services.stt") → "dreamcode.services.stt" 로거
+    """
+    configure_logging()
+    return logging.getLogger(f"dreamcode.{name}")
@@ -0,0 +1,149 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from core.context_packing import count_tokens
+from core.structured_logging import get_logger
+from core.text_matcher import AhoCorasick
+
+SYMBOL_SOURCE_PATH = "data/dream_symbolism.md" # 상징 사전 문서
+SYMBOL_TABLE_FILENAME = "symbol_table.json" # 인덱스 폴더에 저장되는 조회 테이블 파일명
+
+logger = get_logger("symbol_lookup")
+
+# 섹션 제목 → 꿈 텍스트/키워드에 등장하는 변형(활용형, 동의어)
+# 공백은 정규화 시 제거되므로 "이가 빠"와 "이가빠"는 같은 패턴입니다.
+# "물"처럼 한 글자 단어는 다른 단어 안에서 잘못 매칭되므로 두 글자 이상의 표현만 사용합니다.
+# "오류", "데이터", "바다", "시험"처럼 꿈과 무관한 문장에도 흔한 단어는 단독으로 쓰지 않고 꿈 장면을 가리키는 구절로만 등록합니다.
+SYMBOL_ALIASES = {
+    "쫓기는 꿈": ["쫓기", "쫓겨", "쫓겼", "쫓김", "쫓아오", "쫓아와", "추격", "도망치", "도망쳤", "도망가", "도망갔", "도망다니"],
+    "떨어지는 꿈": ["떨어지", "떨어져", "떨어졌", "추락", "낙하", "굴러떨어"],
+    "이가 빠지는 꿈": ["이가 빠", "이빨", "치아", "이가 부러", "이가 흔들"],
+    "어두운 숲이나 길을 헤매는 꿈": ["숲속", "어두운 숲", "헤매", "헤맸", "길을 잃", "길을 잃었", "미로", "길잃"],
+    "물에 관련된 꿈": ["물속", "물에 빠", "물에 잠", "바닷물", "바닷속", "바다에 빠", "바다에 잠", "강물", "호수", "홍수", "파도", "해일", "익사", "물이 차오", "빠져 죽"],
+    "시험을 보는 꿈": ["시험을 보", "시험을 봤", "시험을 망", "시험에 떨어", "시험장", "시험지", "수능", "면접", "답안지", "낙제", "성적표"],
+    "통제력 상실과 비인간화에 대한 두려움": ["인공지능", "로봇", "지배당", "기계가", "감시당", "감시 카메라", "감시받"],
+    "논리와 감정의 충돌": ["컴퓨터 오류", "시스템 오류", "고장난 컴퓨터", "오작동"],
+    "정체성과 자아의 탐구": ["나와 똑같", "똑같이 생긴", "도플갱어", "복제인간", "복제된 나", "아바타", "내 기억"],
+    "미래에 대한 불안과 희망": ["디스토피아", "유토피아", "미래 도시", "먼 미래", "종말"],
+}
+
+def normalize(text: str) -> str:
+    """소문자로 바꾸고 공백을 제거합니다. (띄어쓰기가 달라도 같은 표현으로 매칭)"""
+    return re.sub(r"\s+", "", text.lower())
+
+
+def parse_sections(markdown: str) -> Dict[str, str]:
+    """'## ' 제목 단위로 문서를 나누어 제목 → 섹션 전체 텍스트를 반환합니다."""
+    sections, title, lines = {}, None, []
+    for line in markdown.splitlines():
+        if line.startswith("## ") or line.startswith("# "):
+            if title is not None:
+                sections[title] = "\n".join(lines).strip()
+            title, lines = (line[3:].strip(), [line]) if line.startswith("## ") else (None, [])
+        elif title is not None:
+            lines.append(line)
+    if title is not None:
+        sections[title] = "\n".join(lines).strip()
+    return sections
+
+
+def title_variants(title: str) -> List[str]:
+    """
+    제목 자체에서 변형을 만듭니다. 제목의 개별 단어("감정", "두려움" 등)는 너무 흔해서 사용하지 않습니다.
+    예: "쫓기는 꿈" → "쫓기는 꿈", "쫓기는"
+    """
+    variants = [title]
+    if title.endswith(" 꿈"):
+        variants.append(title[:-2])
+    return variants
+
+
+def build_symbol_table(source_path: str = SYMBOL_SOURCE_PATH) -> dict:
+    """
+    상징 사전 문서에서 정규화된 변형 → 섹션 조회 테이블을 만듭니다. (인덱싱 시 한 번 실행)
+    :return: {"sections": {제목: {"text", "token_count"}}, "aliases": {정규화된 변형: [제목, ...]}}
+    """
+    with open(source_path, encoding="utf-8") as f:
+        sections = parse_sections(f.read())
+    table = {"source": source_path, "sections": {}, "aliases": {}}
+    for title, text in sections.items():
+        table["sections"][title] = {"text": text, "token_count": count_tokens(text)}
+        for alias in set(title_variants(title) + SYMBOL_ALIASES.get(title, [])):
+            titles = table["aliases"].setdefault(normalize(alias), [])
+            if title not in titles:
+                titles.append(title)
+    return table
+
+
+def save_symbol_table(table: dict, index_dir: str) -> str:
+    path = os.path.join(index_dir, SYMBOL_TABLE_FILENAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    return path
+
+
+class SymbolLookup:
+    """
+    인덱싱 시 만든 상징 조회 테이블로 텍스트에 등장하는 알려진 상징을 찾습니다.
+    Aho-Corasick 오토마톤으로 한 번 훑은 뒤 해시 조회만 하므로 임베딩 호출이나 FAISS 검색이 필요 없습니다.
+    """
+    def __init__(self, table: dict):
+        self.source = table.get("source", SYMBOL_SOURCE_PATH)
+        self.sections = table["sections"]
+        self.aliases = table["aliases"]
+        self.matcher = AhoCorasick(self.aliases.keys())
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["SymbolLookup"]:
+        """
+        인덱스 폴더의 조회 테이블을 불러옵니다.
+        이전 버전 인덱스처럼 테이블이 없으면 상징 사전 문서로 만들어 저장하고 (임베딩 호출 없음),
+        만들 수 없으면 None을 반환합니다.
+        """
+        path = os.path.join(index_dir, SYMBOL_TABLE_FILENAME)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f))
+        try:
+            table = build_symbol_table(SYMBOL_SOURCE_PATH)
+        except Exception as e:
+            logger.warning("상징 조회 테이블이 없고 생성에도 실패하여 벡터 검색만 사용합니다: %s", e, extra={"path": path})
+            return None
+        try:
+            save_symbol_table(table, index_dir)
+            logger.info("상징 조회 테이블이 없어 새로 생성했습니다.", extra={"path": path, "symbols": len(table["sections"])})
+        except OSError as e:
+            # 읽기 전용 인덱스 폴더 등: 이번 프로세스에서는 메모리의 테이블을 사용
+            logger.warning("상징 조회 테이블 저장 실패: %s", e, extra={"path": path})
+        return cls(table)
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """텍스트에 등장한 상징 제목 → 매칭된 변형 목록 (등장 순서)"""
+        matched = {}
+        for _, alias in self.matcher.find_all(normalize(text)):
+            for title in self.aliases[alias]:
+                aliases = matched.setdefault(title, [])
+                if alias not in aliases:
+                    aliases.append(alias)
+        return matched
+
+    def section_document(self, title: str) -> Document:
+        section = self.sections[title]
+        return Document(
+            page_content=section["text"],
+            metadata={"source": self.source, "symbol": title, "token_count": section["token_count"]},
+        )
+
+    def lookup(self, text: str) -> List[Tuple[Document, float]]:
+        """
+        텍스트에 등장한 상징의 섹션을 (문서, 점수) 목록으로 반환합니다. pack_documents에 그대로 전달할 수 있습니다.
+        매칭된 변형이 많을수록 높은 점수(최대 1.0)를 줍니다.
+        """
+        return [
+            (self.section_document(title), min(1.0, 0.8 + 0.1 * len(aliases)))
+            for title, aliases in self.match(text).items()
+        ]
@@ -0,0 +1,69 @@
+from collections import deque # 실패 링크 계산(BFS)을 위한 큐
+from typing import Dict, Iterable, List, Tuple
+
+
+class AhoCorasick:
+    """
+    여러 개의 패턴을 텍스트에서 한 번의 순회로 찾아내는 Aho-Corasick 오토마톤입니다.
+    형태소 분석 없이 글자 단위로 매칭하므로 한국어 어절 안에 포함된 단어도 찾을 수 있습니다.
+    """
+    def __init__(self, patterns: Iterable[str], case_insensitive: bool = True):
+        """
+        :param patterns: 찾을 패턴 목록 (빈 문자열은 무시)
+        :param case_insensitive: True이면 영어 대소문자를 구분하지 않음
+        """
+        self.case_insensitive = case_insensitive
+        self._goto: List[Dict[str, int]] = [{}] # 상태별 전이 테이블
+        self._fail: List[int] = [0] # 상태별 실패 링크
+        self._output: List[List[str]] = [[]] # 상태에 도달했을 때 매칭이 완료되는 패턴들
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_failure_links()
+
+    def _normalize(self, text: str) -> str:
+        return text.lower() if self.case_insensitive else text
+
+    def _add(self, pattern: str) -> None:
+        if not pattern:
+            return
+        state = 0
+        for char in self._normalize(pattern):
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                # 실패 링크가 가리키는 상태의 출력도 함께 보고되도록 병합
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """
+        텍스트에 등장하는 모든 패턴을 찾습니다. (겹치는 매칭 포함)
+        :param text: 검사할 텍스트
+        :return: (시작 위치, 패턴) 튜플 목록
+        """
+        matches = []
+        state = 0
+        for index, char in enumerate(self._normalize(text)):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                matches.append((index - len(pattern) + 1, pattern))
+        return matches
@@ -0,0 +1,408 @@
+import contextvars
+import functools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from core import config
+from core.deadline import cancellation_metrics, current_request
+from core.structured_logging import get_logger, register_context_provider
+
+logger = get_logger("core.tracing")
+
+T = TypeVar("T")
+
+# Streamlit이 스크립트를 중단/재실행할 때 쓰는 예외 (오류가 아니므로 span 상태를 OK로 기록)
+_CONTROL_FLOW_EXCEPTIONS = {"RerunException", "StopException"}
+
+
+class Span:
+    """
+    시간을 잰 작업 구간 하나입니다. 필드는 OpenTelemetry span 데이터 모델을 따릅니다.
+    (trace_id 32자리, span_id 16자리 16진수, 시각은 Unix epoch 나노초)
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "OK"
+        self.error = None
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, message: str) -> None:
+        """예외 없이 오류 결과로 끝난 작업도 ERROR 상태로 기록합니다."""
+        self.status = "ERROR"
+        self.error = message
+
+    def to_otlp(self) -> dict:
+        """OTLP/JSON 형식의 span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1, # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.status == "ERROR" else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+class OTLPFileExporter:
+    """
+    끝난 span을 모아 OTLP/JSON(ExportTraceServiceRequest) 한 줄씩 파일에 추가합니다.
+    (OpenTelemetry Collector의 otlpjsonfile 수신기나 Jaeger 등에서 그대로 읽을 수 있는 형식)
+    파일 쓰기는 백그라운드 스레드에서 처리하여 요청 경로를 막지 않습니다. 스레드는 첫 span이 끝날 때 시작합니다.
+    파일이 max_bytes를 넘으면 path.1, path.2, ... 로 밀어내고 backups개까지만 보관합니다.
+    """
+    def __init__(self, path: str, service_name: str, flush_seconds: float = 2.0, max_batch: int = 256,
+                 max_bytes: int = 0, backups: int = 3):
+        self.path = path
+        self.service_name = service_name
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+                self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1 # 디스크가 느려도 요청 경로는 기다리지 않음
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Span]) -> None:
+        record = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "dreamcode.tracing"}, "spans": [span.to_otlp() for span in batch]}],
+        }]}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._rotate_if_needed(len(line.encode("utf-8")))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning("span 내보내기 실패 (%s): %s", self.path, e)
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        """현재 파일에 incoming 바이트를 더하면 max_bytes를 넘는 경우 이전 파일을 한 칸씩 밀어냅니다."""
+        if not self.max_bytes or not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) + incoming <= self.max_bytes:
+            return
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+class StageHistograms:
+    """
+    단계(span 이름)별 지연 시간 히스토그램입니다. Prometheus 텍스트 형식으로 내보내고,
+    최근 구간의 p50/p95/p99도 함께 계산합니다.
+    """
+    def __init__(self, buckets: List[float], window: int = 1000):
+        self.buckets = sorted(buckets)
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {} # 단계 → 버킷별 개수 (마지막은 +Inf)
+        self._sums: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._recent: Dict[str, deque] = {}
+
+    def observe(self, stage: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(stage, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, seconds)] += 1
+            self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+            self._errors[stage] = self._errors.get(stage, 0) + (1 if error else 0)
+            self._recent.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> Dict[str, Dict[str, float]]:
+        """단계별 최근 지연 시간의 분위수(초)"""
+        with self._lock:
+            recent = {stage: sorted(samples) for stage, samples in self._recent.items()}
+        return {
+            stage: {f"p{int(q * 100)}": round(samples[min(len(samples) - 1, int(q * len(samples)))], 4) for q in qs}
+            for stage, samples in recent.items() if samples
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus 텍스트 노출 형식 (histogram + 최근 구간 분위수 gauge + 오류 counter)"""
+        lines = [
+            "# HELP dream_stage_duration_seconds Latency of each pipeline stage.",
+            "# TYPE dream_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            snapshot = {stage: (list(counts), self._sums[stage], self._errors[stage]) for stage, counts in self._counts.items()}
+        for stage, (counts, total, _) in sorted(snapshot.items()):
+            label = _escape_label(stage)
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'dream_stage_duration_seconds_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'dream_stage_duration_seconds_sum{{stage="{label}"}} {total:.6f}')
+            lines.append(f'dream_stage_duration_seconds_count{{stage="{label}"}} {cumulative}')
+        lines += [
+            "# HELP dream_stage_duration_recent_seconds Quantiles of recent stage latencies.",
+            "# TYPE dream_stage_duration_recent_seconds gauge",
+        ]
+        for stage, values in sorted(self.quantiles().items()):
+            for name, value in values.items():
+                quantile = int(name[1:]) / 100
+                lines.append(f'dream_stage_duration_recent_seconds{{stage="{_escape_label(stage)}",quantile="{quantile}"}} {value}')
+        lines += [
+            "# HELP dream_stage_errors_total Stage spans that ended with an error.",
+            "# TYPE dream_stage_errors_total counter",
+        ]
+        for stage, (_, _, errors) in sorted(snapshot.items()):
+            lines.append(f'dream_stage_errors_total{{stage="{_escape_label(stage)}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Tracer:
+    """
+    요청/세션 ID가 붙은 span을 만들고, 끝난 span을 히스토그램과 파일 내보내기에 전달합니다.
+    부모 span은 contextvars로 전달되므로 헤징 스레드나 리포트 스레드 풀에서 실행되는 호출도 같은 trace에 이어집니다.
+    """
+    def __init__(self, histograms: StageHistograms, exporter: Optional[OTLPFileExporter] = None):
+        self.histograms = histograms
+        self.exporter = exporter
+        self._current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+        self._session: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def session_id(self) -> Optional[str]:
+        """현재 실행 흐름에 바인딩된 세션 ID (없으면 None)"""
+        return self._session.get()
+
+    @contextmanager
+    def bind_session(self, session_id: Optional[str]):
+        """with 블록 안에서 만들어지는 span에 세션 ID를 붙입니다."""
+        token = self._session.set(session_id)
+        try:
+            yield
+        finally:
+            self._session.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        """
+        name 구간의 시간을 잽니다. 현재 요청 ID와 세션 ID가 있으면 속성으로 붙입니다.
+        :param name: span 이름 (히스토그램의 stage 레이블로도 사용, 예: "STTService.transcribe_from_bytes")
+        """
+        parent = self._current.get()
+        request = current_request()
+        if request is not None:
+            attributes.setdefault("request.id", request.request_id)
+        session_id = self._session.get()
+        if session_id:
+            attributes.setdefault("session.id", session_id)
+        span = Span(name, parent.trace_id if parent else secrets.token_hex(16), parent.span_id if parent else None, attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if type(e).__name__ in _CONTROL_FLOW_EXCEPTIONS:
+                span.set_attribute("streamlit.control", type(e).__name__)
+            else:
+                span.status = "ERROR"
+                span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._current.reset(token)
+            span.end_ns = time.time_ns()
+            self.histograms.observe(name, span.seconds, span.status == "ERROR")
+            if self.exporter is not None:
+                self.exporter.export(span)
+
+    def traced(self, name: str = None, accept: Callable[[Any], bool] = None) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """
+        함수 호출 전체를 span으로 감싸는 데코레이터 (이름이 없으면 "클래스.메서드")
+        :param accept: 결과가 정상이면 True를 반환하는 함수. 예외 대신 오류 메시지/빈 결과를 반환하는 서비스에서
+                       False이면 span을 ERROR로 기록합니다. (없으면 예외만 오류로 기록)
+        """
+        def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+            span_name = name or fn.__qualname__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name) as span:
+                    result = fn(*args, **kwargs)
+                    if accept is not None and not accept(result):
+                        span.record_error(f"오류 결과 반환: {str(result)[:200]}")
+                    return result
+            return wrapper
+        return decorator
+
+
+# 경로 → JSON으로 내보낼 지표 스냅샷 함수 (다른 모듈이 자기 지표를 등록, core가 services를 임포트하지 않도록)
+_json_endpoints: Dict[str, Callable[[], Any]] = {}
+
+
+def register_json_endpoint(path: str, snapshot: Callable[[], Any]) -> None:
+    """
+    지표 서버에서 path로 snapshot() 결과를 JSON으로 제공합니다.
+    :param path: 예: "/moderation-prefilter"
+    :param snapshot: 인자 없이 JSON으로 옮길 수 있는 값을 반환하는 함수
+    """
+    _json_endpoints[path] = snapshot
+
+
+register_json_endpoint("/cancellations", cancellation_metrics.snapshot) # 취소로 생략한 호출 수와 예산 초과 단계
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in _json_endpoints:
+            body = json.dumps(_json_endpoints[path](), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics":
+            body = tracer.histograms.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/quantiles":
+            body = json.dumps(tracer.histograms.quantiles(), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path.split("?")[0] == "/cache":
+            from core.shared_cache import shared_cache # 공유 캐시가 이 모듈의 로깅 설정을 사용하므로 요청 시점에 임포트
+
+            body = json.dumps(shared_cache.snapshot(), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path.split("?")[0] == "/single-flight":
+            from core.shared_cache import shared_cache
+
+            body = json.dumps(shared_cache.flights.snapshot(), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # 스크레이프 요청마다 로그를 남기지 않음
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None) -> Optional[ThreadingHTTPServer]:
+    """
+    /metrics(Prometheus 텍스트), /quantiles(JSON), /cache(네임스페이스별 캐시 적중률 JSON),
+    /single-flight(단계별로 합쳐진 호출 수 JSON)와 register_json_endpoint로 등록한 JSON 지표를 제공하는
+    로컬 HTTP 서버를 한 번만 시작합니다.
+    :param port: 포트 (없으면 config.METRICS_PORT, 0이면 시작하지 않음)
+    """
+    global _metrics_server
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((config.METRICS_HOST, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("지표 서버를 %s:%d에서 시작하지 못했습니다: %s", config.METRICS_HOST, port, e)
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            logger.info("지표 서버 시작: http://%s:%d/metrics", config.METRICS_HOST, port)
+        return _metrics_server
+
+
+# 프로세스 전체에서 공유하는 tracer
+tracer = Tracer(
+    StageHistograms(config.TRACE_HISTOGRAM_BUCKETS),
+    OTLPFileExporter(config.TRACE_EXPORT_PATH, config.TRACE_SERVICE_NAME,
+                     max_bytes=config.TRACE_EXPORT_MAX_BYTES, backups=config.TRACE_EXPORT_BACKUPS) if config.TRACE_EXPORT_PATH else None,
+)
+traced = tracer.traced
+
+
+def _log_context():
+    # 로그 레코드에 세션 ID와 현재 span의 trace/span ID를 붙여 trace와 로그를 연결
+    span = tracer.current_span()
+    return {
+        "session_id": tracer.session_id(),
+        "trace_id": span.trace_id if span else None,
+        "span_id": span.span_id if span else None,
+    }
+
+
+register_context_provider(_log_context)
@@ -0,0 +1,183 @@
+"""
+API 사용량(요청 수, 토큰, 음성 길이, 이미지 수)과 예상 비용을 세션/단계/날짜별로 집계하는 로컬 저장소입니다.
+
+호출마다 DB에 쓰지 않고 메모리에서 (날짜, 세션, 단계, 모델, 변형) 단위로 합산한 뒤
+백그라운드 스레드가 주기적으로 SQLite(WAL)에 더합니다.
+
+요약 출력 (rag 폴더에서 실행):
+    python -m core.usage_store                 # 날짜별
+    python -m core.usage_store --by stage --days 7
+    python -m core.usage_store --by session --day 2026-10-19
+"""
+import argparse
+import atexit
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from core import config
+from core.structured_logging import get_logger
+from core.tracing import tracer
+
+logger = get_logger("core.usage_store")
+
+_COUNTERS = ("requests", "input_tokens", "cached_tokens", "output_tokens", "audio_seconds", "images", "cost_usd")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    variant TEXT NOT NULL DEFAULT '',
+    requests INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    audio_seconds REAL NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, session_id, stage, model, variant)
+)
+"""
+
+
+class UsageStore:
+    """
+    세션/단계/날짜별 사용량 저장소입니다.
+    """
+    def __init__(self, path: str, flush_seconds: float = 5.0):
+        """
+        :param path: SQLite 파일 경로
+        :param flush_seconds: 메모리에 모은 사용량을 DB에 쓰는 주기(초)
+        """
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[Tuple[str, str, str, str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL") # 여러 프로세스가 동시에 써도 읽기를 막지 않음
+        conn.execute(_SCHEMA)
+        return conn
+
+    def record(self, stage: str, model: str, variant: str = "", session_id: str = None, **counters: float) -> None:
+        """
+        사용량을 더합니다.
+        :param stage: 단계 이름 (예: "report", "stt", "image")
+        :param model: 모델 이름 (예: "gpt-4o-mini", "whisper-1")
+        :param variant: 같은 모델 안의 구분 (예: 이미지 "1024x1024/standard")
+        :param session_id: 세션 ID (없으면 tracer에 바인딩된 현재 세션, 세션 밖의 호출은 "-")
+        :param counters: requests, input_tokens, cached_tokens, output_tokens, audio_seconds, images, cost_usd
+        """
+        unknown = set(counters) - set(_COUNTERS)
+        if unknown:
+            raise ValueError(f"알 수 없는 사용량 항목: {', '.join(sorted(unknown))}")
+        key = (datetime.date.today().isoformat(), session_id or tracer.session_id() or "-", stage, model, variant)
+        with self._lock:
+            pending = self._pending.setdefault(key, dict.fromkeys(_COUNTERS, 0))
+            for name, value in counters.items():
+                pending[name] += value or 0
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-store", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self) -> None:
+        """메모리에 모은 사용량을 DB에 더합니다."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            columns = ", ".join(_COUNTERS)
+            updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in _COUNTERS)
+            rows = [key + tuple(values[name] for name in _COUNTERS) for key, values in pending.items()]
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        f"INSERT INTO usage (day, session_id, stage, model, variant, {columns}) "
+                        f"VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(_COUNTERS))}) "
+                        f"ON CONFLICT (day, session_id, stage, model, variant) DO UPDATE SET {updates}",
+                        rows,
+                    )
+            except sqlite3.Error as e:
+                logger.warning("사용량 저장 실패 (%s), 다음 주기에 다시 시도합니다: %s", self.path, e)
+                with self._lock:
+                    for key, values in pending.items():
+                        merged = self._pending.setdefault(key, dict.fromkeys(_COUNTERS, 0))
+                        for name in _COUNTERS:
+                            merged[name] += values[name]
+
+    def summary(self, by: str = "day", days: int = None, day: str = None) -> list:
+        """
+        :param by: 묶는 기준 (day, session, stage, model)
+        :param days: 최근 며칠만 집계 (없으면 전체)
+        :param day: 이 날짜(YYYY-MM-DD)만 집계
+        :return: (기준값, 항목별 합계...) 행 목록, 비용이 큰 순서
+        """
+        column = {"day": "day", "session": "session_id", "stage": "stage", "model": "model || CASE WHEN variant = '' THEN '' ELSE ' ' || variant END"}[by]
+        where, params = [], []
+        if days:
+            where.append("day >= ?")
+            params.append((datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat())
+        if day:
+            where.append("day = ?")
+            params.append(day)
+        self.flush()
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT {column} AS key, {', '.join(f'SUM({name})' for name in _COUNTERS)} FROM usage "
+                f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY key ORDER BY SUM(cost_usd) DESC, key",
+                params,
+            ).fetchall()
+
+
+def embedding_cost(tokens: int) -> float:
+    return tokens * config.EMBEDDING_PRICE_PER_1M / 1_000_000
+
+
+def audio_cost(model: str, seconds: Optional[float]) -> float:
+    return (seconds or 0.0) / 60 * config.AUDIO_PRICES_PER_MINUTE.get(model, 0.0)
+
+
+def image_cost(model: str, variant: str, count: int = 1) -> float:
+    return count * config.IMAGE_PRICES.get(model, {}).get(variant, 0.0)
+
+
+# 프로세스 전체에서 공유하는 사용량 저장소
+usage_store = UsageStore(config.USAGE_DB_PATH)
+atexit.register(usage_store.flush) # 종료 직전에 남은 사용량 저장
+
+
+def main():
+    parser = argparse.ArgumentParser(description="세션/단계/날짜별 API 사용량 및 예상 비용 요약")
+    parser.add_argument("--by", choices=["day", "session", "stage", "model"], default="day")
+    parser.add_argument("--days", type=int, help="최근 며칠만 집계")
+    parser.add_argument("--day", help="이 날짜(YYYY-MM-DD)만 집계")
+    args = parser.parse_args()
+
+    rows = usage_store.summary(args.by, args.days, args.day)
+    print(f"{args.by:<36}{'requests':>9}{'input tok':>11}{'cached':>9}{'output tok':>11}{'audio(s)':>10}{'images':>8}{'cost($)':>10}")
+    for key, requests, input_tokens, cached_tokens, output_tokens, audio_seconds, images, cost in rows:
+        print(f"{str(key):<36}{requests:>9.0f}{input_tokens:>11.0f}{cached_tokens:>9.0f}{output_tokens:>11.0f}"
+              f"{audio_seconds:>10.1f}{images:>8.0f}{cost:>10.4f}")
+    if rows:
+        print(f"{'total':<36}{sum(row[1] for row in rows):>9.0f}{sum(row[2] for row in rows):>11.0f}{sum(row[3] for row in rows):>9.0f}"
+              f"{sum(row[4] for row in rows):>11.0f}{sum(row[5] for row in rows):>10.1f}{sum(row[6] for row in rows):>8.0f}"
+              f"{sum(row[7] for row in rows):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,17 @@ from pydantic import BaseModel, Field # 데이터 모델 정의를 위한 Pydant
 from langchain_core.prompts import ChatPromptTemplate # 챗 프롬프트 템플릿 정의
 from langchain_openai import ChatOpenAI # OpenAI 챗 모델 사용
 from langchain_core.output_parsers import StrOutputParser # 문자열 출력 파서
-from langchain.output_parsers import PydanticOutputParser # Pydantic 모델 기반 출력 파서
+from core.chain_registry import ChainRegistry
+from core.deadline import DeadlineExceeded, PipelineCancelled
+from core.model_router import model_router
+from core.llm_usage import total_tokens
+from core.rate_limiter import build_http_client, estimate_tokens, scheduler
+from core.resilience import call_with_resilience
+from core.structured_logging import get_logger
+from core.shared_cache import shared_cache
+from core.tracing import traced
+
+logger = get_logger("services.dream_analyzer")
 
 # Pydantic 모델 정의
 # LLM 출력을 위한 키워드 매핑 스키마
@@ -19,17 +29,119 @@ class ReconstructionOutput(BaseModel):
     transformation_summary: str = Field(description="변환 과정에 대한 2-3 문장의 요약 (한국어)") # 변환 과정 요약
     keyword_mappings: List[KeywordMapping] = Field(description="원본-변환 키워드 매핑 리스트 (3-5개)") # 키워드 매핑 리스트
 
+# 프롬프트 정의
+# 모든 사용자에게 동일한 지시문은 시스템 메시지(접두부)에, 꿈마다 달라지는 내용(꿈 텍스트, 키워드, 감정, 상징 지식)은 마지막 사용자 메시지에만 넣습니다.
+# 두 시스템 메시지 모두 공급자 측 프롬프트 캐시의 최소 길이(1024토큰)보다 짧아 현재는 캐시 할인이 없습니다. (report_generator_service 참고)
+NIGHTMARE_PROMPT_VERSION = "v2" # 프롬프트를 수정하면 버전을 올려 체인 저장소에서 구분
+NIGHTMARE_SYSTEM_PROMPT = """You are a prompt artist specializing in psychological horror and dark surrealism for DALL-E 3. Your task is to translate the user's Korean nightmare into a terrifying, atmospheric, and visually striking image prompt in English.
+
+**Core Mission:**
+Your prompt MUST visualize the central elements and the terrifying, oppressive, or disturbing feelings described in the user's dream and captured by the identified keywords and emotions given in the user message.
+
+**Artistic & Thematic Directions:**
+- **Focus:** Emphasize the core frightening elements, atmosphere, and psychological impact of the specific dream provided. Do NOT force themes like AI, digital dystopia, or simulation unless explicitly present in the original dream description or keywords.
+- **Visuals:** Describe the nightmare's visual elements vividly. Use terms that convey the unique horror, dread, tension, or discomfort of the scene. Consider lighting, shadows, colors, and textures that enhance the terrifying atmosphere.
+- **Atmosphere:** Create a strong sense of dread, helplessness, unease, or whatever the predominant negative emotion of the dream is. Use descriptive language to build the scene's mood.
+
+**Safety:** While creating a terrifying image, you must adhere to safety policies. NEVER depict literal self-harm, gore, or extreme violence. Represent fear and pain metaphorically and psychologically.
+
+The final output must be a single, detailed paragraph in English, suitable for direct use by DALL-E 3."""
+
+NIGHTMARE_HUMAN_TEMPLATE = """**Analysis Data for Context:**
+- User's Nightmare Description (Korean): {dream_text}
+- Identified Keywords: [{keywords_info}]
+- Emotion Breakdown: [{emotions_info}]
+
+Generate a DALL-E 3 image prompt for this nightmare."""
+
+RECONSTRUCTION_PROMPT_VERSION = "v3"
+RECONSTRUCTION_SYSTEM_PROMPT = """You are a wise and empathetic dream therapist. Your goal is to perform three tasks at once. The most important task is to transform the negative 'Identified Keywords' into positive visual symbols.
+**CRITICAL INSTRUCTION:** The Identified Keywords in the user message are the most important elements. You MUST reframe these specific keywords into symbols of peace, healing, and hope to create an English image prompt.
+**Symbol Knowledge:** When the user message provides symbol knowledge for a keyword, ground that keyword's transformation in the meaning of its symbol.
+**Your Three Tasks:** 1. Generate Reconstructed Prompt. 2. Generate Transformation Summary in Korean. 3. Generate Keyword Mappings."""
+
+RECONSTRUCTION_HUMAN_TEMPLATE = """**Analysis Data:** - Original Nightmare Text (Korean): {dream_text}, - Identified Keywords: {keywords_info}, - Emotion Breakdown: {emotions_info}
+**Symbol Knowledge (per keyword):**
+{symbol_context}"""
+
 # 꿈 분석 서비스 클래스
 class DreamAnalyzerService:
-    def __init__(self, api_key: str):
-        # OpenAI 챗 모델 초기화
-        self.llm = ChatOpenAI(model="gpt-4o", api_key=api_key, temperature=0.7)
-        # Pydantic 모델을 사용하여 JSON 출력 파서 초기화
-        self.json_parser = PydanticOutputParser(pydantic_object=ReconstructionOutput)
+    def __init__(self, api_key: str, retriever: Any = None):
+        """
+        :param api_key: OpenAI API 키
+        :param retriever: (선택 사항) 키워드별 상징 지식을 검색할 PackedContextRetriever 객체
+        """
+        # 모델 라우터가 두 단계에서 사용할 수 있는 모델마다 OpenAI 챗 모델 초기화
+        models = dict.fromkeys(model_router.candidates("nightmare") + model_router.candidates("reconstruction"))
+        self.llms = {
+            model: ChatOpenAI(model=model, api_key=api_key, temperature=0.7, http_client=build_http_client(), max_retries=0)
+            for model in models
+        }
         # 문자열 출력 파서 초기화
         self.output_parser = StrOutputParser() 
+        # 키워드 상징 검색기 (없으면 상징 지식 없이 프롬프트 생성)
+        self.retriever = retriever
+        # 체인은 초기화 시 모델별로 한 번만 구성하여 모든 호출에서 재사용
+        self.chains = ChainRegistry()
+        nightmare_prompt = ChatPromptTemplate.from_messages([
+            ("system", NIGHTMARE_SYSTEM_PROMPT),
+            ("human", NIGHTMARE_HUMAN_TEMPLATE)
+        ])
+        reconstruction_prompt = ChatPromptTemplate.from_messages([
+            ("system", RECONSTRUCTION_SYSTEM_PROMPT),
+            ("human", RECONSTRUCTION_HUMAN_TEMPLATE)
+        ])
+        for model in model_router.candidates("nightmare"):
+            # usage_metadata 확인을 위해 응답 메시지를 그대로 받음
+            self.chains.register(f"nightmare_prompt@{model}", NIGHTMARE_PROMPT_VERSION, nightmare_prompt | self.llms[model])
+        for model in model_router.candidates("reconstruction"):
+            # 재구성 결과 모델의 JSON 스키마로 출력을 제한 (형식 지시어 및 파싱 불필요)
+            # include_raw=True: 원시 응답의 usage_metadata(캐시 적중 토큰 포함)도 함께 받음
+            self.chains.register(f"reconstruction@{model}", RECONSTRUCTION_PROMPT_VERSION, reconstruction_prompt | self.llms[model].with_structured_output(
+                ReconstructionOutput, method="json_schema", strict=True, include_raw=True
+            ))
+
+    @staticmethod
+    def _is_valid_nightmare_prompt(message: Any) -> bool:
+        """이미지 프롬프트로 쓸 수 있는 길이의 응답인지 확인합니다. (실패 시 더 강한 모델로 상향)"""
+        return len(str(message.content).strip()) >= 40
+
+    @staticmethod
+    def _is_valid_reconstruction(result: dict) -> bool:
+        """스키마 파싱에 성공했고 프롬프트, 요약, 키워드 매핑이 채워졌는지 확인합니다."""
+        output = result["parsed"]
+        if result["parsing_error"] is not None or output is None:
+            return False
+        return bool(output.reconstructed_prompt.strip() and output.transformation_summary.strip() and output.keyword_mappings)
+
+    @traced()
+    def _symbol_context(self, keywords: List[str]) -> str:
+        """
+        리포트 키워드 전체를 한 번의 배치 검색으로 조회하여 키워드별 상징 지식 문자열을 만듭니다.
+        여러 키워드에 걸린 청크는 한 번만 포함합니다.
+        """
+        if self.retriever is None or not keywords:
+            return "제공된 상징 지식 없음."
+        try:
+            per_keyword = self.retriever.search_by_keywords(keywords)
+        except (PipelineCancelled, DeadlineExceeded):
+            raise
+        except Exception as e:
+            # 상징 지식은 보조 정보이므로 검색에 실패해도 프롬프트 생성은 계속 진행
+            logger.warning("키워드 상징 검색 실패, 상징 지식 없이 진행합니다: %s", e)
+            return "제공된 상징 지식 없음."
+        sections = {} # 청크 내용 → 해당 키워드 목록
+        for keyword, docs in per_keyword.items():
+            for doc in docs:
+                sections.setdefault(doc.page_content, []).append(keyword)
+        if not sections:
+            return "제공된 상징 지식 없음."
+        return "\n\n".join(f"[{', '.join(matched)}]\n{content}" for content, matched in sections.items())
 
     # 악몽 이미지 생성 프롬프트 생성 함수
+    @shared_cache.cached("nightmare_prompt", key=lambda self, dream_text, dream_report: (dream_text, dream_report.get("keywords"), dream_report.get("emotions")),
+                         accept=bool, version=NIGHTMARE_PROMPT_VERSION)
+    @traced()
     def create_nightmare_prompt(self, dream_text: str, dream_report: Dict[str, Any]) -> str:
         """
         악몽 텍스트와 핵심 키워드를 기반으로,
@@ -45,40 +157,25 @@ class DreamAnalyzerService:
         emotion_summary_list = [f"{emo.get('emotion')}: {int(emo.get('score', 0)*100)}%" for emo in emotions]
         emotions_info = "; ".join(emotion_summary_list) if emotion_summary_list else "No specific emotions detected."
 
-        # 시스템 프롬프트 정의
-        system_prompt = f"""
-        You are a prompt artist specializing in psychological horror and dark surrealism for DALL-E 3. Your task is to translate the user's Korean nightmare into a terrifying, atmospheric, and visually striking image prompt in English.
-
-        **Core Mission:**
-        Your prompt MUST visualize the central elements and the terrifying, oppressive, or disturbing feelings described in the user's dream and captured by the identified keywords and emotions.
-        
-        **Analysis Data for Context:**
-        - User's Nightmare Description (Korean): {dream_text}
-        - Identified Keywords: [{keywords_info}]
-        - Emotion Breakdown: [{emotions_info}]
-
-        **Artistic & Thematic Directions:**
-        - **Focus:** Emphasize the core frightening elements, atmosphere, and psychological impact of the specific dream provided. Do NOT force themes like AI, digital dystopia, or simulation unless explicitly present in the original dream description or keywords.
-        - **Visuals:** Describe the nightmare's visual elements vividly. Use terms that convey the unique horror, dread, tension, or discomfort of the scene. Consider lighting, shadows, colors, and textures that enhance the terrifying atmosphere.
-        - **Atmosphere:** Create a strong sense of dread, helplessness, unease, or whatever the predominant negative emotion of the dream is. Use descriptive language to build the scene's mood.
-        
-        **Safety:** While creating a terrifying image, you must adhere to safety policies. NEVER depict literal self-harm, gore, or extreme violence. Represent fear and pain metaphorically and psychologically.
-        
-        The final output must be a single, detailed paragraph in English, suitable for direct use by DALL-E 3.
-        """
-        
-        # 챗 프롬프트 템플릿 생성
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "Generate a DALL-E 3 image prompt for the following nightmare.")
-        ])
-        
-        # 체인 구성 및 실행
-        chain = prompt_template | self.llm | self.output_parser
-        # invoke 함수에 필요한 정보 전달
-        return chain.invoke({"dream_text": dream_text, "keywords_info": keywords_info, "emotions_info": emotions_info})
+        # 모델별로 초기화 시 구성해 둔 체인을 공용 스케줄러에서 예산 확보 후 실행
+        def call(model):
+            chain = self.chains.get(f"nightmare_prompt@{model}", NIGHTMARE_PROMPT_VERSION)
+            def request():
+                message = chain.invoke({"dream_text": dream_text, "keywords_info": keywords_info, "emotions_info": emotions_info})
+                scheduler.reconcile(model, tokens, total_tokens(message)) # 추정치를 실제 사용량으로 보정
+                return message
+            tokens = estimate_tokens(NIGHTMARE_SYSTEM_PROMPT, dream_text, completion_tokens=300)
+            return call_with_resilience("DreamAnalyzerService.create_nightmare_prompt", model, request, tokens=tokens)
+        # 라우터가 고른 모델로 실행하고, 검증에 실패하면 더 강한 모델로 다시 실행
+        message = model_router.run(
+            "nightmare", "DreamAnalyzerService.create_nightmare_prompt", call, validate=self._is_valid_nightmare_prompt
+        )
+        return self.output_parser.invoke(message)
         
     # 재구성된 꿈 프롬프트 및 분석 결과 생성 함수
+    @shared_cache.cached("reconstruction", key=lambda self, dream_text, dream_report: (dream_text, dream_report.get("keywords"), dream_report.get("emotions")),
+                         accept=lambda result: bool(result[0]), version=RECONSTRUCTION_PROMPT_VERSION)
+    @traced()
     def create_reconstructed_prompt_and_analysis(self, dream_text: str, dream_report: Dict[str, Any]) -> Tuple[str, str, List[Dict[str, str]]]:
         # 꿈 보고서에서 키워드 추출
         keywords = dream_report.get("keywords", [])
@@ -87,27 +184,27 @@ class DreamAnalyzerService:
         # 꿈 보고서에서 감정 추출 및 요약
         emotion_summary_list = [f"{emo.get('emotion')}: {int(emo.get('score', 0)*100)}%" for emo in emotions]
         emotions_info = "; ".join(emotion_summary_list) if emotion_summary_list else "감지된 특정 감정 없음."
+        # 키워드별 상징 지식 (모든 키워드를 한 번의 배치 검색으로 조회)
+        symbol_context = self._symbol_context(keywords)
 
-        # 시스템 프롬프트 정의 ('AI' 단어 제거)
-        system_prompt = """
-        You are a wise and empathetic dream therapist. Your goal is to perform three tasks at once. The most important task is to transform the negative 'Identified Keywords' into positive visual symbols.
-        **CRITICAL INSTRUCTION:** The keywords [{keywords_info}] are the most important elements. You MUST reframe these specific keywords into symbols of peace, healing, and hope to create an English image prompt.
-        **Analysis Data:** - Original Nightmare Text (Korean): {dream_text}, - Identified Keywords: {keywords_info}, - Emotion Breakdown: {emotions_info}
-        **Your Three Tasks:** 1. Generate Reconstructed Prompt. 2. Generate Transformation Summary in Korean. 3. Generate Keyword Mappings.
-        **Output Format Instruction:** You MUST provide your response in the following JSON format.
-        {format_instructions}
-        """
-        # 프롬프트 템플릿 생성 및 형식 지시어 적용
-        prompt = ChatPromptTemplate.from_template(
-            template=system_prompt,
-            partial_variables={"format_instructions": self.json_parser.get_format_instructions()}
+        # 모델별로 초기화 시 구성해 둔 체인을 공용 스케줄러에서 예산 확보 후 실행
+        def call(model):
+            chain = self.chains.get(f"reconstruction@{model}", RECONSTRUCTION_PROMPT_VERSION)
+            def request():
+                result = chain.invoke({
+                    "dream_text": dream_text, "keywords_info": keywords_info, "emotions_info": emotions_info,
+                    "symbol_context": symbol_context
+                })
+                scheduler.reconcile(model, tokens, total_tokens(result["raw"])) # 추정치를 실제 사용량으로 보정
+                return result
+            tokens = estimate_tokens(RECONSTRUCTION_SYSTEM_PROMPT, dream_text, symbol_context, completion_tokens=800)
+            return call_with_resilience("DreamAnalyzerService.create_reconstructed_prompt_and_analysis", model, request, tokens=tokens)
+        # 라우터가 고른 모델로 실행하고, 검증에 실패하면 더 강한 모델로 다시 실행
+        result = model_router.run(
+            "reconstruction", "DreamAnalyzerService.create_reconstructed_prompt_and_analysis", call,
+            raw_message=lambda result: result["raw"], validate=self._is_valid_reconstruction,
         )
-        # 체인 구성 및 실행
-        chain = prompt | self.llm | self.json_parser
-        # invoke 함수에 필요한 정보 전달
-        response: ReconstructionOutput = chain.invoke({
-            "dream_text": dream_text, "keywords_info": keywords_info, "emotions_info": emotions_info
-        })
+        response: ReconstructionOutput = result["parsed"]
         # 키워드 매핑 결과를 딕셔너리 리스트로 변환
         keyword_mappings_dict = [mapping.dict() for mapping in response.keyword_mappings]
         # 재구성된 프롬프트, 요약, 키워드 매핑 반환
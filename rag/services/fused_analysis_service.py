@@ -0,0 +1,104 @@
+from typing import Any, Dict, List
+from pydantic import BaseModel, Field # 데이터 모델 정의
+from langchain_core.prompts import ChatPromptTemplate # 챗 프롬프트 템플릿 정의
+from langchain_core.runnables import RunnablePassthrough # 입력값을 그대로 통과시키는 Runnable
+from langchain_openai import ChatOpenAI # OpenAI 챗 모델 사용
+from core.chain_registry import ChainRegistry
+from core.model_router import model_router
+from core.llm_usage import total_tokens
+from core.rate_limiter import build_http_client, estimate_tokens, scheduler
+from core.resilience import call_with_resilience
+from core.shared_cache import shared_cache
+from core.tracing import traced
+from services.dream_analyzer_service import ReconstructionOutput
+from services.report_generator_service import Emotion
+
+# 리포트, 악몽 프롬프트, 재구성 결과를 한 번에 담는 모델
+class FusedAnalysis(BaseModel):
+    emotions: List[Emotion] = Field(description="주요 감정 목록") # 주요 감정 목록
+    keywords: List[str] = Field(description="꿈의 핵심 키워드 목록 (한국어)") # 핵심 키워드 목록
+    analysis_summary: str = Field(description="전문 지식을 바탕으로 한 심층 분석 요약 (2-4 문장, 한국어)") # 심층 분석 요약
+    nightmare_prompt: str = Field(description="악몽의 분위기를 시각화하는 DALL-E 3용 이미지 프롬프트 (영어, 한 문단)") # 악몽 이미지 프롬프트
+    reconstruction: ReconstructionOutput = Field(description="키워드를 긍정적 상징으로 재구성한 결과") # 재구성 결과
+
+# 프롬프트 정의 (고정 시스템 메시지 + 꿈별 사용자 메시지)
+# 시스템 메시지가 공급자 측 프롬프트 캐시의 최소 길이(1024토큰)보다 짧아 현재는 캐시 할인이 없습니다. (report_generator_service 참고)
+FUSED_PROMPT_VERSION = "v1"
+FUSED_SYSTEM_PROMPT = """You are an AI dream analyst and dream therapist who is an expert in IRT and dream symbolism.
+Using the user's dream and the provided [Professional Knowledge], complete all of the following in a single structured response:
+1. **Report:** Identify the dominant emotions (0.0-1.0 scores), the core keywords, and write an 'analysis_summary' of 2-4 sentences based on insights from the [Professional Knowledge]. Emotions, keywords and the summary MUST be in Korean.
+2. **Nightmare Prompt:** Write a single, detailed English paragraph for DALL-E 3 that visualizes the central elements and the terrifying, oppressive atmosphere of this specific dream. Do NOT force themes like AI or digital dystopia unless they are in the dream. Never depict literal self-harm, gore, or extreme violence; represent fear metaphorically and psychologically.
+3. **Reconstruction:** Reframe the keywords from step 1 into symbols of peace, healing, and hope. Produce an English DALL-E 3 prompt (one paragraph), a 2-3 sentence Korean transformation summary, and 3-5 keyword mappings (original → transformed, in Korean). Ground each transformation in the keyword's symbol meaning from the [Professional Knowledge] when available."""
+
+FUSED_HUMAN_TEMPLATE = """[Professional Knowledge]
+{context}
+
+[User's Dream Text]
+{dream_text}"""
+
+class FusedAnalysisService:
+    """
+    리포트(감정, 키워드, 요약), 악몽 이미지 프롬프트, 재구성 결과를
+    검색 컨텍스트를 공유하는 한 번의 구조화 출력 호출로 생성하는 클래스입니다.
+    리포트 → 악몽 프롬프트 → 재구성으로 이어지는 세 번의 LLM 왕복을 한 번으로 줄입니다.
+    """
+    def __init__(self, api_key: str, retriever: Any):
+        """
+        :param api_key: OpenAI API 키
+        :param retriever: 전문 지식 검색기 (PackedContextRetriever)
+        """
+        self.retriever = retriever
+        # 모델 라우터가 이 단계에서 사용할 수 있는 모델마다 체인을 미리 구성
+        self.chains = ChainRegistry()
+        prompt = ChatPromptTemplate.from_messages([("system", FUSED_SYSTEM_PROMPT), ("human", FUSED_HUMAN_TEMPLATE)])
+        for model in model_router.candidates("fused"):
+            llm = ChatOpenAI(model=model, api_key=api_key, temperature=0.5, http_client=build_http_client(), max_retries=0)
+            self.chains.register(f"fused_analysis@{model}", FUSED_PROMPT_VERSION, (
+                {"context": self.retriever | self._format_docs, "dream_text": RunnablePassthrough()}
+                | prompt
+                | llm.with_structured_output(FusedAnalysis, method="json_schema", strict=True, include_raw=True)
+            ))
+
+    def _format_docs(self, docs: List[Any]) -> str:
+        return "\n\n".join(doc.page_content for doc in docs)
+
+    @staticmethod
+    def _is_valid(result: dict) -> bool:
+        """스키마 파싱에 성공했고 리포트와 두 프롬프트가 모두 채워졌는지 확인합니다. (실패 시 더 강한 모델로 상향)"""
+        analysis = result["parsed"]
+        if result["parsing_error"] is not None or analysis is None:
+            return False
+        return bool(analysis.emotions and analysis.keywords and analysis.nightmare_prompt.strip()
+                    and analysis.reconstruction.reconstructed_prompt.strip())
+
+    @shared_cache.cached("analysis", key=lambda self, dream_text: (dream_text,), version=FUSED_PROMPT_VERSION)
+    @traced()
+    def analyze(self, dream_text: str) -> Dict[str, Any]:
+        """
+        :param dream_text: 분석할 꿈의 텍스트
+        :return: {"report": 리포트 딕셔너리, "nightmare_prompt": str,
+                  "reconstructed_prompt": str, "transformation_summary": str, "keyword_mappings": [...]}
+        """
+        def call(model):
+            chain = self.chains.get(f"fused_analysis@{model}", FUSED_PROMPT_VERSION)
+            def request():
+                result = chain.invoke(dream_text)
+                scheduler.reconcile(model, tokens, total_tokens(result["raw"])) # 추정치를 실제 사용량으로 보정
+                return result
+            tokens = estimate_tokens(FUSED_SYSTEM_PROMPT, dream_text, completion_tokens=2000)
+            return call_with_resilience("FusedAnalysisService.analyze", model, request, tokens=tokens)
+        result = model_router.run(
+            "fused", "FusedAnalysisService.analyze", call, raw_message=lambda result: result["raw"], validate=self._is_valid
+        )
+        analysis: FusedAnalysis = result["parsed"]
+        return {
+            "report": {
+                "emotions": [emotion.dict() for emotion in analysis.emotions],
+                "keywords": analysis.keywords,
+                "analysis_summary": analysis.analysis_summary,
+            },
+            "nightmare_prompt": analysis.nightmare_prompt,
+            "reconstructed_prompt": analysis.reconstruction.reconstructed_prompt,
+            "transformation_summary": analysis.reconstruction.transformation_summary,
+            "keyword_mappings": [mapping.dict() for mapping in analysis.reconstruction.keyword_mappings],
+        }
@@ -1,4 +1,19 @@
-from openai import OpenAI, APIError # OpenAI 클라이언트 및 API 오류 클래스 임포트
+from openai import OpenAI, APIConnectionError, APIError, APIStatusError, APITimeoutError # OpenAI 클라이언트 및 API 오류 클래스 임포트
+from core.rate_limiter import RateLimitWait, build_http_client
+from core.resilience import CircuitOpenError, call_with_resilience
+from core.session_store import record_image_created
+from core.shared_cache import shared_cache
+from core.structured_logging import get_logger
+from core.tracing import traced
+from core.usage_store import image_cost, usage_store
+
+logger = get_logger("services.image")
+
+
+def is_image_url(result: str) -> bool:
+    """오류 안내가 아닌 이미지 URL인지 확인합니다."""
+    return result.startswith("http")
+
 
 class ImageGeneratorService:
     """
@@ -10,8 +25,12 @@ class ImageGeneratorService:
         ImageGeneratorService를 초기화합니다.
         :param api_key: OpenAI API 키
         """
-        self.client = OpenAI(api_key=api_key) # OpenAI 클라이언트 초기화
+        self.client = OpenAI(api_key=api_key, http_client=build_http_client(), max_retries=0) # OpenAI 클라이언트 초기화
 
+    # 성공한 이미지 URL만 저장 (URL 만료 전까지만 보관, CACHE_TTL_SECONDS["image"])
+    @shared_cache.cached("image", key=lambda self, prompt: (prompt, "dall-e-3", "1024x1024/standard"),
+                         accept=is_image_url)
+    @traced(accept=is_image_url)
     def generate_image_from_prompt(self, prompt: str) -> str:
         """
         주어진 프롬프트를 사용하여 이미지를 생성하고 이미지 URL을 반환합니다.
@@ -19,32 +38,58 @@ class ImageGeneratorService:
         :return: 생성된 이미지의 URL, 또는 오류 메시지
         """
         try:
-            # DALL-E 3 모델을 사용하여 이미지 생성 요청
-            response = self.client.images.generate(
-                model="dall-e-3", # DALL-E 3 모델 지정
-                prompt=prompt, # 이미지 생성 프롬프트
-                size="1024x1024", # 이미지 크기 설정
-                quality="standard", # 이미지 품질 설정
-                n=1, # 생성할 이미지 개수 (1개)
-            )
+            def request():
+                # DALL-E 3 모델을 사용하여 이미지 생성 요청
+                return self.client.images.generate(
+                    model="dall-e-3", # DALL-E 3 모델 지정
+                    prompt=prompt, # 이미지 생성 프롬프트
+                    size="1024x1024", # 이미지 크기 설정
+                    quality="standard", # 이미지 품질 설정
+                    n=1, # 생성할 이미지 개수 (1개)
+                )
+            # 공용 스케줄러에서 요청 예산을 확보한 뒤 호출하고, 서버가 거절한 일시적 오류(429, 5xx)만 재시도
+            # (타임아웃은 이미 생성 중일 수 있으므로 재시도하지 않음, config.RESILIENCE_POLICIES)
+            response = call_with_resilience("ImageGeneratorService.generate_image_from_prompt", "dall-e-3", request, tokens=0)
+            # 이미지 수와 크기/품질별로 사용량 기록
+            images = len(response.data or [])
+            usage_store.record("image", "dall-e-3", "1024x1024/standard", requests=1, images=images,
+                               cost_usd=image_cost("dall-e-3", "1024x1024/standard", images))
             
             # 응답 데이터에서 이미지 URL 추출 및 반환
             if response.data and len(response.data) > 0 and response.data[0].url:
                 image_url = response.data[0].url
-                print(f"이미지 생성 성공, URL: {image_url}") # 성공 시 URL 출력
+                record_image_created(image_url) # 캐시 적중으로 나중에 돌려줘도 세션 복원 시 생성 시각부터 만료 계산
+                # 이미지 URL에는 접근 서명이 들어 있으므로 로그에는 남기지 않음
+                logger.info("이미지 생성 성공", extra={"images": images})
                 return image_url
             else:
                 # 응답에 유효한 URL이 없는 경우
-                print("이미지 생성 실패: 응답 데이터 없음 또는 URL 누락.")
+                logger.error("이미지 생성 실패: 응답 데이터 없음 또는 URL 누락.")
                 return "이미지 생성 실패: 유효한 이미지 URL을 받을 수 없습니다."
 
-        except APIError as e:
-            # OpenAI API 관련 오류 처리
-            error_message = f"OpenAI API 오류 발생: 상태 코드 {e.status_code}, 메시지: {e.response.text}"
-            print(error_message)
+        except RateLimitWait as e:
+            # 허용 대기 시간을 넘는 경우 실패 대신 예상 대기 시간 안내
+            logger.warning("이미지 생성 대기 시간 초과 예상: %s", e)
+            return f"이미지 생성 요청이 많습니다. 약 {e.eta_seconds:.0f}초 후에 다시 시도해주세요."
+        except CircuitOpenError as e:
+            logger.error("이미지 생성 회로 차단기 열림: %s", e)
+            return f"이미지 생성 중 오류 발생: {e}"
+        except APITimeoutError as e:
+            # 응답 대기 시간 초과 (상태 코드와 응답이 없는 오류)
+            logger.error("이미지 생성 응답 시간 초과: %s", e)
+            return "이미지 생성 중 오류 발생: OpenAI 서버의 응답 시간이 초과되었습니다."
+        except APIConnectionError as e:
+            logger.error("OpenAI API 연결 실패: %s", e)
+            return "이미지 생성 중 오류 발생: OpenAI 서버에 연결할 수 없습니다."
+        except APIStatusError as e:
+            # 서버가 오류 상태 코드로 응답한 경우
+            logger.error("OpenAI API 오류 발생", extra={"status_code": e.status_code, "response": e.response.text[:500]})
             return f"OpenAI API 오류 발생: {e.status_code} - {e.response.text}"
+        except APIError as e:
+            # 그 외 OpenAI API 오류 (응답 형식 오류 등, 상태 코드 없음)
+            logger.error("OpenAI API 오류 발생: %s", e)
+            return f"OpenAI API 오류 발생: {e}"
         except Exception as e:
             # 그 외 일반적인 오류 처리
-            error_message = f"이미지 생성 중 예상치 못한 오류 발생: {e}"
-            print(error_message)
+            logger.error("이미지 생성 중 예상치 못한 오류 발생: %s", e, exc_info=True)
             return f"이미지 생성 중 오류 발생: {e}"
\ No newline at end of file
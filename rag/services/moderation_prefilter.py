@@ -0,0 +1,168 @@
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from core.text_matcher import AhoCorasick
+from core.tracing import register_json_endpoint
+
+# 판정 결과 상수
+SAFE = "safe" # 명백히 안전 → Moderation API 호출 생략
+UNSAFE = "unsafe" # 명백히 위험 → 즉시 차단
+AMBIGUOUS = "ambiguous" # 애매함 → Moderation API로 확인
+
+# 즉시 차단해야 하는 표현 (1인칭 자해 의도, 미성년자 성적 표현 등). 가중치가 높아 단독으로도 UNSAFE가 됩니다.
+# 꿈 이야기에서 사건으로 등장할 수 있는 단어("suicide", "자살" 등)는 여기에 두지 않고 RISK_TERMS에서 API 판정에 맡깁니다.
+# 띄어쓰기를 생략한 입력이 많으므로 붙여 쓴 형태도 함께 등록합니다.
+UNSAFE_TERMS: Dict[str, float] = {
+    "자살하고 싶": 4.0, "자살하고싶": 4.0, "죽고 싶": 3.0, "죽고싶": 3.0, "죽어버리고 싶": 3.0, "죽어버리고싶": 3.0,
+    "자해하고 싶": 4.0, "자해하고싶": 4.0, "손목을 긋": 4.0, "손목을 그었": 4.0, "손목을 그어": 4.0,
+    "목을 매": 3.5, "아동 성": 4.0, "미성년자와 성": 4.0,
+    "kill myself": 4.0, "killing myself": 4.0, "want to die": 3.0, "wanna die": 3.0, "cut myself": 3.5,
+    "cutting myself": 3.5, "child porn": 4.0,
+}
+
+# 악몽에서 자주 나오지만 맥락에 따라 위험할 수 있는 표현. 점수를 올리지만 단독으로는 차단하지 않습니다.
+# 한국어 용언은 어간만으로는 활용형이 빠지므로 (예: "죽이"는 "죽였", "죽여"와 매칭되지 않음) 자주 쓰는 활용형을 모두 등록합니다.
+RISK_TERMS: Dict[str, float] = {
+    "죽이": 0.8, "죽였": 0.8, "죽여": 0.8, "죽인": 0.8, "죽일": 0.8, "죽임": 0.8,
+    "죽었": 0.5, "죽는": 0.5, "죽은": 0.5, "죽을": 0.5, "죽어": 0.5, "죽음": 0.5,
+    "살인": 0.9, "살해": 0.9, "시체": 0.7, "피가": 0.4, "피를": 0.4, "피투성이": 0.5, "피범벅": 0.5,
+    "칼로": 0.6, "칼에": 0.6, "칼을": 0.6, "총을": 0.6, "총에": 0.6, "총으로": 0.6, "총알": 0.6,
+    "폭행": 0.7, "때렸": 0.5, "때려": 0.5, "강간": 1.5, "성폭행": 1.5, "고문": 0.9,
+    "목을 졸": 1.0, "목을 조르": 1.0, "목을 졸랐": 1.0, "찔렀": 0.8, "찔러": 0.8, "찔린": 0.6, "찔리": 0.6, "찔려": 0.6,
+    "학대": 0.8, "자살": 1.2, "자해": 1.2, "마약": 0.8, "테러": 0.8, "폭탄": 0.8,
+    "kill": 0.8, "murder": 0.9, "blood": 0.4, "corpse": 0.7, "knife": 0.6, "gun": 0.6, "stab": 0.8,
+    "rape": 1.5, "torture": 0.9, "abuse": 0.8, "drug": 0.6, "bomb": 0.8, "suicide": 1.2, "self-harm": 1.2,
+}
+
+# 바람을 나타내는 UNSAFE 표현이 부정되면("죽고 싶지 않아서", "didn't want to die") 의도가 반대이므로
+# UNSAFE 가중치 대신 NEGATED_WEIGHT만 반영하여 API 판정에 맡깁니다.
+NEGATION_SUFFIXES = ("지 않", "지않", "진 않", "진않", "지는 않", "지는않", "지도 않", "지도않")
+NEGATION_PREFIXES = ("don't ", "dont ", "do not ", "didn't ", "didnt ", "did not ", "never ", "not ")
+NEGATED_WEIGHT = 0.5
+
+SAFE_THRESHOLD = 0.05 # 점수가 이 값 이하이면 안전
+UNSAFE_THRESHOLD = 0.9 # 점수가 이 값 이상이면 위험
+
+
+@dataclass
+class PrefilterVerdict:
+    """로컬 사전 필터의 판정 결과"""
+    decision: str # SAFE / UNSAFE / AMBIGUOUS
+    score: float # 0.0(안전) ~ 1.0(위험) 사이의 위험 점수
+    matched_terms: List[str] = field(default_factory=list) # 매칭된 표현 목록
+
+
+class ModerationPrefilter:
+    """
+    Aho-Corasick 다중 패턴 매칭과 가벼운 선형 점수 모델로 텍스트를 1차 분류합니다.
+    명백한 경우만 로컬에서 결정하고, 애매한 경우는 Moderation API에 맡깁니다.
+    """
+    def __init__(self, unsafe_terms: Dict[str, float] = None, risk_terms: Dict[str, float] = None,
+                 safe_threshold: float = SAFE_THRESHOLD, unsafe_threshold: float = UNSAFE_THRESHOLD):
+        self.weights = dict(risk_terms if risk_terms is not None else RISK_TERMS)
+        self.weights.update(unsafe_terms if unsafe_terms is not None else UNSAFE_TERMS)
+        self.safe_threshold = safe_threshold
+        self.unsafe_threshold = unsafe_threshold
+        self.matcher = AhoCorasick(self.weights.keys())
+
+    def _is_negated(self, text: str, start: int, term: str) -> bool:
+        """바람 표현("싶", "want to die") 바로 뒤/앞에 부정 표현이 붙었는지 확인합니다."""
+        if term.endswith("싶"):
+            return text.startswith(NEGATION_SUFFIXES, start + len(term))
+        if term in ("want to die", "wanna die"):
+            return text[:start].endswith(NEGATION_PREFIXES)
+        return False
+
+    def score(self, text: str) -> PrefilterVerdict:
+        """
+        텍스트의 위험 점수를 계산합니다.
+        같은 표현이 반복되면 가중치를 점점 줄여 반영하고, 합계를 로지스틱 형태로 0~1 사이에 맞춥니다.
+        부정된 바람 표현은 "표현(부정)"으로 따로 세고 NEGATED_WEIGHT만 반영합니다.
+        """
+        normalized = text.lower() # AhoCorasick의 시작 위치는 소문자로 바꾼 텍스트 기준
+        counts: Dict[str, int] = {}
+        weights: Dict[str, float] = {}
+        for start, term in self.matcher.find_all(text):
+            key, weight = term, self.weights[term]
+            if self._is_negated(normalized, start, term):
+                key, weight = f"{term}(부정)", NEGATED_WEIGHT
+            counts[key] = counts.get(key, 0) + 1
+            weights[key] = weight
+        if not counts:
+            return PrefilterVerdict(decision=SAFE, score=0.0)
+
+        total = sum(weights[term] * (1.0 + math.log(count)) for term, count in counts.items())
+        score = 1.0 - math.exp(-total) # 가중치 합이 클수록 1에 가까워짐
+        if score <= self.safe_threshold:
+            decision = SAFE
+        elif score >= self.unsafe_threshold:
+            decision = UNSAFE
+        else:
+            decision = AMBIGUOUS
+        return PrefilterVerdict(decision=decision, score=round(score, 4), matched_terms=sorted(counts))
+
+
+class PrefilterMetrics:
+    """
+    사전 필터 판정과 Moderation API 판정을 비교하는 섀도 모드 지표입니다.
+    여러 세션에서 동시에 기록하므로 락으로 보호합니다.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions = {SAFE: 0, UNSAFE: 0, AMBIGUOUS: 0} # 사전 필터 판정 분포
+        self.api_calls_skipped = 0 # 사전 필터 덕분에 생략된 API 호출 수
+        self.shadow = {} # (사전 필터 판정, API flagged) → 횟수
+
+    def record_decision(self, decision: str, skipped_api: bool) -> None:
+        with self._lock:
+            self.decisions[decision] += 1
+            if skipped_api:
+                self.api_calls_skipped += 1
+
+    def record_shadow(self, decision: str, api_flagged: bool) -> None:
+        with self._lock:
+            key = (decision, api_flagged)
+            self.shadow[key] = self.shadow.get(key, 0) + 1
+
+    def decision_precision(self, decision: str) -> Tuple[int, Optional[float]]:
+        """
+        사전 필터가 SAFE 또는 UNSAFE로 판정한 경우 중 API 판정과 일치한 비율입니다.
+        :return: (비교한 횟수, 일치율) (비교한 적이 없으면 일치율은 None)
+        """
+        agreeing = (decision, decision == UNSAFE) # SAFE ↔ API 미차단, UNSAFE ↔ API 차단
+        disagreeing = (decision, decision != UNSAFE)
+        with self._lock:
+            agreed = self.shadow.get(agreeing, 0)
+            compared = agreed + self.shadow.get(disagreeing, 0)
+        return compared, (agreed / compared) if compared else None
+
+    def is_trusted(self, decision: str, min_samples: int, min_agreement: float) -> bool:
+        """이 판정이 API와 충분히 비교되었고 일치율이 기준 이상일 때만 API 호출 생략을 허용합니다."""
+        compared, agreement = self.decision_precision(decision)
+        return compared >= min_samples and agreement is not None and agreement >= min_agreement
+
+    def snapshot(self) -> dict:
+        """
+        현재까지의 지표를 반환합니다.
+        false_safe는 사전 필터가 안전으로 판정했지만 API는 차단한 경우로, 가장 주의해서 봐야 하는 값입니다.
+        """
+        with self._lock:
+            compared = sum(self.shadow.values())
+            agreed = self.shadow.get((SAFE, False), 0) + self.shadow.get((UNSAFE, True), 0)
+            decided = compared - self.shadow.get((AMBIGUOUS, False), 0) - self.shadow.get((AMBIGUOUS, True), 0)
+            return {
+                "decisions": dict(self.decisions),
+                "api_calls_skipped": self.api_calls_skipped,
+                "shadow_compared": compared,
+                "shadow_agreement": (agreed / decided) if decided else None,
+                "false_safe": self.shadow.get((SAFE, True), 0),
+                "false_unsafe": self.shadow.get((UNSAFE, False), 0),
+                "ambiguous_flag_rate": (self.shadow.get((AMBIGUOUS, True), 0) / (compared - decided)) if compared - decided else None,
+            }
+
+
+# 프로세스 전체에서 공유하는 지표 객체 (지표 서버의 /moderation-prefilter로 섀도 모드 일치율 확인)
+prefilter_metrics = PrefilterMetrics()
+register_json_endpoint("/moderation-prefilter", prefilter_metrics.snapshot)
@@ -1,30 +1,122 @@
+import random
+import threading
 from openai import OpenAI # OpenAI API와 통신하기 위한 OpenAI 클라이언트 임포트
+from core import config
+from core.deadline import remaining_or_none
+from core.micro_batcher import MicroBatcher, get_batcher
+from core.rate_limiter import build_http_client, estimate_tokens
+from core.resilience import call_with_resilience
+from core.structured_logging import get_logger
+from core.shared_cache import shared_cache
+from core.tracing import traced
+from services.moderation_prefilter import ModerationPrefilter, prefilter_metrics, AMBIGUOUS, SAFE
+
+logger = get_logger("services.moderation")
+
+
+def is_judged(result: dict) -> bool:
+    """API 오류 없이 판정을 마친 결과인지 확인합니다."""
+    return "error" not in result.get("details", {})
+
 
 class ModerationService:
     """
     텍스트 내용의 안전성을 검사하는 서비스를 제공하는 클래스입니다.
-    OpenAI의 Moderation API를 사용합니다.
+    로컬 사전 필터로 명백한 경우를 먼저 판정하고, 애매한 경우에만 OpenAI의 Moderation API를 사용합니다.
+    (enforce 모드에서 API 호출을 생략하는 것은 해당 판정의 API 일치율이 측정되어 기준을 넘은 뒤부터입니다.)
     """
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, prefilter: ModerationPrefilter = None, prefilter_mode: str = None):
         """
         ModerationService를 초기화합니다.
         :param api_key: OpenAI API 키
+        :param prefilter: (선택 사항) 로컬 사전 필터, 없으면 기본 용어 목록으로 생성
+        :param prefilter_mode: (선택 사항) off / shadow / enforce, 없으면 config 값 사용
         """
         # OpenAI 클라이언트 초기화
-        self.client = OpenAI(api_key=api_key)
+        self.client = OpenAI(api_key=api_key, http_client=build_http_client(), max_retries=0)
+        self.prefilter = prefilter or ModerationPrefilter()
+        self.prefilter_mode = prefilter_mode or config.MODERATION_PREFILTER_MODE
+        # 여러 세션의 검사 요청을 모아 한 번의 moderations.create 배열 요청으로 전송
+        self.batcher = get_batcher("moderation", id(self.client), lambda: MicroBatcher(
+            self._moderate_batch,
+            max_batch_size=config.MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=config.MICRO_BATCH_MAX_WAIT_MS,
+            default_timeout=config.MICRO_BATCH_CALL_TIMEOUT_SECONDS,
+            name="moderation",
+        ))
 
+    # API 오류로 판정하지 못한 결과는 저장하지 않음
+    @shared_cache.cached("moderation", key=lambda self, text: (text, self.prefilter_mode),
+                         accept=is_judged)
+    @traced(accept=is_judged)
     def check_text_safety(self, text: str) -> dict:
         """
         주어진 텍스트의 안전성을 검사하고 결과를 딕셔너리로 반환합니다.
         :param text: 검사할 텍스트
         :return: flagged (bool), text (str), details (dict)를 포함하는 딕셔너리
         """
+        if self.prefilter_mode == "off":
+            return self._check_with_api(text)
+
+        verdict = self.prefilter.score(text)
+
+        # 섀도 모드이거나, 애매하거나, enforce 모드라도 이 판정의 API 일치율이 아직 충분히 측정되지 않았다면
+        # 결과는 API 판정을 따르고 사전 필터 판정은 비교용으로만 기록
+        if self.prefilter_mode == "shadow" or verdict.decision == AMBIGUOUS or not prefilter_metrics.is_trusted(
+                verdict.decision, config.MODERATION_ENFORCE_MIN_SAMPLES, config.MODERATION_ENFORCE_MIN_AGREEMENT):
+            prefilter_metrics.record_decision(verdict.decision, skipped_api=False)
+            result = self._check_with_api(text)
+            self._record_shadow(verdict.decision, result)
+            return result
+
+        if verdict.decision == SAFE:
+            prefilter_metrics.record_decision(verdict.decision, skipped_api=True)
+            self._maybe_shadow_in_background(text, verdict.decision)
+            return {
+                "flagged": False,
+                "text": "안전합니다.",
+                "details": {"source": "prefilter", "score": verdict.score, "matched_terms": verdict.matched_terms}
+            }
+
+        prefilter_metrics.record_decision(verdict.decision, skipped_api=True) # UNSAFE
+        self._maybe_shadow_in_background(text, verdict.decision)
+        return {
+            "flagged": True,
+            "text": f"입력된 내용이 안전 정책을 위반할 수 있습니다: {', '.join(verdict.matched_terms)}",
+            "details": {"source": "prefilter", "score": verdict.score, "matched_terms": verdict.matched_terms}
+        }
+
+    def _record_shadow(self, decision: str, result: dict) -> None:
+        # API 오류로 인한 차단은 실제 판정이 아니므로 비교에서 제외
+        if "error" not in result.get("details", {}):
+            prefilter_metrics.record_shadow(decision, result["flagged"])
+
+    def _maybe_shadow_in_background(self, text: str, decision: str) -> None:
+        """
+        로컬에서 결정한 판정 중 일부를 백그라운드에서 API로 다시 검사하여 정확도를 추적합니다.
+        사용자 요청 경로는 기다리지 않습니다.
+        """
+        if random.random() >= config.MODERATION_SHADOW_SAMPLE_RATE:
+            return
+        threading.Thread(
+            target=lambda: self._record_shadow(decision, self._check_with_api(text)),
+            daemon=True,
+        ).start()
+
+    def _moderate_batch(self, texts: list) -> list:
+        """(내부용) 배처가 모은 텍스트들을 한 번의 Moderation API 요청으로 검사합니다."""
+        def request():
+            return self.client.moderations.create(input=texts).results
+        return call_with_resilience("ModerationService.moderate_batch", "moderation", request, tokens=estimate_tokens(*texts))
+
+    def _check_with_api(self, text: str) -> dict:
+        """
+        (내부용) Moderation API를 호출하여 안전성을 검사합니다.
+        """
         try:
-            # Moderation API를 호출하여 텍스트 안전성 검사
-            response = self.client.moderations.create(input=text)
-            # 검사 결과의 첫 번째 요소 가져오기
-            moderation_result = response.results[0]
-            
+            # 공용 배처를 통해 Moderation API를 호출하고 이 텍스트에 해당하는 결과 받기
+            moderation_result = self.batcher.call(text, timeout=remaining_or_none()) # 요청의 남은 예산만큼만 대기
+
             # 텍스트가 안전 정책을 위반했는지 확인
             if moderation_result.flagged:
                 # 플래그된 카테고리 목록 생성
@@ -46,9 +138,9 @@ class ModerationService:
                 }
         except Exception as e:
             # 오류 발생 시 에러 메시지 출력 및 오류 결과 반환
-            print(f"Error during moderation check: {e}")
+            logger.error("안전성 검사 중 오류 발생: %s", e, exc_info=True)
             return {
                 "flagged": True,
                 "text": f"안전성 검사 중 오류가 발생했습니다: {e}",
                 "details": {"error": str(e)}
-            }
\ No newline at end of file
+            }
@@ -0,0 +1,46 @@
+from typing import Any, Dict
+
+# RAG(Retrieval-Augmented Generation) 기능을 위한 임포트
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.vectorstores import FAISS
+from core.batched_embeddings import BatchedEmbeddings
+from core.context_packing import PackedContextRetriever
+from core.symbol_lookup import SymbolLookup
+from core.rate_limiter import build_http_client
+from services import stt_service, dream_analyzer_service, image_generator_service, moderation_service, report_generator_service
+from services import fused_analysis_service
+
+
+def build_retriever(api_key: str, index_path: str = "faiss_index") -> PackedContextRetriever:
+    """
+    로컬 FAISS 인덱스로 RAG 검색기를 생성합니다.
+    검색 결과의 중복/겹침을 제거하고 관련도 순으로 토큰 예산에 맞춰 자르며,
+    알려진 상징의 섹션은 인덱싱 시 만든 조회 테이블에서 찾아 벡터 검색 결과에 합칩니다.
+    :param api_key: OpenAI API 키
+    :param index_path: FAISS 인덱스 폴더
+    """
+    # 쿼리 임베딩은 프로세스 공용 배처로 묶어서 요청
+    embeddings = BatchedEmbeddings(OpenAIEmbeddings(api_key=api_key, http_client=build_http_client(), max_retries=0))
+    vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    return PackedContextRetriever(vector_store=vector_store, symbol_lookup=SymbolLookup.load(index_path))
+
+
+def build_services(api_key: str, index_path: str = "faiss_index", retriever: Any = None,
+                   moderation_mode: str = None) -> Dict[str, Any]:
+    """
+    RAG 검색기와 서비스를 생성합니다. (Streamlit 앱, API 서버 워커, 일괄 처리 CLI, 벤치마크에서 프로세스마다 한 번)
+    :param api_key: OpenAI API 키
+    :param index_path: FAISS 인덱스 폴더
+    :param retriever: (선택 사항) 이미 만든 검색기 (없으면 build_retriever로 생성)
+    :param moderation_mode: (선택 사항) 검열 사전 필터 모드 (없으면 config.MODERATION_PREFILTER_MODE)
+    :return: {"stt", "analyzer", "image", "moderation", "report", "fused"} → 서비스 객체
+    """
+    retriever = retriever or build_retriever(api_key, index_path)
+    return {
+        "stt": stt_service.STTService(api_key=api_key),
+        "analyzer": dream_analyzer_service.DreamAnalyzerService(api_key=api_key, retriever=retriever),
+        "image": image_generator_service.ImageGeneratorService(api_key=api_key),
+        "moderation": moderation_service.ModerationService(api_key=api_key, prefilter_mode=moderation_mode),
+        "report": report_generator_service.ReportGeneratorService(api_key=api_key, retriever=retriever),
+        "fused": fused_analysis_service.FusedAnalysisService(api_key=api_key, retriever=retriever),
+    }
@@ -1,10 +1,26 @@
+import contextvars
 import json # JSON 데이터 처리를 위한 json 모듈 임포트
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Any # 타입 힌트를 위한 List, Any 임포트
 from pydantic import BaseModel, Field # Pydantic을 이용한 데이터 모델 정의
 from langchain_core.prompts import ChatPromptTemplate # 챗 프롬프트 템플릿 정의
 from langchain_core.runnables import RunnablePassthrough # 입력값을 그대로 통과시키는 Runnable
 from langchain_openai import ChatOpenAI # OpenAI 챗 모델 사용
-from langchain.output_parsers import PydanticOutputParser # Pydantic 모델 기반 출력 파서
+from core import config
+from core.chain_registry import ChainRegistry
+from core.deadline import DeadlineExceeded, PipelineCancelled
+from core.model_router import model_router
+from core.llm_usage import total_tokens
+from core.rate_limiter import build_http_client, estimate_tokens, scheduler
+from core.resilience import call_with_resilience
+from core.structured_logging import get_logger
+from core.shared_cache import shared_cache
+from core.tracing import traced
+
+logger = get_logger("services.report")
 
 # Pydantic 모델 정의
 # 감정 정보를 담는 모델
@@ -18,6 +34,75 @@ class Report(BaseModel):
     keywords: List[str] = Field(description="꿈의 핵심 키워드 목록 (한국어)") # 핵심 키워드 목록
     analysis_summary: str = Field(description="전문 지식을 바탕으로 한 심층 분석 요약 (2-4 문장, 한국어)") # 심층 분석 요약
 
+# 프롬프트 정의
+# 모든 사용자에게 동일한 지시문은 시스템 메시지(접두부)에, 꿈마다 달라지는 내용(검색 컨텍스트, 꿈 텍스트)은 마지막 사용자 메시지에만 넣습니다.
+# 주의: 시스템 메시지가 공급자 측 프롬프트 캐시의 최소 길이(OpenAI 1024토큰)보다 짧아 현재는 캐시 할인이 적용되지 않습니다.
+# 캐시를 위해 지시문을 늘리면 늘어난 토큰 비용이 할인(캐시 토큰 50%)보다 커지므로 늘리지 않으며,
+# 지시문이 그 길이를 넘게 되면 이 배치 그대로 캐시에 적중합니다. (적중 여부는 core.llm_usage의 cached_tokens로 확인)
+REPORT_PROMPT_VERSION = "v3" # 프롬프트를 수정하면 버전을 올려 체인 저장소에서 구분
+REPORT_SYSTEM_PROMPT = """You are an AI dream analyst who is an expert in IRT and dream symbolism.
+Your task is to analyze the user's dream by referring to the provided [Professional Knowledge].
+Based on BOTH the [User's Dream Text] and the [Professional Knowledge], generate a structured report.
+The 'analysis_summary' MUST be based on insights from the [Professional Knowledge].
+All parts of the report (emotions, keywords, summary) MUST be in Korean."""
+
+REPORT_HUMAN_TEMPLATE = """[Professional Knowledge]
+{context}
+
+[User's Dream Text]
+{dream_text}"""
+
+# RAG 없이 꿈 텍스트만으로 리포트를 생성하는 프롬프트 (RAG 경로가 늦을 때의 대체 경로)
+PLAIN_REPORT_PROMPT_VERSION = "v1"
+PLAIN_REPORT_SYSTEM_PROMPT = """You are an AI dream analyst. Analyze the user's dream text to identify core emotions and key elements.
+Provide:
+1. A list of dominant emotions with a score (0-1, 0 being low, 1 being high). Output emotion names in Korean.
+2. A list of key keywords (nouns, verbs, adjectives relevant to the dream's core). Output keywords in Korean.
+3. A brief (2-3 sentences) overall analysis summary of the dream's emotional tone and potential themes. Output analysis summary in Korean."""
+
+PLAIN_REPORT_HUMAN_TEMPLATE = """[User's Dream Text]
+{dream_text}"""
+
+
+class ReportPathMetrics:
+    """RAG 리포트와 일반 리포트 중 어느 경로가 응답했는지와 그 이유를 집계합니다."""
+    def __init__(self, history: int = 100):
+        self._lock = threading.Lock()
+        self.answered = {} # 경로(rag/plain) → 응답 횟수
+        self.fallback_reasons = {} # 대체 사유(deadline/error) → 횟수
+        self.recent = deque(maxlen=history) # 최근 요청별 응답 경로와 소요 시간
+
+    def record(self, path: str, seconds: float, reason: str = None) -> None:
+        with self._lock:
+            self.answered[path] = self.answered.get(path, 0) + 1
+            if reason:
+                self.fallback_reasons[reason] = self.fallback_reasons.get(reason, 0) + 1
+            self.recent.append({"path": path, "seconds": round(seconds, 3), "reason": reason})
+        logger.info("리포트 응답 경로: %s (%.2f초)", path, seconds, extra={"path": path, "seconds": round(seconds, 3), "fallback_reason": reason})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"answered": dict(self.answered), "fallback_reasons": dict(self.fallback_reasons), "recent": list(self.recent)}
+
+
+# 프로세스 전체에서 공유하는 리포트 경로 지표
+report_path_metrics = ReportPathMetrics()
+
+# RAG 경로와 일반 경로를 동시에 실행하기 위한 스레드 풀
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="report")
+
+
+def _submit(fn, *args):
+    # 호출자의 요청 컨텍스트(남은 예산, 취소 상태)를 유지한 채 다른 스레드에서 실행
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, fn, *args)
+
+
+def is_report(report: dict) -> bool:
+    """오류 안내용 빈 리포트가 아닌 실제 리포트(감정과 키워드가 있음)인지 확인합니다. (빈 리포트는 span을 오류로 기록)"""
+    return bool(report.get("emotions")) and bool(report.get("keywords")) and report.get("source") != "none"
+
+
 class ReportGeneratorService:
     """
     [RAG 통합 버전] 꿈 텍스트와 전문 지식을 함께 분석하여
@@ -29,17 +114,84 @@ class ReportGeneratorService:
         :param api_key: OpenAI API 키
         :param retriever: (선택 사항) 미리 학습된 FAISS retriever 객체
         """
-        # OpenAI 챗 모델 초기화
-        self.llm = ChatOpenAI(model="gpt-4o", api_key=api_key, temperature=0.3)
         # 검색기(retriever) 설정 (RAG 사용 시 필요)
         self.retriever = retriever
-        # PydanticOutputParser를 사용하여 리포트 모델에 맞게 출력 파싱
-        self.parser = PydanticOutputParser(pydantic_object=Report)
+        # 모델 라우터가 이 단계에서 사용할 수 있는 모델마다 OpenAI 챗 모델 초기화
+        self.llms = {
+            model: ChatOpenAI(model=model, api_key=api_key, temperature=0.3, http_client=build_http_client(), max_retries=0)
+            for model in model_router.candidates("report")
+        }
+        # 체인은 초기화 시 모델별로 한 번만 구성하여 모든 호출에서 재사용
+        self.chains = ChainRegistry()
+        plain_prompt = ChatPromptTemplate.from_messages([
+            ("system", PLAIN_REPORT_SYSTEM_PROMPT),
+            ("human", PLAIN_REPORT_HUMAN_TEMPLATE),
+        ])
+        for model, llm in self.llms.items():
+            self.chains.register(f"report_plain@{model}", PLAIN_REPORT_PROMPT_VERSION, (
+                {"dream_text": RunnablePassthrough()} | plain_prompt | llm.with_structured_output(Report, method="json_schema", strict=True, include_raw=True)
+            ))
+        if self.retriever:
+            for model, llm in self.llms.items():
+                self.chains.register(f"report_with_rag@{model}", REPORT_PROMPT_VERSION, self._build_rag_chain(llm))
 
     def _format_docs(self, docs: List[Any]) -> str:
-        """검색된 문서들을 하나의 문자열로 결합하는 내부 함수"""
+        """검색된 문서들을 하나의 문자열로 결합하는 내부 함수 (PackedContextRetriever는 이미 관련도 순으로 정리된 문서를 반환)"""
         return "\n\n".join(doc.page_content for doc in docs)
 
+    @staticmethod
+    def _is_valid_report(result: dict) -> bool:
+        """스키마 파싱에 성공했고 감정/키워드/요약이 모두 채워졌는지 확인합니다. (실패 시 더 강한 모델로 상향)"""
+        report = result["parsed"]
+        if result["parsing_error"] is not None or report is None:
+            return False
+        return bool(report.emotions and report.keywords and report.analysis_summary.strip()) and \
+            all(0.0 <= emotion.score <= 1.0 for emotion in report.emotions)
+
+    def _build_rag_chain(self, llm: ChatOpenAI):
+        """리포트 생성 체인을 구성합니다. (초기화 시 모델별로 한 번 호출)"""
+        # 프롬프트 템플릿 생성 (고정 시스템 메시지 + 꿈별 사용자 메시지)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", REPORT_SYSTEM_PROMPT),
+            ("human", REPORT_HUMAN_TEMPLATE),
+        ])
+        # LangChain Expression Language (LCEL) 체인 구성
+        return (
+            {"context": self.retriever | self._format_docs, "dream_text": RunnablePassthrough()} # context는 retriever로 문서 검색 후 포맷, dream_text는 그대로 전달
+            | prompt # 프롬프트 적용
+            # 리포트 모델의 JSON 스키마로 출력을 제한 (프롬프트에 형식 지시어를 넣거나 응답을 파싱할 필요 없음)
+            # include_raw=True: 원시 응답의 usage_metadata(캐시 적중 토큰 포함)도 함께 받음 ({"raw", "parsed", "parsing_error"} 반환)
+            | llm.with_structured_output(Report, method="json_schema", strict=True, include_raw=True)
+        )
+
+    def _run_report(self, name: str, chain_name: str, version: str, system_prompt: str, dream_text: str) -> dict:
+        """라우터가 고른 모델의 리포트 체인을 실행하고 리포트 딕셔너리를 반환합니다. (오류는 그대로 전달)"""
+        # 모델별로 초기화 시 구성해 둔 체인을 공용 스케줄러에서 예산 확보 후 실행
+        def call(model):
+            chain = self.chains.get(f"{chain_name}@{model}", version)
+            def request():
+                result = chain.invoke(dream_text)
+                scheduler.reconcile(model, tokens, total_tokens(result["raw"])) # 추정치를 실제 사용량으로 보정
+                return result
+            tokens = estimate_tokens(system_prompt, dream_text, completion_tokens=1500)
+            return call_with_resilience(name, model, request, tokens=tokens)
+        # 라우터가 고른 모델로 실행하고, 검증에 실패하면 더 강한 모델로 다시 실행
+        result = model_router.run(
+            "report", name, call, raw_message=lambda result: result["raw"], validate=self._is_valid_report,
+        )
+        return result["parsed"].dict() # 리포트 객체를 딕셔너리로 변환하여 반환
+
+    def _rag_report(self, dream_text: str) -> dict:
+        return self._run_report(
+            "ReportGeneratorService.generate_report_with_rag", "report_with_rag", REPORT_PROMPT_VERSION, REPORT_SYSTEM_PROMPT, dream_text
+        )
+
+    def _plain_report(self, dream_text: str) -> dict:
+        return self._run_report(
+            "ReportGeneratorService.generate_report", "report_plain", PLAIN_REPORT_PROMPT_VERSION, PLAIN_REPORT_SYSTEM_PROMPT, dream_text
+        )
+
+    @traced(accept=is_report)
     def generate_report_with_rag(self, dream_text: str) -> dict:
         """
         주어진 꿈 텍스트에 대해 RAG를 활용한 심층 분석 리포트를 생성합니다.
@@ -50,43 +202,96 @@ class ReportGeneratorService:
         if not self.retriever:
             raise ValueError("RAG 리포트를 생성하려면 retriever 객체가 필요합니다.")
 
-        # RAG를 위한 프롬프트 템플릿 정의
-        rag_prompt_template = """
-        You are an AI dream analyst who is an expert in IRT and dream symbolism.
-        Your task is to analyze the user's dream by referring to the provided [Professional Knowledge].
-        Based on BOTH the [User's Dream Text] and the [Professional Knowledge], generate a structured report.
-        The 'analysis_summary' MUST be based on insights from the [Professional Knowledge].
-        All parts of the report (emotions, keywords, summary) MUST be in Korean.
-        {format_instructions}
-
-        [Professional Knowledge]
-        {context}
-
-        [User's Dream Text]
-        {dream_text}
-        """
-        # 프롬프트 템플릿 생성 및 형식 지시어 적용
-        prompt = ChatPromptTemplate.from_template(
-            rag_prompt_template,
-            partial_variables={"format_instructions": self.parser.get_format_instructions()}
-        )
-        # LangChain Expression Language (LCEL) 체인 구성
-        chain = (
-            {"context": self.retriever | self._format_docs, "dream_text": RunnablePassthrough()} # context는 retriever로 문서 검색 후 포맷, dream_text는 그대로 전달
-            | prompt # 프롬프트 적용
-            | self.llm # LLM 호출
-            | self.parser # 파서로 출력 형식 변환
-        )
         try:
-            # 체인 실행 및 리포트 객체 반환
-            report_object = chain.invoke(dream_text)
-            return report_object.dict() # 리포트 객체를 딕셔너리로 변환하여 반환
+            return self._rag_report(dream_text)
         except Exception as e:
             # 오류 발생 시 에러 메시지 출력 및 빈 리포트 반환
-            print(f"Error generating report with RAG: {e}")
+            logger.error("RAG 리포트 생성 실패: %s", e, exc_info=True)
             return {"emotions": [], "keywords": [], "analysis_summary": f"RAG 리포트 생성 중 오류가 발생했습니다: {e}"}
 
+    @traced(accept=is_report)
     def generate_report(self, dream_text: str) -> dict:
-        """ (기존 함수) RAG 없이 LLM만으로 리포트를 생성합니다. """
-        # 현재 RAG 버전을 사용하므로 이 함수는 비활성화됨
-        return {"emotions": [], "keywords": [], "analysis_summary": "RAG 없는 기본 분석은 현재 비활성화되어 있습니다."}
\ No newline at end of file
+        """
+        RAG 없이 LLM만으로 리포트를 생성합니다. (검색 단계가 없어 RAG 리포트보다 빠름)
+        :param dream_text: 분석할 꿈의 텍스트
+        :return: 감정, 키워드, 분석 요약을 포함하는 딕셔너리
+        """
+        try:
+            return self._plain_report(dream_text)
+        except Exception as e:
+            logger.error("리포트 생성 실패: %s", e, exc_info=True)
+            return {"emotions": [], "keywords": [], "analysis_summary": f"리포트 생성 중 오류가 발생했습니다: {e}"}
+
+    # 일반 리포트로 대체된 결과와 오류 안내용 빈 리포트는 저장하지 않아 다음 요청에서 RAG 리포트를 다시 시도
+    @shared_cache.cached("report", key=lambda self, dream_text, mode=None, rag_deadline=None: (dream_text,),
+                         accept=lambda report: report.get("source") == "rag" and is_report(report), version=REPORT_PROMPT_VERSION)
+    @traced(accept=is_report)
+    def generate_report_with_fallback(self, dream_text: str, mode: str = None, rag_deadline: float = None) -> dict:
+        """
+        RAG 리포트를 우선 사용하되, 검색이나 RAG LLM 호출이 기한 안에 끝나지 않거나 실패하면 일반 리포트를 반환합니다.
+        - race: 두 경로를 동시에 시작하고, 기한 안에 RAG 리포트가 오면 RAG, 기한이 지나면 먼저 끝난 쪽을 사용
+        - fallback: RAG 경로만 시작하고, 기한을 넘기거나 실패한 뒤에 일반 경로를 시작 (호출 비용 절약)
+        - off: RAG 경로만 사용 (retriever가 없으면 일반 경로만 사용)
+        :param mode: race / fallback / off (없으면 config.REPORT_FALLBACK_MODE)
+        :param rag_deadline: RAG 경로를 기다리는 시간(초) (없으면 config.REPORT_RAG_DEADLINE_SECONDS)
+        :return: 리포트 딕셔너리, "source" 키에 응답한 경로(rag/plain, 모두 실패 시 none)를 기록
+        :raises PipelineCancelled: 요청이 취소된 경우 (대체 경로도 실행하지 않음)
+        :raises DeadlineExceeded: 요청 예산을 모두 사용한 경우
+        """
+        mode = mode or config.REPORT_FALLBACK_MODE
+        rag_deadline = config.REPORT_RAG_DEADLINE_SECONDS if rag_deadline is None else rag_deadline
+        started = time.monotonic()
+        if not self.retriever or mode == "off":
+            source = "rag" if self.retriever else "plain"
+            try:
+                report = self._rag_report(dream_text) if self.retriever else self._plain_report(dream_text)
+            except (PipelineCancelled, DeadlineExceeded):
+                raise
+            except Exception as e:
+                return self._error_report(e)
+            report_path_metrics.record(source, time.monotonic() - started)
+            return {**report, "source": source}
+
+        rag_future = _submit(self._rag_report, dream_text)
+        plain_future = _submit(self._plain_report, dream_text) if mode == "race" else None
+        reason = "deadline"
+        try:
+            # 기한 안에 RAG 리포트가 오면 그대로 사용
+            report = rag_future.result(timeout=rag_deadline)
+            if plain_future is not None:
+                plain_future.cancel() # 아직 시작 전이면 취소, 이미 전송 중이면 결과를 버림
+            report_path_metrics.record("rag", time.monotonic() - started)
+            return {**report, "source": "rag"}
+        except (PipelineCancelled, DeadlineExceeded):
+            # 요청 자체가 취소되었거나 예산을 모두 썼으면 대체 경로도 실행하지 않음
+            raise
+        except Exception as e:
+            if rag_future.done():
+                reason = "error"
+                logger.warning("RAG 리포트 생성 실패, 일반 리포트로 대체합니다: %s", e)
+            else:
+                logger.warning("RAG 리포트가 %.1f초 안에 끝나지 않아 일반 리포트로 대체합니다.", rag_deadline)
+
+        if plain_future is None:
+            plain_future = _submit(self._plain_report, dream_text)
+        # 기한을 넘긴 RAG 경로는 계속 실행되므로, 두 경로 중 먼저 성공한 결과를 사용
+        pending = {rag_future, plain_future} if reason == "deadline" else {plain_future}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for slower in pending:
+                        slower.cancel()
+                    source = "rag" if future is rag_future else "plain"
+                    report_path_metrics.record(source, time.monotonic() - started, None if source == "rag" else reason)
+                    return {**future.result(), "source": source}
+                last_error = future.exception()
+        if isinstance(last_error, (PipelineCancelled, DeadlineExceeded)):
+            raise last_error
+        return self._error_report(last_error)
+
+    @staticmethod
+    def _error_report(error: Exception) -> dict:
+        logger.error("리포트 생성 실패: %s", error)
+        return {"emotions": [], "keywords": [], "analysis_summary": f"리포트 생성 중 오류가 발생했습니다: {error}", "source": "none"}
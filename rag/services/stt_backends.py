@@ -0,0 +1,198 @@
+import os
+import wave # WAV 파일 헤더에서 재생 길이를 읽기 위한 모듈
+import threading
+from io import BytesIO
+from typing import Optional
+
+from core import config
+from core.deadline import DeadlineExceeded, PipelineCancelled, current_request
+from core.resilience import call_with_resilience
+from core.structured_logging import get_logger
+from core.usage_store import audio_cost, usage_store
+
+logger = get_logger("services.stt")
+
+# WAV가 아닌 압축 포맷(mp3, m4a, ogg)의 길이를 추정할 때 사용하는 평균 비트레이트 (바이트/초, 약 128kbps)
+_COMPRESSED_BYTES_PER_SECOND = 16000
+
+
+def estimate_audio_duration(audio_file_buffer) -> Optional[float]:
+    """
+    오디오 버퍼의 재생 길이(초)를 추정합니다. 버퍼의 읽기 위치는 처음으로 되돌려 놓습니다.
+    :param audio_file_buffer: 파일 객체 또는 BytesIO (name 속성으로 형식 추론)
+    :return: 재생 길이(초), 추정할 수 없으면 None
+    """
+    name = getattr(audio_file_buffer, "name", "") or ""
+    try:
+        if str(name).lower().endswith(".wav"):
+            with wave.open(audio_file_buffer, "rb") as wav_file:
+                return wav_file.getnframes() / float(wav_file.getframerate())
+        # 압축 포맷은 전체 크기로 대략적인 길이를 계산
+        audio_file_buffer.seek(0, os.SEEK_END)
+        return audio_file_buffer.tell() / _COMPRESSED_BYTES_PER_SECOND
+    except Exception:
+        return None
+    finally:
+        try:
+            audio_file_buffer.seek(0)
+        except Exception:
+            pass
+
+
+class STTBackend:
+    """
+    음성 인식 엔진의 공통 인터페이스입니다.
+    STTService는 이 인터페이스만 알고 있으므로, 엔진을 교체해도
+    transcribe_audio / transcribe_from_bytes의 동작은 그대로 유지됩니다.
+    """
+    name = "base"
+
+    def transcribe(self, audio_file_buffer, language: str = "ko") -> str:
+        """
+        파일 버퍼를 받아 변환된 텍스트를 반환합니다.
+        :param audio_file_buffer: 파일 객체 또는 이름이 지정된 BytesIO
+        :param language: 음성 언어 코드
+        :return: 변환된 텍스트
+        """
+        raise NotImplementedError
+
+
+class WhisperAPIBackend(STTBackend):
+    """OpenAI Whisper API(whisper-1)를 호출하는 원격 엔진"""
+    name = "whisper-api"
+
+    def __init__(self, client):
+        """
+        :param client: OpenAI 클라이언트
+        """
+        self.client = client
+
+    def transcribe(self, audio_file_buffer, language: str = "ko") -> str:
+        audio_file_buffer.seek(0)
+        audio_bytes = audio_file_buffer.read()
+        file_name = os.path.basename(str(getattr(audio_file_buffer, "name", "") or "audio.wav"))
+
+        def request():
+            # 시도마다 새 버퍼로 전송 (재시도/헤징이 같은 파일 객체의 읽기 위치를 공유하지 않도록)
+            attempt_buffer = BytesIO(audio_bytes)
+            attempt_buffer.name = file_name # API가 파일 형식을 알 수 있도록 이름 지정
+            return self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=attempt_buffer,
+                language=language
+            )
+        # 공용 스케줄러에서 요청 예산을 확보한 뒤 호출
+        transcript = call_with_resilience("STTService.transcribe", "whisper-1", request, tokens=0)
+        seconds = estimate_audio_duration(audio_file_buffer) # Whisper API는 음성 길이(분) 단위로 과금
+        usage_store.record("stt", "whisper-1", requests=1, audio_seconds=seconds, cost_usd=audio_cost("whisper-1", seconds))
+        return transcript.text
+
+
+class LocalWhisperBackend(STTBackend):
+    """
+    CTranslate2로 양자화된 Whisper 모델(faster-whisper)을 CPU에서 실행하는 로컬 엔진입니다.
+    네트워크 왕복과 Whisper API 대기열 지연이 없습니다.
+    """
+    name = "local-ct2"
+
+    def __init__(self, model_path: str, compute_type: str = "int8", cpu_threads: int = 0):
+        """
+        :param model_path: CTranslate2 형식으로 변환된 모델 디렉토리
+        :param compute_type: 양자화 타입
+        :param cpu_threads: 사용할 CPU 스레드 수 (0이면 기본값)
+        """
+        self.model_path = model_path
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self._model = None
+        self._lock = threading.Lock() # 여러 세션이 동시에 모델을 로드하지 않도록 보호
+
+    def is_available(self) -> bool:
+        """모델 디렉토리가 존재하는지 확인합니다."""
+        return os.path.isdir(self.model_path)
+
+    def _load_model(self):
+        # 모델은 첫 요청 시 한 번만 로드하여 프로세스 전체에서 재사용
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from faster_whisper import WhisperModel # 선택 의존성이므로 사용할 때만 임포트
+                    self._model = WhisperModel(
+                        self.model_path,
+                        device="cpu",
+                        compute_type=self.compute_type,
+                        cpu_threads=self.cpu_threads,
+                    )
+        return self._model
+
+    def transcribe(self, audio_file_buffer, language: str = "ko") -> str:
+        request = current_request()
+        if request is not None:
+            request.check("LocalWhisperBackend.transcribe") # 취소되었거나 예산이 없으면 시작하지 않음
+        model = self._load_model()
+        segments, info = model.transcribe(audio_file_buffer, language=language, beam_size=1)
+        text = "".join(segment.text for segment in segments).strip()
+        usage_store.record("stt", self.name, requests=1, audio_seconds=info.duration) # 로컬 엔진은 API 비용 없음
+        return text
+
+
+class RoutingSTTBackend(STTBackend):
+    """
+    음성 길이에 따라 엔진을 선택하는 라우터입니다.
+    짧은 음성은 로컬 엔진으로, 긴 음성(또는 길이를 알 수 없는 음성)은 원격 엔진으로 보내며,
+    로컬 엔진이 실패하면 원격 엔진으로 다시 시도합니다.
+    """
+    name = "router"
+
+    def __init__(self, local_backend: STTBackend, remote_backend: STTBackend, max_local_seconds: float):
+        """
+        :param local_backend: 짧은 음성을 처리할 로컬 엔진
+        :param remote_backend: 긴 음성 및 실패 시 사용할 원격 엔진
+        :param max_local_seconds: 로컬 엔진으로 처리할 최대 음성 길이(초)
+        """
+        self.local_backend = local_backend
+        self.remote_backend = remote_backend
+        self.max_local_seconds = max_local_seconds
+
+    def choose_backend(self, audio_file_buffer) -> STTBackend:
+        """라우팅 규칙에 따라 사용할 엔진을 반환합니다."""
+        duration = estimate_audio_duration(audio_file_buffer)
+        if duration is not None and duration <= self.max_local_seconds:
+            return self.local_backend
+        return self.remote_backend
+
+    def transcribe(self, audio_file_buffer, language: str = "ko") -> str:
+        backend = self.choose_backend(audio_file_buffer)
+        if backend is self.remote_backend:
+            return backend.transcribe(audio_file_buffer, language)
+        try:
+            return backend.transcribe(audio_file_buffer, language)
+        except (PipelineCancelled, DeadlineExceeded):
+            raise # 취소되었거나 예산이 끝난 요청은 원격 엔진으로 다시 보내지 않음
+        except Exception as e:
+            logger.warning("로컬 엔진 실패, Whisper API로 재시도합니다: %s", e)
+            audio_file_buffer.seek(0)
+            return self.remote_backend.transcribe(audio_file_buffer, language)
+
+
+def build_stt_backend(client) -> STTBackend:
+    """
+    config의 STT_BACKEND 설정에 맞는 엔진을 생성합니다.
+    로컬 모델이 준비되지 않은 경우에는 항상 Whisper API를 사용합니다.
+    :param client: 원격 엔진에서 사용할 OpenAI 클라이언트
+    """
+    remote_backend = WhisperAPIBackend(client)
+    if config.STT_BACKEND == "remote":
+        return remote_backend
+
+    local_backend = LocalWhisperBackend(
+        config.STT_LOCAL_MODEL_PATH,
+        compute_type=config.STT_LOCAL_COMPUTE_TYPE,
+        cpu_threads=config.STT_LOCAL_CPU_THREADS,
+    )
+    if not local_backend.is_available():
+        logger.warning("로컬 STT 모델을 찾을 수 없어 Whisper API를 사용합니다: %s", config.STT_LOCAL_MODEL_PATH)
+        return remote_backend
+    if config.STT_BACKEND == "local":
+        return local_backend
+    return RoutingSTTBackend(local_backend, remote_backend, config.STT_LOCAL_MAX_SECONDS)
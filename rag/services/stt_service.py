@@ -1,32 +1,51 @@
+import hashlib
 import os
 from openai import OpenAI
 import openai # openai의 특정 오류를 처리하기 위해 임포트
 from io import BytesIO
+from core import config
+from core.rate_limiter import RateLimitWait, build_http_client
+from core.deadline import PipelineCancelled
+from core.resilience import CircuitOpenError
+from core.structured_logging import get_logger
+from services.stt_backends import STTBackend, build_stt_backend
+from core.shared_cache import file_digest, shared_cache
+from core.tracing import traced
+
+logger = get_logger("services.stt")
+
+# 예외 대신 반환하는 오류 안내 문자열의 시작 부분 (결과가 전사문인지 판정할 때 사용)
+STT_ERROR_PREFIXES = ("오류:", "오디오 파일을 찾을 수 없습니다", "음성 변환 중 알 수 없는 오류", "오디오 데이터 처리 중 오류")
+
+
+def is_transcript(text: str) -> bool:
+    """STT 결과가 오류 안내가 아닌 실제 전사문인지 확인합니다."""
+    return bool(text) and not text.startswith(STT_ERROR_PREFIXES)
+
 
 class STTService:
     """
     [최종 버전] 파일 경로 또는 메모리 상의 오디오 바이트를
     텍스트로 변환하는 STT(Speech-to-Text) 서비스를 제공합니다.
     """
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, backend: STTBackend = None):
         """
         STTService를 초기화합니다.
         :param api_key: OpenAI API 키
+        :param backend: (선택 사항) 사용할 STT 엔진, 없으면 config 설정에 따라 생성
         """
-        self.client = OpenAI(api_key=api_key)
+        self.client = OpenAI(api_key=api_key, http_client=build_http_client(), max_retries=0) # 재시도는 공용 resilience 계층에서 처리
+        self.backend = backend or build_stt_backend(self.client)
 
     def _transcribe(self, audio_file_buffer, language: str = "ko") -> str:
         """
-        (내부용) 파일 버퍼를 받아 Whisper API를 호출하는 공통 함수
+        (내부용) 파일 버퍼를 받아 설정된 STT 엔진을 호출하는 공통 함수
         """
-        # Whisper 모델을 사용하여 음성을 텍스트로 변환 요청
-        transcript = self.client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file_buffer,
-            language=language
-        )
-        return transcript.text
+        return self.backend.transcribe(audio_file_buffer, language)
 
+    # 같은 녹음은 파일 경로와 관계없이 내용 해시로 전사 결과를 재사용
+    @shared_cache.cached("transcript", key=lambda self, audio_path: (file_digest(audio_path), config.STT_BACKEND), accept=is_transcript)
+    @traced(accept=is_transcript)
     def transcribe_audio(self, audio_path: str) -> str:
         """
         주어진 오디오 파일 경로에서 음성을 텍스트로 변환합니다.
@@ -35,26 +54,37 @@ class STTService:
         """
         try:
             with open(audio_path, "rb") as audio_file:
-                print(f"DEBUG: STTService - '{audio_path}' 파일로 음성 변환을 시작합니다.")
+                logger.debug("파일 음성 변환 시작", extra={"audio_path": audio_path})
                 result = self._transcribe(audio_file)
-                print("DEBUG: STTService - 파일 음성 변환 성공.")
+                logger.debug("파일 음성 변환 성공", extra={"chars": len(result)})
                 return result
+        except PipelineCancelled:
+            raise # 취소는 오류 메시지로 바꾸지 않고 호출자에게 전달
         except FileNotFoundError:
-            print(f"ERROR: STTService - 오디오 파일을 찾을 수 없습니다. 경로: {audio_path}")
+            logger.error("오디오 파일을 찾을 수 없습니다.", extra={"audio_path": audio_path})
             return "오디오 파일을 찾을 수 없습니다."
         except openai.AuthenticationError as e:
-            print(f"ERROR: STTService - OpenAI API 인증 오류: {e}")
+            logger.error("OpenAI API 인증 오류: %s", e)
             return "오류: OpenAI API 키가 잘못되었거나 유효하지 않습니다."
+        except RateLimitWait as e:
+            logger.warning("요청 대기 시간 초과 예상: %s", e)
+            return f"오류: 음성 변환 요청이 많습니다. 약 {e.eta_seconds:.0f}초 후에 다시 시도해주세요."
+        except CircuitOpenError as e:
+            logger.error("회로 차단기 열림: %s", e)
+            return f"오류: {e}"
         except openai.RateLimitError as e:
-            print(f"ERROR: STTService - OpenAI API 사용량 한도 초과: {e}")
+            logger.error("OpenAI API 사용량 한도 초과: %s", e)
             return "오류: API 사용량 한도를 초과했습니다."
         except openai.APIConnectionError as e:
-            print(f"ERROR: STTService - OpenAI API 연결 실패: {e}")
+            logger.error("OpenAI API 연결 실패: %s", e)
             return "오류: OpenAI 서버에 연결할 수 없습니다."
         except Exception as e:
-            print(f"ERROR: STTService - 파일 음성 변환 중 알 수 없는 오류 발생: {e}")
+            logger.error("파일 음성 변환 중 알 수 없는 오류 발생: %s", e, exc_info=True)
             return f"음성 변환 중 알 수 없는 오류가 발생했습니다: {e}"
 
+    @shared_cache.cached("transcript", key=lambda self, audio_bytes, file_name="audio.wav": (hashlib.sha256(audio_bytes).hexdigest(), config.STT_BACKEND),
+                         accept=is_transcript)
+    @traced(accept=is_transcript)
     def transcribe_from_bytes(self, audio_bytes: bytes, file_name: str = "audio.wav") -> str:
         """
         메모리에 있는 오디오 바이트 데이터에서 음성을 텍스트로 변환합니다.
@@ -66,11 +96,16 @@ class STTService:
             audio_buffer = BytesIO(audio_bytes)
             audio_buffer.name = file_name # API가 파일 형식을 알 수 있도록 이름 지정
             
-            print(f"DEBUG: STTService - 바이트 데이터로 음성 변환을 시작합니다. 파일 이름: {file_name}")
+            logger.debug("바이트 데이터 음성 변환 시작", extra={"file_name": file_name, "bytes": len(audio_bytes)})
             result = self._transcribe(audio_buffer)
-            print("DEBUG: STTService - 바이트 데이터 음성 변환 성공.")
+            logger.debug("바이트 데이터 음성 변환 성공", extra={"chars": len(result)})
             return result
+        except PipelineCancelled:
+            raise # 취소는 오류 메시지로 바꾸지 않고 호출자에게 전달
+        except RateLimitWait as e:
+            logger.warning("요청 대기 시간 초과 예상: %s", e)
+            return f"오류: 음성 변환 요청이 많습니다. 약 {e.eta_seconds:.0f}초 후에 다시 시도해주세요."
         except Exception as e:
-            print(f"ERROR: STTService - 바이트 데이터 음성 변환 중 알 수 없는 오류 발생: {e}")
+            logger.error("바이트 데이터 음성 변환 중 알 수 없는 오류 발생: %s", e, exc_info=True)
             # 이 오류는 더 상세하게 나눌 수 있지만, transcribe_audio에서 대부분 처리됩니다.
             return f"오디오 데이터 처리 중 오류가 발생했습니다: {e}"
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+core.single_flight.SingleFlight.do 동작 테스트 (rag 폴더에서 python -m pytest -q)
+공유 저장소는 임시 경로의 SQLiteBackend를 사용하고, 같은 파일을 쓰는 SingleFlight 두 개로 레플리카 두 개를 흉내 냅니다.
+"""
+import threading
+import time
+
+import pytest
+
+from core.deadline import DeadlineExceeded, PipelineCancelled, RequestContext, activate
+from core.shared_cache import SQLiteBackend
+from core.single_flight import SingleFlight
+
+KEY = "report:abc123"
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "조건을 기다리다 시간 초과"
+        time.sleep(0.01)
+
+
+def run_in_threads(targets):
+    """각 함수를 스레드에서 실행하고, 스레드별 (결과 또는 예외)를 담을 리스트와 스레드 목록을 반환"""
+    outcomes = [None] * len(targets)
+
+    def run(index, target):
+        try:
+            outcomes[index] = ("result", target())
+        except BaseException as e:
+            outcomes[index] = ("error", e)
+    threads = [threading.Thread(target=run, args=(index, target), daemon=True) for index, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    return outcomes, threads
+
+
+def join_all(threads):
+    for thread in threads:
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+
+
+def test_followers_share_one_result(backend):
+    flights = SingleFlight(backend, lock_seconds=5, result_seconds=5)
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {"keywords": ["숲"]}
+
+    outcomes, threads = run_in_threads([lambda: flights.do(KEY, fn)] * 4)
+    # 첫 호출이 실행을 시작하고 나머지 세 호출이 모두 기다리기 시작한 뒤에 결과를 냄
+    wait_until(lambda: flights.snapshot().get("report", {}).get("local_followers") == 3)
+    release.set()
+    join_all(threads)
+
+    assert len(calls) == 1
+    assert outcomes == [("result", {"keywords": ["숲"]})] * 4
+    assert flights.snapshot()["report"] == {"leaders": 1, "local_followers": 3, "remote_followers": 0}
+    assert not backend.lock_held(KEY) # 실행이 끝나면 공유 잠금을 풀어 둠
+
+
+def test_followers_retry_after_cancelled_leader(backend):
+    flights = SingleFlight(backend, lock_seconds=5, result_seconds=5)
+    leader_started, cancel_leader, release_retry = threading.Event(), threading.Event(), threading.Event()
+    retry_calls = []
+
+    def cancelled_leader():
+        leader_started.set()
+        cancel_leader.wait(5)
+        raise PipelineCancelled("report", "새 오디오 입력") # 앞선 호출 자신의 요청만 취소됨
+
+    def follower():
+        retry_calls.append(1)
+        release_retry.wait(5)
+        return "fresh"
+
+    leader_outcome, leader_thread = run_in_threads([lambda: flights.do(KEY, cancelled_leader)])
+    leader_started.wait(5)
+    outcomes, threads = run_in_threads([lambda: flights.do(KEY, follower)] * 2)
+    wait_until(lambda: flights.snapshot()["report"]["local_followers"] == 2)
+    cancel_leader.set()
+    # 두 호출 중 하나가 새로 실행하고 다른 하나는 그 실행을 기다림
+    wait_until(lambda: flights.snapshot()["report"] == {"leaders": 2, "local_followers": 3, "remote_followers": 0})
+    release_retry.set()
+    join_all(leader_thread + threads)
+
+    assert leader_outcome[0][0] == "error" and isinstance(leader_outcome[0][1], PipelineCancelled)
+    assert outcomes == [("result", "fresh")] * 2
+    assert len(retry_calls) == 1
+
+
+def test_waits_for_published_result_instead_of_running(backend):
+    replica_a = SingleFlight(backend, lock_seconds=5, result_seconds=5)
+    replica_b = SingleFlight(backend, lock_seconds=5, result_seconds=5)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        release.wait(5)
+        return "from-a"
+
+    outcomes, threads = run_in_threads([lambda: replica_a.do(KEY, slow)])
+    wait_until(lambda: backend.lock_held(KEY))
+    other, other_threads = run_in_threads([lambda: replica_b.do(KEY, lambda: calls.append(1) or "from-b")])
+    time.sleep(0.3) # 다른 레플리카는 잠금이 잡혀 있는 동안 실행하지 않고 기다림
+    assert calls == []
+    release.set()
+    join_all(threads + other_threads)
+
+    assert outcomes == [("result", "from-a")]
+    assert other == [("result", "from-a")]
+    assert calls == []
+    assert replica_b.snapshot()["report"] == {"leaders": 0, "local_followers": 0, "remote_followers": 1}
+
+
+def test_never_runs_without_lock_when_budget_runs_out(backend):
+    assert backend.acquire_lock(KEY, "other-replica", 30) # 결과를 게시하지 않는 다른 레플리카가 잠금을 잡고 있음
+    flights = SingleFlight(backend, lock_seconds=0.3, result_seconds=5)
+    calls = []
+
+    with activate(RequestContext(0.8)):
+        with pytest.raises(DeadlineExceeded):
+            flights.do(KEY, lambda: calls.append(1))
+
+    assert calls == []
+
+
+def test_runs_only_after_acquiring_expired_lock(backend):
+    assert backend.acquire_lock(KEY, "crashed-replica", 0.5) # 실행 중 죽은 레플리카의 잠금 (잠시 뒤 만료)
+    flights = SingleFlight(backend, lock_seconds=0.2, result_seconds=5)
+    owners = []
+
+    def fn():
+        # 실행 중에는 이 프로세스가 잠금을 잡고 있어야 함
+        owners.extend(row[0] for row in backend._conn().execute("SELECT owner FROM cache_locks WHERE key = ?", (KEY,)))
+        return "ok"
+
+    assert flights.do(KEY, fn) == "ok"
+    assert owners == [flights.owner]
+    assert not backend.lock_held(KEY)